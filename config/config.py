@@ -21,6 +21,10 @@ class Settings:
     XIAOE_APP_ID: str = os.getenv('XIAOE_APP_ID')
     XIAOE_CLIENT_ID: str = os.getenv('XIAOE_CLIENT_ID')
     XIAOE_SECRET_KEY: str = os.getenv('XIAOE_SECRET_KEY')
+    # 多店铺 (租户)
+    XIAOE_TENANT: str = os.getenv('XIAOE_TENANT', 'default') # 单店铺时的租户名, 用于区分同步水位和订单归属
+    XIAOE_TENANTS_FILE: str = os.getenv('XIAOE_TENANTS_FILE', '') # 多店铺凭证列表 (JSON), 为空时使用上面的单组凭证
+    XIAOE_TENANT_CONCURRENCY: int = int(os.getenv('XIAOE_TENANT_CONCURRENCY', 4)) # 同时同步的店铺数 (每个店铺一个进程)
 
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO').upper()
     # 添加日志文件路径配置
@@ -31,9 +35,63 @@ class Settings:
 
     ORDERS_SYNC_INTERVAL_MINUTES: int = int(os.getenv('ORDERS_SYNC_INTERVAL_MINUTES', 30))
     STATUS_UPDATE_INTERVAL_HOURS: int = int(os.getenv('STATUS_UPDATE_INTERVAL_HOURS', 1))
+    SYNC_LOCK_TTL_SECONDS: int = int(os.getenv('SYNC_LOCK_TTL_SECONDS', 300)) # 同步任务租约锁的有效期, 持有者每 1/3 有效期续租一次
+    SCHEDULER_MISFIRE_GRACE_SECONDS: int = int(os.getenv('SCHEDULER_MISFIRE_GRACE_SECONDS', 600)) # daemon 模式下任务延迟超过该秒数未开始则跳过本次
     STATUS_UPDATE_DAYS: int = int(os.getenv('STATUS_UPDATE_DAYS', 15))
+    STATUS_UPDATE_MODE: str = os.getenv('STATUS_UPDATE_MODE', 'rescan').lower() # rescan: 重扫近 N 天订单; changes: 只拉取上次水位后变化的订单; pending: 只刷新库中非终态订单
+    XIAOE_FINAL_ORDER_STATES: str = os.getenv('XIAOE_FINAL_ORDER_STATES', '3,6,7,10') # 不会再变化的订单状态码, 逗号分隔 (pending 模式跳过)
+    STATUS_REFRESH_MAX_GAP_MINUTES: int = int(os.getenv('STATUS_REFRESH_MAX_GAP_MINUTES', 60)) # pending 模式聚合刷新窗口时允许的最大订单间隔
+    STATUS_CHANGE_OVERLAP_MINUTES: int = int(os.getenv('STATUS_CHANGE_OVERLAP_MINUTES', 5)) # changes 模式下水位回退的分钟数, 容忍时钟偏差和延迟写入
+    XIAOE_ORDER_UPDATE_TIME_PARAMS: str = os.getenv('XIAOE_ORDER_UPDATE_TIME_PARAMS', '') # 订单列表按更新时间过滤的参数名, 如 "update_start_time,update_end_time"
+    XIAOE_AFTER_SALES_FEED: bool = os.getenv('XIAOE_AFTER_SALES_FEED', 'true').lower() in ('1', 'true', 'yes') # changes 模式下是否读取售后单列表
+    XIAOE_AFTER_SALES_UPDATE_TIME_PARAMS: str = os.getenv('XIAOE_AFTER_SALES_UPDATE_TIME_PARAMS', '') # 售后单列表按更新时间过滤的参数名, 如 "update_start_time,update_end_time"
+    XIAOE_AFTER_SALES_LOOKBACK_HOURS: int = int(os.getenv('XIAOE_AFTER_SALES_LOOKBACK_HOURS', 72)) # 售后单列表只能按创建时间过滤时, 查询起点向前多看的小时数
+    # 用户维度同步
+    USER_SYNC_LOOKBACK_DAYS: int = int(os.getenv('USER_SYNC_LOOKBACK_DAYS', 7)) # 从最近多少天写入的订单中收集用户
+    USER_STALE_DAYS: int = int(os.getenv('USER_STALE_DAYS', 30)) # 用户资料超过多少天未更新视为过期
+    USER_SYNC_BATCH_SIZE: int = int(os.getenv('USER_SYNC_BATCH_SIZE', 200)) # 每批并发获取并写入的用户数
+    # 订单同步流水线 (抓取 -> 转换 -> 写库)
+    SYNC_LOAD_BATCH_SIZE: int = int(os.getenv('SYNC_LOAD_BATCH_SIZE', 500)) # 每批写库的订单数
+    SYNC_PIPELINE_QUEUE_SIZE: int = int(os.getenv('SYNC_PIPELINE_QUEUE_SIZE', 4)) # 阶段之间队列的容量 (页/批)
+    SYNC_CHECKPOINT_WINDOW_HOURS: float = float(os.getenv('SYNC_CHECKPOINT_WINDOW_HOURS', 6)) # 增量同步按多少小时切分子窗口推进水位
+    # 指标导出 (Prometheus 文本格式)
+    METRICS_FILE: str = os.getenv('METRICS_FILE', '') # 每次运行结束 (daemon 模式每个任务结束) 后写入的指标文件, 为空不写
+    METRICS_HTTP_PORT: int = int(os.getenv('METRICS_HTTP_PORT', 0)) # 本地 HTTP /metrics 端口, 0 表示不启动
+    METRICS_HTTP_HOST: str = os.getenv('METRICS_HTTP_HOST', '127.0.0.1') # HTTP /metrics 监听地址
     API_RETRY_TIMES: int = int(os.getenv('API_RETRY_TIMES', 3))
     API_RETRY_DELAY_SECONDS: int = int(os.getenv('API_RETRY_DELAY_SECONDS', 5))
+    API_RETRY_MAX_DELAY_SECONDS: float = float(os.getenv('API_RETRY_MAX_DELAY_SECONDS', 60)) # 单次重试等待上限 (带随机抖动)
+    API_RETRY_BUDGET_RATIO: float = float(os.getenv('API_RETRY_BUDGET_RATIO', 0.2)) # 重试请求最多占首次请求的比例
+    API_RETRY_BUDGET_MIN_PER_SECOND: float = float(os.getenv('API_RETRY_BUDGET_MIN_PER_SECOND', 1)) # 低流量时每秒保底可重试次数
+    API_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv('API_CIRCUIT_FAILURE_THRESHOLD', 5)) # 连续失败多少次后熔断
+    API_CIRCUIT_RESET_SECONDS: float = float(os.getenv('API_CIRCUIT_RESET_SECONDS', 30)) # 熔断后多少秒放行试探请求
+    XIAOE_HTTP_POOL_SIZE: int = int(os.getenv('XIAOE_HTTP_POOL_SIZE', 10)) # HTTP 连接池大小
+    XIAOE_FETCH_CONCURRENCY: int = int(os.getenv('XIAOE_FETCH_CONCURRENCY', 5)) # 并发拉取时同时在途的请求数
+    # 订单列表每页数量 (自动调整时为初始值)
+    XIAOE_PAGE_SIZE: int = int(os.getenv('XIAOE_PAGE_SIZE', 50))
+    XIAOE_PAGE_SIZE_AUTOTUNE: bool = os.getenv('XIAOE_PAGE_SIZE_AUTOTUNE', 'false').lower() in ('1', 'true', 'yes') # 按实测延迟自动选择每页数量
+    XIAOE_PAGE_SIZE_MAX: int = int(os.getenv('XIAOE_PAGE_SIZE_MAX', 0)) # 每页数量上限, 0 表示运行时探测接口
+    XIAOE_PAGE_TARGET_SECONDS: float = float(os.getenv('XIAOE_PAGE_TARGET_SECONDS', 2)) # 自动调整的目标单页响应时间 (秒)
+    XIAOE_PAGE_MAX_BYTES: int = int(os.getenv('XIAOE_PAGE_MAX_BYTES', 4 * 1024 * 1024)) # 自动调整时单页响应体上限 (字节)
+    XIAOE_WINDOW_CHUNK_DAYS: float = float(os.getenv('XIAOE_WINDOW_CHUNK_DAYS', 6)) # sharded 模式初始切分的时间窗口长度 (天)
+    XIAOE_WINDOW_TARGET_PAGES: int = int(os.getenv('XIAOE_WINDOW_TARGET_PAGES', 20)) # 单个时间窗口超过该页数时对半拆分
+    XIAOE_TYPED_DECODE: bool = os.getenv('XIAOE_TYPED_DECODE', 'false').lower() in ('1', 'true', 'yes') # 订单列表使用 msgspec 类型化解码
+    # 商品缓存 (商品目录同步 / 订单明细补全)
+    PRODUCT_CACHE_FILE: str = os.getenv('PRODUCT_CACHE_FILE', os.path.join(BASE_DIR, 'cache', 'xiaoe_products.json'))
+    PRODUCT_CACHE_TTL_HOURS: float = float(os.getenv('PRODUCT_CACHE_TTL_HOURS', 24)) # 超过该时间的缓存条目视为过期
+    # access_token 跨进程缓存
+    XIAOE_TOKEN_CACHE_DIR: str = os.getenv('XIAOE_TOKEN_CACHE_DIR', os.path.join(BASE_DIR, 'cache')) # token 缓存文件目录
+    XIAOE_TOKEN_REFRESH_AHEAD_SECONDS: int = int(os.getenv('XIAOE_TOKEN_REFRESH_AHEAD_SECONDS', 600)) # 提前多少秒在后台刷新
+    XIAOE_TOKEN_BACKGROUND_REFRESH: bool = os.getenv('XIAOE_TOKEN_BACKGROUND_REFRESH', 'true').lower() in ('1', 'true', 'yes')
+    # API 限流 (自适应令牌桶，按端点独立计数，进程内共享)
+    XIAOE_RATE_LIMIT_PER_SECOND: float = float(os.getenv('XIAOE_RATE_LIMIT_PER_SECOND', 5)) # 默认初始速率 (次/秒)
+    XIAOE_RATE_LIMIT_MAX_PER_SECOND: float = float(os.getenv('XIAOE_RATE_LIMIT_MAX_PER_SECOND', 20)) # 自适应加速的上限
+    XIAOE_RATE_LIMITS: str = os.getenv('XIAOE_RATE_LIMITS', '') # 按端点覆盖初始速率, 如 "orders=10,users=20"
+    XIAOE_THROTTLE_CODES: str = os.getenv('XIAOE_THROTTLE_CODES', '') # 表示限流的业务错误码, 逗号分隔
+    # API 流量录制/回放 (离线基准测试)
+    XIAOE_CASSETTE_MODE: str = os.getenv('XIAOE_CASSETTE_MODE', '').lower() # 'record' / 'replay'，空为关闭
+    XIAOE_CASSETTE_FILE: str = os.getenv('XIAOE_CASSETTE_FILE') or os.path.join(BASE_DIR, 'cache', 'cassettes', 'xiaoe.jsonl.gz')
+    XIAOE_CASSETTE_LATENCY_SCALE: float = float(os.getenv('XIAOE_CASSETTE_LATENCY_SCALE', 1.0)) # 回放延迟 = 录制耗时 x 系数, 0 为不等待
 
     # 可以在这里添加其他需要的配置项转换或校验
 
@@ -1,12 +1,21 @@
 # core/loaders.py
+import time
 from typing import List, Dict, Any, Type
 from sqlalchemy.dialects.mysql import insert as mysql_insert # MySQL specific insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 
 from core.db import get_db, Base # 导入数据库会话获取函数和 Base
+from utils import metrics
 from utils.logger import logger
 
+UPSERT_SECONDS = metrics.histogram('db_upsert_batch_duration_seconds', 'Time to execute and commit one UPSERT batch.', ('table',))
+UPSERT_RECORDS = metrics.counter('db_upsert_records_total', 'Records submitted in UPSERT batches.', ('table',))
+UPSERT_AFFECTED_ROWS = metrics.counter('db_upsert_affected_rows_total',
+                                       'Rows reported affected by UPSERT (MySQL: 1 per insert, 2 per changed row, 0 if unchanged).',
+                                       ('table',))
+UPSERT_ERRORS = metrics.counter('db_upsert_errors_total', 'UPSERT batches that failed and were rolled back.', ('table',))
+
 # 定义一个类型别名，表示数据项可以是字典或模型实例
 DataItem = Dict[str, Any] | Base
 
@@ -79,7 +88,8 @@ def upsert_data(db: Session, model_class: Type[Base], data_list: List[DataItem])
             upsert_stmt = stmt.on_duplicate_key_update(**update_columns)
 
 
-        # 3. 执行语句
+        # 3. 执行语句 (计时包含提交)
+        started = time.perf_counter()
         result = db.execute(upsert_stmt)
 
         # 4. 处理结果 (MySQL 的 rowcount 行为比较特殊)
@@ -89,14 +99,19 @@ def upsert_data(db: Session, model_class: Type[Base], data_list: List[DataItem])
 
         # 5. 提交事务
         db.commit()
+        UPSERT_SECONDS.observe(time.perf_counter() - started, table=model_class.__tablename__)
+        UPSERT_RECORDS.inc(valid_count, table=model_class.__tablename__)
+        UPSERT_AFFECTED_ROWS.inc(max(affected_rows, 0), table=model_class.__tablename__)
         logger.info(f"Successfully upserted data into {model_class.__tablename__}. Processed {valid_count} items. Transaction committed.")
 
     except SQLAlchemyError as e:
+        UPSERT_ERRORS.inc(table=model_class.__tablename__)
         logger.error(f"Database error during upsert into {model_class.__tablename__}: {e}", exc_info=True)
         db.rollback() # 发生错误时回滚事务
         logger.warning(f"Transaction rolled back for {model_class.__tablename__}.")
         raise # 重新抛出异常，让上层处理
     except Exception as e:
+        UPSERT_ERRORS.inc(table=model_class.__tablename__)
         logger.error(f"Unexpected error during upsert into {model_class.__tablename__}: {e}", exc_info=True)
         db.rollback()
         logger.warning(f"Transaction rolled back for {model_class.__tablename__}.")
@@ -0,0 +1,112 @@
+# core/locks.py
+"""
+基于数据库租约行 (sync_locks 表) 的分布式锁。
+
+同一 (tenant, platform, data_type) 同一时间只有一个持有者，不同主机、不同进程之间互斥。
+持有期间后台线程每隔 ttl/3 续租一次；持有者进程异常退出后不再续租，
+租约在 SYNC_LOCK_TTL_SECONDS 秒后过期，其他进程即可获取。
+过期时间按应用服务器的 UTC 时间计算，各主机的时钟需要同步 (NTP)。
+"""
+
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from config.config import settings
+from core.db import SessionLocal
+from core.models import SyncLock
+from utils.logger import logger
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None) # 数据库中统一存储 naive UTC 时间
+
+class SyncLease:
+    """
+    (tenant, platform, data_type) 的租约锁，tenant 默认为当前租户 (settings.XIAOE_TENANT)。
+
+    每次数据库操作使用独立的短会话，不占用调用方的 session，可在任意线程中使用。
+    """
+
+    def __init__(self, platform: str, data_type: str, ttl_seconds: Optional[float] = None, tenant: Optional[str] = None):
+        self.tenant = tenant or settings.XIAOE_TENANT
+        self.platform = platform
+        self.data_type = data_type
+        self.ttl = timedelta(seconds=ttl_seconds or settings.SYNC_LOCK_TTL_SECONDS)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def _claim(self, db) -> int:
+        """租约已过期或本来就由自己持有时改为自己持有，返回更新的行数。"""
+        now = _utcnow()
+        return db.query(SyncLock).filter(
+            SyncLock.tenant == self.tenant, SyncLock.platform == self.platform, SyncLock.data_type == self.data_type,
+            or_(SyncLock.expires_at < now, SyncLock.holder == self.holder),
+        ).update({'holder': self.holder, 'acquired_at': now, 'expires_at': now + self.ttl}, synchronize_session=False)
+
+    def acquire(self) -> bool:
+        """尝试获取锁 (不等待)，成功时启动续租线程并返回 True；锁被其他持有者占用时返回 False。"""
+        db = SessionLocal()
+        try:
+            if self._claim(db):
+                db.commit()
+            else:
+                # 还没有锁行：插入；并发插入时主键冲突的一方失败
+                now = _utcnow()
+                db.add(SyncLock(tenant=self.tenant, platform=self.platform, data_type=self.data_type, holder=self.holder,
+                                acquired_at=now, expires_at=now + self.ttl))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    current = db.query(SyncLock).filter_by(tenant=self.tenant, platform=self.platform, data_type=self.data_type).first()
+                    if current is not None:
+                        logger.info(f"Lock {self.tenant}/{self.platform}/{self.data_type} is held by {current.holder} until {current.expires_at} UTC.")
+                    return False
+        finally:
+            db.close()
+        logger.info(f"Acquired lock {self.tenant}/{self.platform}/{self.data_type} as {self.holder}.")
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._renew_loop, name=f"lock-{self.tenant}-{self.data_type}", daemon=True)
+        self._heartbeat.start()
+        return True
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl.total_seconds() / 3):
+            db = SessionLocal()
+            try:
+                renewed = self._claim(db)
+                db.commit()
+                if not renewed:
+                    logger.error(f"Lost lock {self.tenant}/{self.platform}/{self.data_type}: the lease expired and was taken over by another holder.")
+                    return
+            except Exception as e:
+                # 续租失败时继续重试；连续失败超过 ttl 后租约会过期
+                db.rollback()
+                logger.error(f"Failed to renew lock {self.tenant}/{self.platform}/{self.data_type}: {e}")
+            finally:
+                db.close()
+
+    def release(self):
+        """停止续租并删除自己持有的锁行。"""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        db = SessionLocal()
+        try:
+            db.query(SyncLock).filter_by(tenant=self.tenant, platform=self.platform, data_type=self.data_type,
+                                         holder=self.holder).delete(synchronize_session=False)
+            db.commit()
+            logger.info(f"Released lock {self.tenant}/{self.platform}/{self.data_type}.")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to release lock {self.tenant}/{self.platform}/{self.data_type} (it will expire in {self.ttl}): {e}")
+        finally:
+            db.close()
@@ -22,6 +22,7 @@ class Order(Base):
     # 主键定义在 __table_args__ 中，因为是复合主键
     order_id = Column(String(64), nullable=False, comment='平台订单ID')
     platform = Column(String(32), nullable=False, default='xiaoe', comment='来源平台')
+    tenant = Column(String(64), nullable=False, default='default', server_default='default', comment='店铺 (租户) 名称')
 
     user_id = Column(String(64), nullable=False, comment='平台用户ID')
     price = Column(DECIMAL(10, 2), default=0.00, comment='实付金额 (元)')
@@ -44,6 +45,7 @@ class Order(Base):
     __table_args__ = (
         PrimaryKeyConstraint('platform', 'order_id'),
         Index('idx_user_id', 'platform', 'user_id'),
+        Index('idx_tenant_created_at', 'tenant', 'created_at'),
         Index('idx_created_at', 'created_at'),
         Index('idx_pay_time', 'pay_time'),
         Index('idx_updated_at', 'updated_at'),
@@ -132,6 +134,7 @@ class SyncStatus(Base):
     __tablename__ = "sync_status"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant = Column(String(64), nullable=False, default='default', server_default='default', comment='店铺 (租户) 名称')
     platform = Column(String(32), nullable=False, default='xiaoe', comment='来源平台')
     data_type = Column(String(32), nullable=False, comment='数据类型 (e.g., order, user, product)')
     sync_mode = Column(String(16), nullable=False, comment='同步模式 (e.g., incremental, full, status_update)')
@@ -142,12 +145,90 @@ class SyncStatus(Base):
     message = Column(Text, comment='状态信息或错误消息')
 
     __table_args__ = (
-        UniqueConstraint('platform', 'data_type', 'sync_mode', name='uk_platform_datatype_mode'),
+        UniqueConstraint('tenant', 'platform', 'data_type', 'sync_mode', name='uk_tenant_platform_datatype_mode'),
         {'comment': '数据同步状态跟踪表'}
     )
 
     def __repr__(self):
-        return f"<SyncStatus(platform='{self.platform}', data_type='{self.data_type}', mode='{self.sync_mode}')>"
+        return f"<SyncStatus(tenant='{self.tenant}', platform='{self.platform}', data_type='{self.data_type}', mode='{self.sync_mode}')>"
+
+class SyncLock(Base):
+    """同步任务的租约锁：每个 (tenant, platform, data_type) 一行，过期时间之前由 holder 独占。"""
+    __tablename__ = "sync_locks"
+
+    tenant = Column(String(64), nullable=False, default='default', server_default='default', comment='店铺 (租户) 名称')
+    platform = Column(String(32), nullable=False, default='xiaoe', comment='来源平台')
+    data_type = Column(String(32), nullable=False, comment='数据类型 (e.g., order, order_backfill, user, product)')
+    holder = Column(String(128), nullable=False, comment='持有者 (主机名:进程号:随机串)')
+    acquired_at = Column(DateTime, nullable=False, comment='获取时间 (UTC)')
+    expires_at = Column(DateTime, nullable=False, comment='租约过期时间 (UTC)，持有者定期续租')
+
+    __table_args__ = (
+        PrimaryKeyConstraint('tenant', 'platform', 'data_type'),
+        {'comment': '同步任务租约锁表'}
+    )
+
+    def __repr__(self):
+        return f"<SyncLock(tenant='{self.tenant}', platform='{self.platform}', data_type='{self.data_type}', holder='{self.holder}')>"
+
+class SyncCheckpoint(Base):
+    """进行中的同步任务的断点：当前子窗口及其中已写库的订单条数，任务成功后删除。"""
+    __tablename__ = "sync_checkpoints"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant = Column(String(64), nullable=False, default='default', server_default='default', comment='店铺 (租户) 名称')
+    platform = Column(String(32), nullable=False, default='xiaoe', comment='来源平台')
+    data_type = Column(String(32), nullable=False, comment='数据类型 (e.g., order)')
+    sync_mode = Column(String(16), nullable=False, comment='同步模式 (e.g., incremental)')
+    window_start = Column(DateTime, nullable=False, comment='当前子窗口开始时间 (UTC, 包含)')
+    window_end = Column(DateTime, nullable=False, comment='当前子窗口结束时间 (UTC, 包含)')
+    loaded_offset = Column(Integer, nullable=False, default=0, comment='子窗口内已写库的订单条数 (按页码顺序)')
+    loaded_through = Column(DateTime, comment='回填: 从 window_start 起已连续写完到的时间 (UTC)；其他模式为空')
+    updated_at = Column(DateTime, nullable=False,
+                        server_default=func.now(), onupdate=func.now(),
+                        comment='记录更新时间')
+
+    __table_args__ = (
+        UniqueConstraint('tenant', 'platform', 'data_type', 'sync_mode', name='uk_checkpoint_tenant_platform_datatype_mode'),
+        {'comment': '同步断点表'}
+    )
+
+    def __repr__(self):
+        return f"<SyncCheckpoint(tenant='{self.tenant}', platform='{self.platform}', data_type='{self.data_type}', mode='{self.sync_mode}', offset={self.loaded_offset})>"
+
+class SyncRun(Base):
+    """同步任务运行历史：每次运行一行，记录耗时、吞吐量、接口延迟和数据新鲜度 (sync_status 只保留最近一次)。"""
+    __tablename__ = "sync_runs"
+
+    id = Column(BIGINT, primary_key=True, autoincrement=True)
+    tenant = Column(String(64), nullable=False, default='default', server_default='default', comment='店铺 (租户) 名称')
+    platform = Column(String(32), nullable=False, default='xiaoe', comment='来源平台')
+    data_type = Column(String(32), nullable=False, comment='数据类型 (e.g., order, user, product)')
+    sync_mode = Column(String(16), nullable=False, comment='同步模式 (e.g., incremental, status_update, combined, backfill)')
+    status = Column(String(16), nullable=False, comment='运行结果 (success, failed)')
+    message = Column(Text, comment='状态信息或错误消息')
+    started_at = Column(DateTime, nullable=False, comment='开始时间 (UTC)')
+    finished_at = Column(DateTime, nullable=False, comment='结束时间 (UTC)')
+    duration_seconds = Column(DECIMAL(10, 3), nullable=False, comment='耗时 (秒)')
+    api_requests = Column(Integer, nullable=False, default=0, comment='成功的 API 请求数')
+    pages_fetched = Column(Integer, nullable=False, default=0, comment='拉取的列表页数')
+    orders_fetched = Column(Integer, nullable=False, default=0, comment='拉取的订单数 (含转换时丢弃的)')
+    items_fetched = Column(Integer, nullable=False, default=0, comment='拉取的订单明细数')
+    rows_upserted = Column(Integer, nullable=False, default=0, comment='提交 UPSERT 的行数 (所有表)')
+    rows_per_second = Column(DECIMAL(12, 2), comment='rows_upserted / 耗时')
+    api_p50_ms = Column(DECIMAL(10, 1), comment='API 延迟中位数估算 (毫秒)')
+    api_p99_ms = Column(DECIMAL(10, 1), comment='API 延迟 P99 估算 (毫秒)')
+    newest_created_at = Column(DateTime, comment='运行结束时库中该租户最新订单的创建时间 (UTC)')
+    freshness_lag_seconds = Column(Integer, comment='结束时间与 newest_created_at 之差 (秒)')
+
+    __table_args__ = (
+        Index('idx_sync_runs_job_started', 'tenant', 'platform', 'data_type', 'sync_mode', 'started_at'),
+        Index('idx_sync_runs_started', 'started_at'),
+        {'comment': '同步任务运行历史表'}
+    )
+
+    def __repr__(self):
+        return f"<SyncRun(tenant='{self.tenant}', data_type='{self.data_type}', mode='{self.sync_mode}', started_at='{self.started_at}', status='{self.status}')>"
 
 # 可选：创建所有定义的表 (通常在应用启动或单独的脚本中执行)
 # from core.db import engine
@@ -0,0 +1,145 @@
+# core/pipeline.py
+"""
+抓取 -> 转换 -> 写库 三段流水线。
+
+抓取和转换各在一个后台线程中运行，写库在调用方线程中执行 (可直接使用调用方的数据库 session)。
+阶段之间通过有界队列连接：下游处理不过来时上游阻塞在 put 上 (背压)，
+因此内存中最多保留 queue_size 个页面和 queue_size 个待写批次，与同步的时间范围长短无关；
+写库与后续页面的 API 请求同时进行。
+
+每个阶段的耗时记录在 sync_pipeline_stage_seconds 中 (抓取、转换按单元，写库按批次)；
+sync_pipeline_blocked_seconds_total 记录上游因下游队列已满而等待的时间，持续增长说明瓶颈在下游阶段。
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from config.config import settings
+from utils import metrics
+from utils.logger import logger
+
+Batch = Dict[str, List[Dict[str, Any]]] # 表名 -> 待写入的行
+
+_DONE = object() # 阶段结束标记
+
+STAGE_SECONDS = metrics.histogram('sync_pipeline_stage_seconds',
+                                  'Time spent per unit in the fetch and transform stages and per batch in the load stage.', ('stage',))
+BLOCKED_SECONDS = metrics.counter('sync_pipeline_blocked_seconds_total',
+                                  'Time a stage waited because the downstream queue was full.', ('stage',))
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event, stage: Optional[str] = None) -> bool:
+    """放入队列，队列满时等待；流水线已停止时放弃并返回 False。给出 stage 时把等待时间计入该阶段的阻塞时间。"""
+    started = time.perf_counter()
+    try:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    finally:
+        if stage is not None:
+            BLOCKED_SECONDS.inc(time.perf_counter() - started, stage=stage)
+
+def _get(q: queue.Queue, stop: threading.Event) -> Any:
+    """从队列取出一项；流水线已停止时返回 _DONE。"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+def run_pipeline(source: Iterable[Any], transform: Callable[[Any], Batch], load: Callable[[Batch], None],
+                 batch_size: Optional[int] = None, queue_size: Optional[int] = None) -> int:
+    """
+    运行流水线直到 source 耗尽，返回写入的批次数。任一阶段出错时停止其余阶段，并在调用方线程重新抛出该异常。
+
+    Args:
+        source: 产出待处理单元 (如一页订单) 的可迭代对象，在抓取线程中迭代。
+                单元放入队列后 source 会继续迭代，因此单元必须是独立的数据 (如列表)，
+                不能是依赖 source 后续状态的惰性迭代器 (如流式解析的一页，应先物化)。
+        transform: 把一个单元转换为 {表名: 行列表}，在转换线程中调用。
+        load: 写入一个批次，在调用方线程中调用。批次中各表的行按 transform 返回的键顺序排列，
+              调用方应按该顺序写入 (如先订单后订单明细)。
+        batch_size: 第一个表累计到多少行时交给写库阶段 (默认从 settings.SYNC_LOAD_BATCH_SIZE 读取)。
+        queue_size: 两个队列的容量 (默认从 settings.SYNC_PIPELINE_QUEUE_SIZE 读取)。
+    """
+    batch_size = batch_size or settings.SYNC_LOAD_BATCH_SIZE
+    queue_size = queue_size or settings.SYNC_PIPELINE_QUEUE_SIZE
+    units: queue.Queue = queue.Queue(maxsize=queue_size)
+    batches: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def fetch_stage():
+        iterator = iter(source)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    unit = next(iterator)
+                except StopIteration:
+                    break
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='fetch')
+                if not _put(units, unit, stop, stage='fetch'):
+                    break
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close() # 提前结束时释放生成器持有的资源 (如线程池)
+            _put(units, _DONE, stop)
+
+    def transform_stage():
+        batch: Batch = {}
+        try:
+            while True:
+                unit = _get(units, stop)
+                if unit is _DONE:
+                    break
+                with STAGE_SECONDS.time(stage='transform'):
+                    transformed = transform(unit)
+                for table, rows in transformed.items():
+                    batch.setdefault(table, []).extend(rows)
+                if batch and len(next(iter(batch.values()))) >= batch_size:
+                    if not _put(batches, batch, stop, stage='transform'):
+                        return
+                    batch = {}
+            if batch and not stop.is_set():
+                _put(batches, batch, stop, stage='transform')
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(batches, _DONE, stop)
+
+    threads = [threading.Thread(target=fetch_stage, name='pipeline-fetch', daemon=True),
+               threading.Thread(target=transform_stage, name='pipeline-transform', daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    batches_loaded = 0
+    try:
+        while True:
+            batch = _get(batches, stop)
+            if batch is _DONE:
+                break
+            with STAGE_SECONDS.time(stage='load'):
+                load(batch)
+            batches_loaded += 1
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    logger.info(f"Pipeline finished: {batches_loaded} batches loaded.")
+    return batches_loaded
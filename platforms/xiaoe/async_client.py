@@ -0,0 +1,331 @@
+"""
+小鹅通 API 异步客户端 (asyncio + aiohttp)。
+
+与 XiaoeClient 提供相同的 get_orders / get_user_info / get_product_info 接口，
+用于在一个事件循环中同时保持多个分页请求在途。
+"""
+
+import asyncio
+import json
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+import aiohttp
+
+from config.config import settings
+from utils.logger import logger
+from utils.retry import async_retry, RetryBudget, CircuitBreaker
+from platforms.xiaoe.client import (XIAOE_BASE_URL, XIAOE_API_ENDPOINTS, XIAOE_THROTTLE_CODES,
+                                    XiaoeAuthError, XiaoeRequestError, XiaoePageLimitError,
+                                    get_endpoint_rate_limiter, is_throttle_status,
+                                    API_REQUEST_SECONDS, API_RESPONSES, API_RESPONSE_BYTES, API_ERRORS)
+from platforms.xiaoe.token_store import TokenStore
+
+class AsyncXiaoeClient:
+    """
+    小鹅通 API 异步客户端。
+
+    内部的信号量限制同时在途的请求数 (concurrency)，
+    调用方可以放心地并发发起大量协程，实际请求量不会超过该上限。
+    需在事件循环内使用，结束时调用 `await close()` 或使用 `async with`。
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, pool_size: Optional[int] = None, app_id: Optional[str] = None,
+                 client_id: Optional[str] = None, client_secret: Optional[str] = None):
+        """
+        初始化异步客户端，从 settings 加载配置。
+
+        Args:
+            concurrency: 同时在途的最大请求数 (默认从 settings.XIAOE_FETCH_CONCURRENCY 读取)。
+            pool_size: 连接池大小 (默认从 settings.XIAOE_HTTP_POOL_SIZE 读取)。
+            app_id / client_id / client_secret: 店铺应用凭证 (默认从 settings.XIAOE_APP_ID 等读取)。
+        """
+        self.app_id = app_id or settings.XIAOE_APP_ID
+        self.client_id = client_id or settings.XIAOE_CLIENT_ID
+        self.client_secret = client_secret or settings.XIAOE_SECRET_KEY
+        self.base_url = XIAOE_BASE_URL
+        self.access_token: Optional[str] = None
+        self.expires_at: int = 0
+        self.token_store = TokenStore(self.app_id)
+        self._token_lock = asyncio.Lock()
+        # 重试预算与熔断器：API 故障时限制重试放大，连续失败后快速失败
+        self.retry_budget = RetryBudget()
+        self.circuit_breaker = CircuitBreaker(f"xiaoe-async:{self.app_id}")
+        self.concurrency = concurrency or settings.XIAOE_FETCH_CONCURRENCY
+        self._pool_size = pool_size or settings.XIAOE_HTTP_POOL_SIZE
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.session: Optional[aiohttp.ClientSession] = None
+        logger.info(f"AsyncXiaoeClient initialized (concurrency={self.concurrency}).")
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """内部方法：惰性创建 aiohttp 会话 (必须在事件循环内创建)。"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self._pool_size, keepalive_timeout=60)
+            # aiohttp 会自动解压响应；显式声明以确保服务端启用 gzip/deflate
+            self.session = aiohttp.ClientSession(connector=connector,
+                                                 headers={'Accept-Encoding': 'gzip, deflate'})
+        return self.session
+
+    async def close(self):
+        """关闭 aiohttp 会话，释放连接。"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+            logger.info("AsyncXiaoeClient session closed.")
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def _get_access_token(self) -> Optional[str]:
+        """内部方法：获取或刷新 access_token，与同步客户端共用跨进程的 TokenStore。"""
+        if self.access_token and self.expires_at > time.time() + 300:
+            logger.debug("Using cached Xiaoe access token.")
+            return self.access_token
+
+        # single-flight：并发协程中只有一个执行刷新，其余在锁上等待并复用其结果
+        async with self._token_lock:
+            if self.access_token and self.expires_at > time.time() + 300:
+                logger.debug("Xiaoe access token already refreshed by a concurrent caller.")
+                return self.access_token
+
+            # 文件锁的等待放到线程中，避免阻塞事件循环
+            await self._acquire_file_lock()
+            try:
+                cached = self.token_store.read()
+                if TokenStore.is_fresh(cached, 300):
+                    logger.info("Using Xiaoe access token from shared token cache.")
+                    self.access_token = cached['access_token']
+                    self.expires_at = cached['expires_at']
+                else:
+                    self.access_token, self.expires_at = await self._request_access_token()
+                    self.token_store.write(self.access_token, self.expires_at)
+            finally:
+                self.token_store.file_lock.release()
+        return self.access_token
+
+    async def _acquire_file_lock(self):
+        """
+        在线程中等待 token 缓存的文件锁。
+
+        协程在等待期间被取消时，线程仍会拿到锁：此时等线程结束后立即释放，避免文件锁泄漏导致其他进程一直阻塞。
+        """
+        file_lock = self.token_store.file_lock
+        acquiring = asyncio.ensure_future(asyncio.to_thread(file_lock.acquire))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            def release_when_acquired(future: asyncio.Future):
+                if not future.cancelled() and future.exception() is None:
+                    file_lock.release()
+            acquiring.add_done_callback(release_when_acquired)
+            raise
+
+    async def _request_access_token(self) -> Tuple[str, float]:
+        """内部方法：向平台请求新的 access_token，返回 (access_token, expires_at)。"""
+        logger.info("Attempting to get new Xiaoe access token (async)...")
+        token_url = f"{self.base_url}{XIAOE_API_ENDPOINTS['token']}"
+        payload = {
+            "app_id": self.app_id,
+            "client_id": self.client_id,
+            "secret_key": self.client_secret,
+            "grant_type": "client_credential"
+        }
+        headers = {"Content-Type": "application/json"}
+
+        try:
+            session = self._get_session()
+            async with session.get(token_url, headers=headers, data=json.dumps(payload),
+                                   timeout=aiohttp.ClientTimeout(total=15)) as response:
+                response.raise_for_status()
+                result = await response.json(content_type=None)
+
+            if result.get("code") == 0:
+                data = result.get("data", {})
+                access_token = data.get("access_token")
+                expires_in = data.get("expires_in", 7200)
+                expires_at = time.time() + expires_in
+                logger.info(f"Successfully obtained Xiaoe access token. Expires around: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(expires_at))}")
+                return access_token, expires_at
+            else:
+                error_msg = f"Failed to get Xiaoe token. Code: {result.get('code')}, Msg: {result.get('msg', 'Unknown error')}"
+                logger.error(error_msg)
+                if result.get('code') in [40001, 40002, 40003]:
+                    raise XiaoeAuthError(error_msg)
+                else:
+                    raise XiaoeRequestError(error_msg)
+
+        except (XiaoeAuthError, XiaoeRequestError):
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error getting Xiaoe token: {e}", exc_info=True)
+            raise XiaoeRequestError(f"Network or request error getting token: {e}") from e
+        except Exception as e:
+            logger.error(f"Unexpected error getting Xiaoe token: {e}", exc_info=True)
+            raise XiaoeRequestError(f"Unexpected error getting token: {e}") from e
+
+    @async_retry(exceptions=(XiaoeRequestError,), budget='retry_budget', breaker='circuit_breaker')
+    async def _make_request(self, endpoint_key: str, method: str = 'POST', user_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """内部方法：执行 API 请求，受信号量限制同时在途的请求数。"""
+        api_path = XIAOE_API_ENDPOINTS.get(endpoint_key)
+        if not api_path:
+            raise ValueError(f"Invalid endpoint key: {endpoint_key}")
+        url = f"{self.base_url}{api_path}"
+
+        async with self._semaphore:
+            token = await self._get_access_token()
+            if not token:
+                logger.critical("Failed to obtain access token before making request.")
+                raise XiaoeAuthError("Access token is missing or could not be obtained.")
+
+            headers = {
+                'Content-Type': 'application/json'
+            }
+            payload_dict = user_params.copy() if user_params else {}
+            payload_dict["access_token"] = token
+            payload_json = json.dumps(payload_dict)
+
+            logger.debug(f"Making async Xiaoe API request to {url} with method {method}. Payload: {payload_json}")
+
+            # 与同步客户端共用同一个按端点限流器
+            rate_limiter = get_endpoint_rate_limiter(self.app_id, endpoint_key)
+            await rate_limiter.acquire_async()
+            try:
+                session = self._get_session()
+                started = time.perf_counter()
+                async with session.request(method, url, headers=headers, data=payload_json,
+                                           timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    if is_throttle_status(response.status):
+                        rate_limiter.on_throttle()
+                    response.raise_for_status()
+                    body = await response.read()
+                    API_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint_key)
+                    API_RESPONSE_BYTES.inc(len(body), endpoint=endpoint_key)
+                    result = json.loads(body)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                API_ERRORS.inc(endpoint=endpoint_key, kind='network')
+                rate_limiter.on_throttle()
+                logger.error(f"Xiaoe API request failed (network error) for {endpoint_key}: {e}", exc_info=True)
+                raise XiaoeRequestError(f"Request failed for endpoint {endpoint_key}: {e}") from e
+            except aiohttp.ClientError as e:
+                API_ERRORS.inc(endpoint=endpoint_key, kind='http')
+                logger.error(f"Xiaoe API request failed (network/http error) for {endpoint_key}: {e}", exc_info=True)
+                raise XiaoeRequestError(f"Request failed for endpoint {endpoint_key}: {e}") from e
+            except Exception as e:
+                API_ERRORS.inc(endpoint=endpoint_key, kind='unexpected')
+                logger.error(f"Unexpected error during Xiaoe API request for {endpoint_key}: {e}", exc_info=True)
+                raise XiaoeRequestError(f"Unexpected error for endpoint {endpoint_key}: {e}") from e
+
+        response_code = result.get('code')
+        if response_code == 0:
+            logger.debug(f"Xiaoe API request successful for {endpoint_key}.")
+            API_RESPONSES.inc(endpoint=endpoint_key)
+            rate_limiter.on_success()
+            return result.get('data', {})
+        elif response_code in XIAOE_THROTTLE_CODES:
+            error_msg = f"Xiaoe API throttled request. Endpoint: {endpoint_key}, Code: {response_code}, Msg: {result.get('msg')}"
+            logger.warning(error_msg)
+            API_ERRORS.inc(endpoint=endpoint_key, kind='api')
+            rate_limiter.on_throttle()
+            raise XiaoeRequestError(error_msg)
+        elif response_code in [40101, 40102, 40103, 40104, 40105, 40107]:
+            error_msg = f"Token invalid/expired error (Code: {response_code}, Msg: {result.get('msg')}). Clearing token."
+            logger.warning(error_msg)
+            API_ERRORS.inc(endpoint=endpoint_key, kind='auth')
+            # 只清除被拒绝的 token；若并发请求已刷新出新 token 则保留
+            async with self._token_lock:
+                if self.access_token == token:
+                    self.access_token = None
+                    self.expires_at = 0
+                await asyncio.to_thread(self.token_store.invalidate, token)
+            raise XiaoeAuthError(error_msg)
+        else:
+            error_msg = f"Xiaoe API returned error. Endpoint: {endpoint_key}, Code: {response_code}, Msg: {result.get('msg', 'Unknown API error')}"
+            logger.error(error_msg)
+            API_ERRORS.inc(endpoint=endpoint_key, kind='api')
+            raise XiaoeRequestError(error_msg)
+
+    # --- 公开方法，与 XiaoeClient 保持一致 ---
+
+    async def get_orders(self, page: int = 1, page_size: int = 50, start_time: Optional[str] = None, end_time: Optional[str] = None, order_state: Optional[int] = None) -> Dict[str, Any]:
+        """获取订单列表 (参数同 XiaoeClient.get_orders)。"""
+        user_params = {
+            'page': page,
+            'page_size': page_size
+        }
+        if start_time: user_params['start_time'] = start_time
+        if end_time: user_params['end_time'] = end_time
+        if order_state is not None: user_params['order_state'] = order_state
+
+        logger.info(f"Fetching orders (async): page={page}, size={page_size}, start={start_time}, end={end_time}, state={order_state}")
+        return await self._make_request('orders', method='POST', user_params=user_params)
+
+    async def get_user_info(self, user_id: str) -> Dict[str, Any]:
+        """获取单个用户信息。"""
+        user_params = {'user_id': user_id}
+        logger.info(f"Fetching user info (async) for user_id: {user_id}")
+        return await self._make_request('users', method='POST', user_params=user_params)
+
+    async def get_product_info(self, product_id: str) -> Dict[str, Any]:
+        """获取单个商品信息。"""
+        user_params = {'goods_id': product_id}
+        logger.info(f"Fetching product info (async) for product_id: {product_id}")
+        return await self._make_request('products', method='POST', user_params=user_params)
+
+async def fetch_order_pages(client: AsyncXiaoeClient, start_time: Optional[str] = None, end_time: Optional[str] = None,
+                            order_state: Optional[int] = None, page_size: int = 50,
+                            max_pages: int = 500) -> List[List[Dict[str, Any]]]:
+    """
+    并发拉取订单列表的所有分页，按页码顺序返回每页的订单列表。
+
+    启动 client.concurrency 个 worker 依次领取页码，保证始终有 N 个请求在途；
+    一旦某页返回不足 page_size 条，即认定其为最后一页，不再领取更大的页码
+    (已在途的更大页码请求结果会被丢弃)。
+
+    Args:
+        client: 异步客户端实例。
+        start_time / end_time / order_state: 透传给 get_orders 的过滤条件。
+        page_size: 每页数量。
+        max_pages: 最大页数限制。
+
+    Returns:
+        按页码排序的订单列表的列表。
+    """
+    pages: Dict[int, List[Dict[str, Any]]] = {}
+    next_page = 1
+    last_page = max_pages
+
+    async def worker():
+        nonlocal next_page, last_page
+        while next_page <= last_page:
+            page = next_page
+            next_page += 1
+            response_data = await client.get_orders(page=page, page_size=page_size, start_time=start_time,
+                                                    end_time=end_time, order_state=order_state)
+            orders_in_page = response_data.get('list', []) or []
+            pages[page] = orders_in_page
+            if len(orders_in_page) < page_size and page < last_page:
+                last_page = page
+
+    workers = [asyncio.create_task(worker()) for _ in range(client.concurrency)]
+    try:
+        await asyncio.gather(*workers)
+    except Exception:
+        for task in workers:
+            task.cancel()
+        raise
+
+    if last_page == max_pages and len(pages.get(max_pages, [])) == page_size:
+        # 剩余订单无法翻页取得，不能当作已拉取完毕
+        raise XiaoePageLimitError(f"Orders from {start_time} to {end_time} fill all {max_pages} pages; later orders cannot be paged. "
+                                  f"Use a smaller SYNC_CHECKPOINT_WINDOW_HOURS or --fetch-mode sharded.")
+
+    ordered_pages = []
+    for page in range(1, last_page + 1):
+        orders_in_page = pages.get(page)
+        if not orders_in_page:
+            break
+        ordered_pages.append(orders_in_page)
+    return ordered_pages
@@ -0,0 +1,183 @@
+"""
+小鹅通 API 流量的录制/回放 (cassette)。
+
+录制模式下，XiaoeClient 发出的每一对请求/响应 (脱敏后) 被写入 gzip 压缩的 JSON Lines 文件；
+回放模式下从该文件返回响应，不访问网络，可按录制时的耗时 (或按比例缩放、或零延迟) 模拟接口延迟。
+用于离线对同步流程做基准测试和回归验证。
+
+实现为 requests 的传输适配器，挂载在 XiaoeClient 的 Session 上，
+因此普通请求和流式请求 (--fetch-mode stream) 都会经过它；异步客户端不经过。
+"""
+
+import gzip
+import io
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Any, Optional, List, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+from utils.logger import logger
+
+# 录制时从请求体中抹去的凭据字段
+SCRUBBED_FIELDS = ('access_token', 'secret_key', 'client_id')
+SCRUBBED_VALUE = '<scrubbed>'
+# 回放时宽松匹配忽略的字段：增量同步的时间窗口取决于运行时刻，每次都不同
+LOOSE_MATCH_IGNORED_FIELDS = ('start_time', 'end_time')
+# token 接口不录制 (响应即凭据)，回放时返回固定的假 token
+TOKEN_PATH = '/token'
+REPLAY_ACCESS_TOKEN = 'replay-access-token'
+
+class CassetteMissError(requests.exceptions.RequestException):
+    """回放模式下找不到匹配的录制请求。"""
+    pass
+
+def _scrub_body(body: Any) -> Dict[str, Any]:
+    """解析 JSON 请求体并抹去凭据字段；非 JSON 请求体按原文保存。"""
+    if body is None:
+        return {}
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    try:
+        params = json.loads(body)
+    except ValueError:
+        return {'_raw': body}
+    if not isinstance(params, dict):
+        return {'_raw': body}
+    return {k: (SCRUBBED_VALUE if k in SCRUBBED_FIELDS else v) for k, v in params.items()}
+
+def _match_keys(method: str, path: str, params: Dict[str, Any]) -> Tuple[str, str]:
+    """返回 (精确匹配键, 宽松匹配键)，凭据字段不参与匹配。"""
+    matched = {k: v for k, v in params.items() if k not in SCRUBBED_FIELDS}
+    loose = {k: v for k, v in matched.items() if k not in LOOSE_MATCH_IGNORED_FIELDS}
+    exact_key = f"{method} {path} {json.dumps(matched, sort_keys=True, ensure_ascii=False)}"
+    loose_key = f"{method} {path} {json.dumps(loose, sort_keys=True, ensure_ascii=False)}"
+    return exact_key, loose_key
+
+class Cassette:
+    """
+    一个 cassette 文件：gzip 压缩的 JSON Lines，每行一次交互 (请求、响应、耗时)。
+
+    回放时先按 方法 + 路径 + 请求参数 精确匹配，再忽略时间窗口参数宽松匹配；
+    同一请求被录制多次时按录制顺序依次返回，用完后重复返回最后一次的响应。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.interactions: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._exact: Dict[str, deque] = defaultdict(deque)
+        self._loose: Dict[str, deque] = defaultdict(deque)
+        self._last: Dict[str, Dict[str, Any]] = {}
+
+    def load(self):
+        """读取 cassette 文件并建立匹配索引。"""
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            self.interactions = [json.loads(line) for line in f if line.strip()]
+        for interaction in self.interactions:
+            request = interaction['request']
+            exact_key, loose_key = _match_keys(request['method'], request['path'], request['params'])
+            self._exact[exact_key].append(interaction)
+            self._loose[loose_key].append(interaction)
+        logger.info(f"Loaded {len(self.interactions)} recorded interactions from cassette {self.path}.")
+
+    def save(self):
+        """把录制的交互原子地写入 cassette 文件。"""
+        with self._lock:
+            interactions = list(self.interactions)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for interaction in interactions:
+                f.write(json.dumps(interaction, ensure_ascii=False))
+                f.write('\n')
+        os.replace(tmp_path, self.path)
+        logger.info(f"Saved {len(interactions)} recorded interactions to cassette {self.path}.")
+
+    def record(self, method: str, path: str, params: Dict[str, Any], status: int,
+               headers: Dict[str, str], body: bytes, elapsed: float):
+        """追加一次交互 (请求参数应已脱敏)。"""
+        interaction = {
+            'request': {'method': method, 'path': path, 'params': params},
+            'response': {'status': status, 'headers': headers, 'body': body.decode('utf-8', errors='replace')},
+            'elapsed': round(elapsed, 4),
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def match(self, method: str, path: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """返回与请求匹配的录制交互，找不到时返回 None。"""
+        exact_key, loose_key = _match_keys(method, path, params)
+        with self._lock:
+            for key, index in ((exact_key, self._exact), (loose_key, self._loose)):
+                queue = index.get(key)
+                if not queue:
+                    if key in self._last:
+                        return self._last[key]
+                    continue
+                interaction = queue.popleft()
+                self._last[key] = interaction
+                return interaction
+        return None
+
+class CassetteAdapter(HTTPAdapter):
+    """
+    录制/回放 XiaoeClient HTTP 流量的传输适配器。
+
+    Args:
+        cassette: 录制写入或回放读取的 Cassette。
+        mode: 'record' 或 'replay'。
+        latency_scale: 回放时按录制耗时乘以该系数等待，0 表示不等待。
+    """
+
+    def __init__(self, cassette: Cassette, mode: str, latency_scale: float = 1.0, **kwargs):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Invalid cassette mode: {mode}")
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.mode = mode
+        self.latency_scale = latency_scale
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        path = urlsplit(request.url).path
+        params = _scrub_body(request.body)
+        if self.mode == 'replay':
+            return self._replay(request, path, params)
+
+        started = time.perf_counter()
+        response = super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        body = response.content # 已按 Content-Encoding 解压
+        elapsed = time.perf_counter() - started
+        if path != TOKEN_PATH:
+            self.cassette.record(request.method, path, params, response.status_code,
+                                 {'Content-Type': response.headers.get('Content-Type', 'application/json')},
+                                 body, elapsed)
+        # 用已读取的响应体重建响应，使流式调用方仍能从 response.raw 读取
+        return self._build(request, response.status_code, dict(response.headers), body)
+
+    def _replay(self, request, path: str, params: Dict[str, Any]) -> requests.Response:
+        if path == TOKEN_PATH:
+            body = json.dumps({'code': 0, 'msg': 'ok', 'data': {'access_token': REPLAY_ACCESS_TOKEN, 'expires_in': 7200}})
+            return self._build(request, 200, {'Content-Type': 'application/json'}, body.encode('utf-8'))
+        interaction = self.cassette.match(request.method, path, params)
+        if interaction is None:
+            raise CassetteMissError(f"No recorded interaction for {request.method} {path} {params}", request=request)
+        if self.latency_scale > 0:
+            time.sleep(interaction.get('elapsed', 0) * self.latency_scale)
+        recorded = interaction['response']
+        return self._build(request, recorded['status'], recorded['headers'], recorded['body'].encode('utf-8'))
+
+    def _build(self, request, status: int, headers: Dict[str, str], body: bytes) -> requests.Response:
+        # 响应体已是解压后的内容，去掉与原始传输相关的头
+        headers = {k: v for k, v in headers.items()
+                   if k.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+        headers['Content-Length'] = str(len(body))
+        raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status,
+                           preload_content=False, decode_content=False)
+        return self.build_response(request, raw)
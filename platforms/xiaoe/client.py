@@ -1,12 +1,29 @@
+import os
 import time
+import threading
 import requests
 import json
-from typing import Dict, Any, Optional
+import itertools
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple, List, Iterator, Callable
+from requests.adapters import HTTPAdapter
+
+try:
+    import ijson # 可选依赖：流式 JSON 解析
+except ImportError:
+    ijson = None
 
 # 导入项目配置、日志和重试装饰器
 from config.config import settings
 from utils.logger import logger
-from utils.retry import retry
+from utils import metrics
+from utils.retry import retry, RetryBudget, CircuitBreaker, CircuitOpenError
+from utils.rate_limiter import AdaptiveRateLimiter, get_rate_limiter, parse_rate_limits
+from platforms.xiaoe.token_store import TokenStore
+from platforms.xiaoe.cassette import Cassette, CassetteAdapter
+from platforms.xiaoe.page_size import PageSizeTuner
+from platforms.xiaoe.schemas import HAS_MSGSPEC, decode_order_list
 
 # 修改基础 URL
 XIAOE_BASE_URL = "https://api.xiaoe-tech.com/"
@@ -17,9 +34,41 @@ XIAOE_API_ENDPOINTS = {
     'orders': 'xe.ecommerce.order.order.list/1.0.0', # <-- 使用用户指定的地址
     'users': 'xe.user.info.get/1.0.0',   # 获取单个用户信息
     'products': 'xe.goods.info.get/1.0.0', # 获取单个商品信息
+    'products_list': 'xe.goods.list.get/1.0.0', # 分页获取商品列表
+    'after_sales_list': 'xe.ecommerce.after_sale.list/1.0.0', # 分页获取售后单 (退款等) 列表
+    'order_detail': 'xe.ecommerce.order.detail/1.0.0', # 获取单个订单详情
     # 'live_rooms': 'xe.live.list.get/1.0.0' # 直播列表 (如果需要)
 }
 
+# 探测订单列表接口最大每页数量时依次尝试的候选值 (从大到小)
+PAGE_SIZE_PROBE_CANDIDATES = (1000, 500, 200, 100)
+PAGE_SIZE_PROBE_WINDOW_DAYS = 30 # 探测请求只查询最近这些天的订单，避免无时间范围的全量查询
+PAGE_SIZE_PROBE_CACHE_SECONDS = 7 * 24 * 3600 # 探测结果写入缓存目录，有效期内的后续运行不再探测
+
+_STREAM_END = object() # 流式列表为空的标记
+
+# 被视为"限流"的业务错误码 (除 HTTP 429 / 5xx 外)，由 settings.XIAOE_THROTTLE_CODES 配置
+XIAOE_THROTTLE_CODES = {int(code) for code in settings.XIAOE_THROTTLE_CODES.split(',') if code.strip().isdigit()}
+XIAOE_RATE_LIMITS = parse_rate_limits(settings.XIAOE_RATE_LIMITS)
+
+# 同步与异步客户端共用的接口指标
+API_REQUEST_SECONDS = metrics.histogram('xiaoe_api_request_duration_seconds',
+                                        'Xiaoe API request latency in seconds, excluding rate limiter waits.', ('endpoint',))
+API_RESPONSES = metrics.counter('xiaoe_api_responses_total', 'Successful Xiaoe API responses (business code 0), e.g. list pages.', ('endpoint',))
+API_RESPONSE_BYTES = metrics.counter('xiaoe_api_response_bytes_total', 'Response body bytes received from the Xiaoe API.', ('endpoint',))
+API_ERRORS = metrics.counter('xiaoe_api_errors_total', 'Failed Xiaoe API request attempts by kind (api, http, network, auth, unexpected).',
+                             ('endpoint', 'kind'))
+
+def get_endpoint_rate_limiter(app_id: Optional[str], endpoint_key: str) -> AdaptiveRateLimiter:
+    """获取某个应用某个端点在进程内共享的限流器 (同步/异步客户端共用)。"""
+    rate = XIAOE_RATE_LIMITS.get(endpoint_key, settings.XIAOE_RATE_LIMIT_PER_SECOND)
+    return get_rate_limiter(f"xiaoe:{app_id}:{endpoint_key}", rate,
+                            max_rate=max(rate, settings.XIAOE_RATE_LIMIT_MAX_PER_SECOND))
+
+def is_throttle_status(status_code: int) -> bool:
+    """HTTP 429 或 5xx 视为需要降速。"""
+    return status_code == 429 or status_code >= 500
+
 class XiaoeAuthError(Exception):
     """小鹅通认证或权限错误。"""
     pass
@@ -28,25 +77,155 @@ class XiaoeRequestError(Exception):
     """小鹅通 API 请求错误。"""
     pass
 
+class XiaoePageLimitError(XiaoeRequestError):
+    """单个时间范围的订单超过接口允许的最大页数，剩余订单无法通过翻页取得 (应缩小时间范围后重新拉取)。"""
+    pass
+
+class XiaoeTokenExpiredError(XiaoeAuthError):
+    """access_token 失效或过期 (已清除缓存的 token，重试时会重新获取)。"""
+    pass
+
 class XiaoeClient:
-    """小鹅通 API 客户端实现类 (根据官方示例调整)。"""
+    """
+    小鹅通 API 客户端实现类 (根据官方示例调整)。
+
+    客户端持有一个带连接池的 requests.Session，所有请求复用 keep-alive 连接，
+    避免每页都重新进行 DNS 解析、TCP 握手和 TLS 协商。
+    access_token 通过 TokenStore 在进程间共享，并由后台线程在过期前提前刷新。
+    使用完毕后应调用 close()，或通过 `with XiaoeClient() as client:` 自动释放。
+    设置 cassette_mode 后，HTTP 流量会被录制到 cassette 文件或从中回放 (见 cassette.py)。
+    """
 
-    def __init__(self):
-        """初始化客户端，从 settings 加载配置。"""
-        self.app_id = settings.XIAOE_APP_ID
-        self.client_id = settings.XIAOE_CLIENT_ID
-        self.client_secret = settings.XIAOE_SECRET_KEY
+    def __init__(self, pool_size: Optional[int] = None, typed_decode: Optional[bool] = None,
+                 cassette_mode: Optional[str] = None, cassette_path: Optional[str] = None,
+                 autotune_page_size: Optional[bool] = None, app_id: Optional[str] = None,
+                 client_id: Optional[str] = None, client_secret: Optional[str] = None):
+        """
+        初始化客户端，从 settings 加载配置。
+
+        Args:
+            pool_size: 连接池大小 (默认从 settings.XIAOE_HTTP_POOL_SIZE 读取)。
+            typed_decode: 订单列表是否使用 msgspec 类型化解码 (默认从 settings.XIAOE_TYPED_DECODE 读取)。
+            cassette_mode: 'record' 录制流量，'replay' 回放录制的流量 (默认从 settings.XIAOE_CASSETTE_MODE 读取，空为关闭)。
+            cassette_path: cassette 文件路径 (默认从 settings.XIAOE_CASSETTE_FILE 读取)。
+            autotune_page_size: 订单列表是否自动选择每页数量 (默认从 settings.XIAOE_PAGE_SIZE_AUTOTUNE 读取)。
+            app_id / client_id / client_secret: 店铺应用凭证 (默认从 settings.XIAOE_APP_ID 等读取)。
+                access_token 缓存、限流器和熔断器都按 app_id 区分，不同店铺的客户端互不影响。
+        """
+        self.app_id = app_id or settings.XIAOE_APP_ID
+        self.client_id = client_id or settings.XIAOE_CLIENT_ID
+        self.client_secret = client_secret or settings.XIAOE_SECRET_KEY
         self.base_url = XIAOE_BASE_URL
         self.access_token: Optional[str] = None
         self.expires_at: int = 0
+        self.cassette_mode = (settings.XIAOE_CASSETTE_MODE if cassette_mode is None else cassette_mode) or None
+        self.cassette: Optional[Cassette] = None
+        if self.cassette_mode:
+            self.cassette = Cassette(cassette_path or settings.XIAOE_CASSETTE_FILE)
+            if self.cassette_mode == 'replay':
+                self.cassette.load()
+        # 回放得到的是假 token，不能写入真实的共享 token 缓存
+        token_cache_dir = os.path.join(settings.XIAOE_TOKEN_CACHE_DIR, 'replay') if self.cassette_mode == 'replay' else None
+        self.token_store = TokenStore(self.app_id, cache_dir=token_cache_dir)
+        # 重试预算与熔断器：API 故障时限制重试放大，连续失败后快速失败
+        self.retry_budget = RetryBudget()
+        self.circuit_breaker = CircuitBreaker(f"xiaoe:{self.app_id}")
+        autotune_page_size = settings.XIAOE_PAGE_SIZE_AUTOTUNE if autotune_page_size is None else autotune_page_size
+        if autotune_page_size and self.cassette_mode:
+            # 录制/回放依赖确定的请求参数，使用固定的每页数量
+            logger.info("Page size autotuning is disabled while recording or replaying a cassette.")
+            autotune_page_size = False
+        self.page_size_tuner: Optional[PageSizeTuner] = PageSizeTuner() if autotune_page_size else None
+        self._page_size_probe_lock = threading.Lock()
+        self._token_lock = threading.Lock() # 保证同一时刻只有一个调用方刷新 token
+        self._token_refresher: Optional[threading.Thread] = None
+        self._stop_token_refresher = threading.Event()
+        self.session = self._create_session(pool_size or settings.XIAOE_HTTP_POOL_SIZE)
+        self.typed_decode = settings.XIAOE_TYPED_DECODE if typed_decode is None else typed_decode
+        if self.typed_decode and not HAS_MSGSPEC:
+            logger.warning("XIAOE_TYPED_DECODE is enabled but msgspec is not installed. Using generic JSON decoding.")
+            self.typed_decode = False
         logger.info("XiaoeClient initialized.")
 
+    def _create_session(self, pool_size: int) -> requests.Session:
+        """内部方法：创建带连接池的 HTTP 会话。"""
+        session = requests.Session()
+        # pool_block=True: 连接池满时等待空闲连接，而不是创建用完即弃的临时连接
+        if self.cassette is not None:
+            adapter = CassetteAdapter(self.cassette, self.cassette_mode, settings.XIAOE_CASSETTE_LATENCY_SCALE,
+                                      pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+            logger.info(f"Xiaoe HTTP traffic {self.cassette_mode} mode, cassette: {self.cassette.path}")
+        else:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        # 显式协商压缩传输，订单列表 (含 good_list) 压缩后体积显著减小
+        session.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip, deflate'})
+        logger.debug(f"HTTP session created with pool size {pool_size}.")
+        return session
+
+    def close(self):
+        """停止后台 token 刷新，关闭 HTTP 会话，释放连接池中的连接；录制模式下写出 cassette。"""
+        self._stop_token_refresher.set()
+        if self.cassette is not None and self.cassette_mode == 'record':
+            self.cassette.save()
+            self.cassette = None
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+            logger.info("XiaoeClient session closed.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def _get_access_token(self) -> Optional[str]:
-        """内部方法：获取或刷新 access_token (根据官方示例调整)。"""
+        """
+        内部方法：获取或刷新 access_token (根据官方示例调整)。
+
+        优先使用内存中的 token；过期前 300 秒内会先读取跨进程共享的 TokenStore，
+        只有文件中的 token 也即将过期时才向平台请求新 token (持有文件锁，保证多进程只刷新一次)。
+        """
         if self.access_token and self.expires_at > time.time() + 300:
             logger.debug("Using cached Xiaoe access token.")
             return self.access_token
 
+        self._refresh_token(min_ttl=300)
+        self._start_token_refresher()
+        return self.access_token
+
+    def _refresh_token(self, min_ttl: float):
+        """
+        内部方法：在文件锁内读取共享缓存，剩余有效期不足 min_ttl 时请求新 token 并写回缓存。
+
+        single-flight：同一客户端上并发的调用方只有一个会执行刷新，
+        其余调用方在 _token_lock 上等待，拿到锁后发现 token 已有效便直接使用其结果。
+        """
+        with self._token_lock:
+            if self.access_token and self.expires_at > time.time() + min_ttl:
+                logger.debug("Xiaoe access token already refreshed by a concurrent caller.")
+                return
+            self._refresh_token_locked(min_ttl)
+
+    def _refresh_token_locked(self, min_ttl: float):
+        """内部方法：持有 _token_lock 时执行实际的刷新。"""
+        with self.token_store.file_lock:
+            cached = self.token_store.read()
+            if TokenStore.is_fresh(cached, min_ttl):
+                if cached['access_token'] != self.access_token:
+                    logger.info("Using Xiaoe access token from shared token cache.")
+                self.access_token = cached['access_token']
+                self.expires_at = cached['expires_at']
+                return
+            access_token, expires_at = self._request_access_token()
+            self.token_store.write(access_token, expires_at)
+            self.access_token = access_token
+            self.expires_at = expires_at
+
+    def _request_access_token(self) -> Tuple[str, float]:
+        """内部方法：向平台请求新的 access_token，返回 (access_token, expires_at)。"""
         logger.info("Attempting to get new Xiaoe access token...")
         # Token URL 直接拼接
         token_url = f"{self.base_url}{XIAOE_API_ENDPOINTS['token']}"
@@ -60,18 +239,18 @@ class XiaoeClient:
 
         try:
             # 官方示例使用 GET + data，我们遵循它
-            logger.debug(f"Requesting token from {token_url} with payload: {payload}")
-            response = requests.get(token_url, headers=headers, data=json.dumps(payload), timeout=15)
+            logger.debug(f"Requesting token from {token_url} for app_id {self.app_id}")
+            response = self.session.get(token_url, headers=headers, data=json.dumps(payload), timeout=15)
             response.raise_for_status()
             result = response.json()
 
             if result.get("code") == 0:
                 data = result.get("data", {})
-                self.access_token = data.get("access_token")
+                access_token = data.get("access_token")
                 expires_in = data.get("expires_in", 7200)
-                self.expires_at = time.time() + expires_in
-                logger.info(f"Successfully obtained Xiaoe access token. Expires around: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.expires_at))}")
-                return self.access_token
+                expires_at = time.time() + expires_in
+                logger.info(f"Successfully obtained Xiaoe access token. Expires around: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(expires_at))}")
+                return access_token, expires_at
             else:
                 error_msg = f"Failed to get Xiaoe token. Code: {result.get('code')}, Msg: {result.get('msg', 'Unknown error')}"
                 logger.error(error_msg)
@@ -80,6 +259,8 @@ class XiaoeClient:
                 else:
                     raise XiaoeRequestError(error_msg)
 
+        except (XiaoeAuthError, XiaoeRequestError):
+            raise
         except requests.exceptions.RequestException as e:
             logger.error(f"Error getting Xiaoe token: {e}", exc_info=True)
             raise XiaoeRequestError(f"Network or request error getting token: {e}") from e
@@ -87,9 +268,47 @@ class XiaoeClient:
             logger.error(f"Unexpected error getting Xiaoe token: {e}", exc_info=True)
             raise XiaoeRequestError(f"Unexpected error getting token: {e}") from e
 
-    @retry(exceptions=(XiaoeRequestError,))
-    def _make_request(self, endpoint_key: str, method: str = 'POST', user_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """内部方法：执行 API 请求 (根据官方示例调整)。"""
+    def _invalidate_token(self, access_token: str):
+        """
+        内部方法：token 被平台拒绝时，清除内存和共享缓存中的该 token。
+
+        只清除与被拒绝 token 相同的值：若并发的其他请求已经刷新出新 token，则保留新 token，
+        避免同一批在途请求各自触发一次重新认证。
+        """
+        with self._token_lock:
+            if self.access_token == access_token:
+                self.access_token = None # 清除 token，下次请求会重新获取
+                self.expires_at = 0
+            self.token_store.invalidate(access_token)
+
+    def _start_token_refresher(self):
+        """内部方法：启动后台 token 刷新线程 (每个客户端最多一个)。"""
+        if not settings.XIAOE_TOKEN_BACKGROUND_REFRESH or self._token_refresher is not None:
+            return
+        self._token_refresher = threading.Thread(target=self._token_refresh_loop,
+                                                 name='xiaoe-token-refresher', daemon=True)
+        self._token_refresher.start()
+
+    def _token_refresh_loop(self):
+        """
+        后台线程：在 token 过期前 XIAOE_TOKEN_REFRESH_AHEAD_SECONDS 秒提前刷新，
+        使请求路径上的 token 始终有效，请求不会因获取 token 而等待。
+        """
+        refresh_ahead = settings.XIAOE_TOKEN_REFRESH_AHEAD_SECONDS
+        while True:
+            # 最多每 5 分钟醒来一次，以便及时采用其他进程刷新的 token
+            delay = min(300.0, max(10.0, self.expires_at - refresh_ahead - time.time()))
+            if self._stop_token_refresher.wait(timeout=delay):
+                break
+            try:
+                if self.expires_at <= time.time() + refresh_ahead:
+                    self._refresh_token(min_ttl=refresh_ahead)
+            except Exception as e:
+                logger.warning(f"Background Xiaoe token refresh failed, will retry: {e}")
+        logger.debug("Xiaoe token refresher stopped.")
+
+    def _prepare_request(self, endpoint_key: str, user_params: Optional[Dict[str, Any]]) -> Tuple[str, str, str]:
+        """内部方法：获取 token 并构造请求 URL 和 JSON payload，返回 (url, payload_json, token)。"""
         token = self._get_access_token()
         if not token:
             logger.critical("Failed to obtain access token before making request.")
@@ -100,57 +319,310 @@ class XiaoeClient:
             raise ValueError(f"Invalid endpoint key: {endpoint_key}")
         url = f"{self.base_url}{api_path}"
 
-        headers = {
-            'Content-Type': 'application/json'
-        }
-
         # 将 token 和业务参数合并到 payload
         payload_dict = user_params.copy() if user_params else {}
         payload_dict["access_token"] = token
         payload_json = json.dumps(payload_dict)
+        return url, payload_json, token
+
+    def _check_response_code(self, endpoint_key: str, response_code: Any, msg: Optional[str],
+                             token: str, rate_limiter: AdaptiveRateLimiter):
+        """内部方法：校验业务返回码，成功时通知限流器加速，失败时抛出对应异常。"""
+        if response_code == 0:
+            logger.debug(f"Xiaoe API request successful for {endpoint_key}.")
+            API_RESPONSES.inc(endpoint=endpoint_key)
+            rate_limiter.on_success()
+        elif response_code in XIAOE_THROTTLE_CODES:
+            error_msg = f"Xiaoe API throttled request. Endpoint: {endpoint_key}, Code: {response_code}, Msg: {msg}"
+            logger.warning(error_msg)
+            rate_limiter.on_throttle()
+            raise XiaoeRequestError(error_msg)
+        # Token 过期处理（需要确认错误码）
+        elif response_code in [40101, 40102, 40103, 40104, 40105, 40107]: # 假设这些是 token 相关错误
+            error_msg = f"Token invalid/expired error (Code: {response_code}, Msg: {msg}). Clearing token."
+            logger.warning(error_msg)
+            self._invalidate_token(token)
+            raise XiaoeTokenExpiredError(error_msg)
+        else:
+            error_msg = f"Xiaoe API returned error. Endpoint: {endpoint_key}, Code: {response_code}, Msg: {msg or 'Unknown API error'}"
+            logger.error(error_msg)
+            raise XiaoeRequestError(error_msg)
+
+    @retry(exceptions=(XiaoeRequestError, XiaoeTokenExpiredError), budget='retry_budget', breaker='circuit_breaker')
+    def _make_request(self, endpoint_key: str, method: str = 'POST', user_params: Optional[Dict[str, Any]] = None,
+                      decoder: Optional[Callable[[bytes], Any]] = None) -> Dict[str, Any]:
+        """
+        内部方法：执行 API 请求 (根据官方示例调整)。
+
+        Args:
+            decoder: 可选的类型化解码函数 (如 schemas.decode_order_list)，返回带 code/msg/data 属性的对象；
+                     返回 None 时退回通用 JSON 解析。
+        """
+        url, payload_json, token = self._prepare_request(endpoint_key, user_params)
+        headers = {
+            'Content-Type': 'application/json'
+        }
 
         logger.debug(f"Making Xiaoe API request to {url} with method {method}. Payload: {payload_json}")
         
-        # 添加重试逻辑在这里，或者在调用方处理
-        # MVP 简化：暂时不加内部重试，依赖外部或手动重跑
+        # 按端点限流：等待令牌，并根据响应结果调整速率 (AIMD)
+        rate_limiter = get_endpoint_rate_limiter(self.app_id, endpoint_key)
+        rate_limiter.acquire()
         try:
-            response = requests.request(method, url, headers=headers, data=payload_json, timeout=30)
+            started = time.perf_counter() # 在限流等待之后计时，只统计接口本身的耗时
+            response = self.session.request(method, url, headers=headers, data=payload_json, timeout=30)
+            API_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint_key)
+            API_RESPONSE_BYTES.inc(len(response.content), endpoint=endpoint_key)
+            if is_throttle_status(response.status_code):
+                rate_limiter.on_throttle()
             response.raise_for_status() 
-            result = response.json()
-            response_code = result.get('code')
-
-            if response_code == 0:
-                logger.debug(f"Xiaoe API request successful for {endpoint_key}.")
-                return result.get('data', {}) # 返回 data 部分
-            # Token 过期处理（需要确认错误码）
-            elif response_code in [40101, 40102, 40103, 40104, 40105, 40107]: # 假设这些是 token 相关错误
-                error_msg = f"Token invalid/expired error (Code: {response_code}, Msg: {result.get('msg')}). Clearing token."
-                logger.warning(error_msg)
-                self.access_token = None # 清除 token，下次请求会重新获取
-                self.expires_at = 0
-                raise XiaoeAuthError(error_msg)
+            typed_result = decoder(response.content) if decoder is not None else None
+            if typed_result is not None:
+                self._check_response_code(endpoint_key, typed_result.code, typed_result.msg, token, rate_limiter)
+                data = typed_result.data if typed_result.data is not None else {}
             else:
-                error_msg = f"Xiaoe API returned error. Endpoint: {endpoint_key}, Code: {response_code}, Msg: {result.get('msg', 'Unknown API error')}"
-                logger.error(error_msg)
-                raise XiaoeRequestError(error_msg)
+                result = response.json()
+                self._check_response_code(endpoint_key, result.get('code'), result.get('msg'), token, rate_limiter)
+                data = result.get('data', {}) # 返回 data 部分
+            if endpoint_key == 'orders' and self.page_size_tuner is not None:
+                self.page_size_tuner.observe(len(data.get('list') or []), time.perf_counter() - started, len(response.content))
+            return data
 
+        except XiaoeRequestError:
+            API_ERRORS.inc(endpoint=endpoint_key, kind='api')
+            raise
         except requests.exceptions.RequestException as e:
+            network_error = isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+            API_ERRORS.inc(endpoint=endpoint_key, kind='network' if network_error else 'http')
+            if network_error:
+                rate_limiter.on_throttle()
             logger.error(f"Xiaoe API request failed (network/http error) for {endpoint_key}: {e}", exc_info=True)
             raise XiaoeRequestError(f"Request failed for endpoint {endpoint_key}: {e}") from e
         except XiaoeAuthError as e: # 重新抛出认证错误
+             API_ERRORS.inc(endpoint=endpoint_key, kind='auth')
              logger.warning(f"Authentication error during request for {endpoint_key}: {e}")
              raise
         except Exception as e:
+            API_ERRORS.inc(endpoint=endpoint_key, kind='unexpected')
             logger.error(f"Unexpected error during Xiaoe API request for {endpoint_key}: {e}", exc_info=True)
             raise XiaoeRequestError(f"Unexpected error for endpoint {endpoint_key}: {e}") from e
 
+    def _send_stream_request(self, endpoint_key: str, user_params: Optional[Dict[str, Any]] = None) -> Tuple[requests.Response, str, AdaptiveRateLimiter]:
+        """
+        内部方法：以流式方式发起 POST 请求，只读取响应头，返回 (response, token, rate_limiter)。
+
+        响应体由调用方边下载边解析 (gzip/deflate 透明解压)；重试由 _open_list_stream 负责。
+        """
+        url, payload_json, token = self._prepare_request(endpoint_key, user_params)
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        rate_limiter = get_endpoint_rate_limiter(self.app_id, endpoint_key)
+        rate_limiter.acquire()
+        try:
+            started = time.perf_counter()
+            response = self.session.post(url, headers=headers, data=payload_json, timeout=30, stream=True)
+            API_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint_key) # 流式请求统计到收到响应头为止
+            if is_throttle_status(response.status_code):
+                rate_limiter.on_throttle()
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            network_error = isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+            API_ERRORS.inc(endpoint=endpoint_key, kind='network' if network_error else 'http')
+            if network_error:
+                rate_limiter.on_throttle()
+            logger.error(f"Xiaoe API stream request failed (network/http error) for {endpoint_key}: {e}", exc_info=True)
+            raise XiaoeRequestError(f"Request failed for endpoint {endpoint_key}: {e}") from e
+        response.raw.decode_content = True # 让 urllib3 在读取时解压 gzip/deflate
+        return response, token, rate_limiter
+
+    def _parse_list_stream(self, endpoint_key: str, response: requests.Response, token: str,
+                           rate_limiter: AdaptiveRateLimiter) -> Iterator[Dict[str, Any]]:
+        """
+        内部方法：解析流式响应中的 data.list，逐条产出列表元素；产出第一条之前 (或列表为空时在结尾) 校验业务返回码。
+
+        使用 ijson 增量解析，内存中只保留当前正在解析的一条记录；
+        未安装 ijson 时退化为整体解析后逐条产出。读取或解析响应体失败时抛出 XiaoeRequestError。
+        """
+        try:
+            if ijson is None:
+                result = response.json()
+                self._check_response_code(endpoint_key, result.get('code'), result.get('msg'), token, rate_limiter)
+                yield from (result.get('data') or {}).get('list', []) or []
+                return
+
+            response_code, msg = None, None
+            code_checked = False
+            builder = None
+            try:
+                for prefix, event, value in ijson.parse(response.raw, use_float=True):
+                    if builder is not None:
+                        builder.event(event, value)
+                        if prefix == 'data.list.item' and event in ('end_map', 'end_array'):
+                            yield builder.value
+                            builder = None
+                    elif prefix == 'code':
+                        response_code = value
+                    elif prefix == 'msg':
+                        msg = value
+                    elif prefix == 'data.list.item':
+                        # code/msg 位于 data 之前，第一条记录出现时即可校验业务返回码
+                        if not code_checked:
+                            self._check_response_code(endpoint_key, response_code, msg, token, rate_limiter)
+                            code_checked = True
+                        if event in ('start_map', 'start_array'):
+                            builder = ijson.ObjectBuilder()
+                            builder.event(event, value)
+                        else:
+                            yield value
+            except (ijson.JSONError, requests.exceptions.RequestException) as e:
+                logger.error(f"Failed while streaming response for {endpoint_key}: {e}", exc_info=True)
+                raise XiaoeRequestError(f"Stream parsing failed for endpoint {endpoint_key}: {e}") from e
+            if not code_checked:
+                self._check_response_code(endpoint_key, response_code, msg, token, rate_limiter)
+        except XiaoeRequestError:
+            API_ERRORS.inc(endpoint=endpoint_key, kind='api')
+            raise
+        except XiaoeAuthError:
+            API_ERRORS.inc(endpoint=endpoint_key, kind='auth')
+            raise
+
+    @staticmethod
+    def _close_stream(endpoint_key: str, response: requests.Response):
+        # 流式读取时没有完整的 response.content，按已从连接读取的字节数 (压缩时为压缩后的大小) 统计
+        raw_bytes = response.raw.tell() if hasattr(response.raw, 'tell') else 0
+        API_RESPONSE_BYTES.inc(raw_bytes or 0, endpoint=endpoint_key)
+        response.close()
+
+    @retry(exceptions=(XiaoeRequestError, XiaoeTokenExpiredError), budget='retry_budget', breaker='circuit_breaker')
+    def _open_list_stream(self, endpoint_key: str, user_params: Optional[Dict[str, Any]] = None) -> Tuple[requests.Response, Iterator[Dict[str, Any]]]:
+        """
+        内部方法：流式请求列表接口，读取到业务返回码和第一条记录为止，返回 (response, 全部记录的迭代器)。
+
+        在任何记录交给调用方之前，整页作为一个单元重试：连接/HTTP 错误、限流返回码、token 过期
+        以及读取首条记录前的解析错误都会重新发起请求 (与 _make_request 相同)，熔断器按业务返回码记录成败。
+        """
+        response, token, rate_limiter = self._send_stream_request(endpoint_key, user_params)
+        try:
+            items = self._parse_list_stream(endpoint_key, response, token, rate_limiter)
+            first = next(items, _STREAM_END)
+        except BaseException:
+            self._close_stream(endpoint_key, response)
+            raise
+        if first is _STREAM_END:
+            return response, iter(())
+        return response, itertools.chain((first,), items)
+
+    def _iter_list_stream(self, endpoint_key: str, user_params: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        内部方法：流式解析响应中的 data.list，逐条产出列表元素。
+
+        首条记录之前的失败由 _open_list_stream 重试；已产出记录后响应体中断时抛出 XiaoeRequestError，
+        由调用方决定如何处理 (已产出的记录不会重复产出)。
+        """
+        response, items = self._open_list_stream(endpoint_key, user_params)
+        try:
+            yield from items
+        finally:
+            self._close_stream(endpoint_key, response)
+
+    def _page_size_cache_path(self) -> str:
+        return os.path.join(settings.XIAOE_TOKEN_CACHE_DIR, f"{self.app_id}_page_size.json")
+
+    def _read_probed_page_size(self) -> Optional[int]:
+        """读取 PAGE_SIZE_PROBE_CACHE_SECONDS 内探测并缓存的最大每页数量；不存在、过期或损坏时返回 None。"""
+        path = self._page_size_cache_path()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if time.time() - cached['probed_at'] > PAGE_SIZE_PROBE_CACHE_SECONDS:
+                return None
+            return int(cached['max_page_size']) or None
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable page size cache {path}: {e}")
+            return None
+
+    def _write_probed_page_size(self, max_page_size: int):
+        path = self._page_size_cache_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'max_page_size': max_page_size, 'probed_at': time.time()}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to cache probed page size to {path}: {e}")
+
+    def probe_max_page_size(self) -> int:
+        """
+        探测订单列表接口接受的最大每页数量 (每个客户端只探测一次，结果保存在 page_size_tuner 中，
+        并按 app_id 缓存到 XIAOE_TOKEN_CACHE_DIR，PAGE_SIZE_PROBE_CACHE_SECONDS 内的后续运行直接使用)。
+
+        探测请求只查询最近 PAGE_SIZE_PROBE_WINDOW_DAYS 天的订单。从大到小尝试 PAGE_SIZE_PROBE_CANDIDATES：
+        接口报错则换更小的值；返回条数少于请求值而总条数更多，说明接口把每页数量截断到了返回条数，以返回条数为上限；
+        返回条数少于请求值且无法判断是否截断 (订单不足一页或缺少总数) 时，保守地使用 settings.XIAOE_PAGE_SIZE，不缓存。
+        都失败时退回 settings.XIAOE_PAGE_SIZE。鉴权失败直接抛出 XiaoeAuthError。
+        """
+        tuner = self.page_size_tuner
+        if tuner is None:
+            return settings.XIAOE_PAGE_SIZE
+        with self._page_size_probe_lock:
+            if tuner.max_page_size:
+                return tuner.max_page_size
+            cached = self._read_probed_page_size()
+            if cached:
+                tuner.max_page_size = cached
+                logger.info(f"Using cached orders list page size limit: {cached}.")
+                return cached
+            now = datetime.now(timezone.utc)
+            window = {'start_time': (now - timedelta(days=PAGE_SIZE_PROBE_WINDOW_DAYS)).strftime('%Y-%m-%d %H:%M:%S'),
+                      'end_time': now.strftime('%Y-%m-%d %H:%M:%S')}
+            max_page_size = settings.XIAOE_PAGE_SIZE
+            conclusive = False
+            for candidate in PAGE_SIZE_PROBE_CANDIDATES:
+                try:
+                    # 直接调用未经重试包装的方法：参数不被接受时无需重试
+                    data = XiaoeClient._make_request.__wrapped__(self, 'orders', method='POST',
+                                                                 user_params={'page': 1, 'page_size': candidate, **window})
+                except XiaoeRequestError as e:
+                    logger.info(f"Orders list rejected page_size={candidate}: {e}")
+                    continue
+                returned = len(data.get('list') or [])
+                total = data.get('total', data.get('total_count'))
+                if returned >= candidate:
+                    max_page_size, conclusive = candidate, True
+                elif total is not None and int(total) > returned > 0:
+                    max_page_size, conclusive = returned, True # 接口截断到了 returned 条
+                break
+            tuner.max_page_size = max_page_size
+            if conclusive:
+                self._write_probed_page_size(max_page_size)
+                logger.info(f"Orders list endpoint accepts up to {max_page_size} orders per page.")
+            else:
+                logger.info(f"Could not determine the orders list page size limit from recent orders; using {max_page_size}.")
+            return max_page_size
+
+    def get_page_size(self) -> int:
+        """返回下一次订单列表查询应使用的每页数量 (未开启自动调整时为 settings.XIAOE_PAGE_SIZE)。"""
+        if self.page_size_tuner is None:
+            return settings.XIAOE_PAGE_SIZE
+        if not self.page_size_tuner.max_page_size:
+            self.probe_max_page_size()
+        return self.page_size_tuner.suggest()
+
     # --- 公开方法，调用 _make_request --- 
 
-    def get_orders(self, page: int = 1, page_size: int = 50, start_time: Optional[str] = None, end_time: Optional[str] = None, order_state: Optional[int] = None) -> Dict[str, Any]:
+    def get_orders(self, page: int = 1, page_size: Optional[int] = None, start_time: Optional[str] = None, end_time: Optional[str] = None, order_state: Optional[int] = None,
+                   updated_start_time: Optional[str] = None, updated_end_time: Optional[str] = None) -> Dict[str, Any]:
         """
         获取订单列表 (xe.order.list.get/1.0.2)。
-        参数放入 user_params。
+        参数放入 user_params。page_size 缺省时由 get_page_size() 决定。
+        updated_start_time / updated_end_time 按订单更新时间过滤，
+        参数名由 settings.XIAOE_ORDER_UPDATE_TIME_PARAMS 配置，未配置时抛出 ValueError。
         """
+        page_size = page_size or self.get_page_size()
         user_params = {
             'page': page,
             'page_size': page_size
@@ -158,10 +630,138 @@ class XiaoeClient:
         if start_time: user_params['start_time'] = start_time
         if end_time: user_params['end_time'] = end_time
         if order_state is not None: user_params['order_state'] = order_state
+        if updated_start_time or updated_end_time:
+            if not self.supports_updated_time_filter():
+                raise ValueError("XIAOE_ORDER_UPDATE_TIME_PARAMS is not configured; the orders list cannot be filtered by updated time.")
+            start_param, end_param = [name.strip() for name in settings.XIAOE_ORDER_UPDATE_TIME_PARAMS.split(',')]
+            if updated_start_time: user_params[start_param] = updated_start_time
+            if updated_end_time: user_params[end_param] = updated_end_time
 
         logger.info(f"Fetching orders: page={page}, size={page_size}, start={start_time}, end={end_time}, state={order_state}")
         # API 请求现在总是 POST，参数在 payload 里
-        return self._make_request('orders', method='POST', user_params=user_params)
+        # 启用类型化解码时返回 OrderListData (支持 .get，list 中为 OrderRecord)
+        decoder = decode_order_list if self.typed_decode else None
+        return self._make_request('orders', method='POST', user_params=user_params, decoder=decoder)
+
+    def iter_orders(self, page: int = 1, page_size: Optional[int] = None, start_time: Optional[str] = None, end_time: Optional[str] = None, order_state: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        流式获取一页订单，边下载边解析，逐条产出 data.list 中的订单。
+
+        参数同 get_orders。单页的内存占用与 page_size 无关，只取决于单条订单的大小。
+        """
+        page_size = page_size or self.get_page_size()
+        user_params = {
+            'page': page,
+            'page_size': page_size
+        }
+        if start_time: user_params['start_time'] = start_time
+        if end_time: user_params['end_time'] = end_time
+        if order_state is not None: user_params['order_state'] = order_state
+
+        logger.info(f"Streaming orders: page={page}, size={page_size}, start={start_time}, end={end_time}, state={order_state}")
+        return self._iter_list_stream('orders', user_params=user_params)
+
+    @staticmethod
+    def supports_updated_time_filter() -> bool:
+        """是否配置了订单列表按更新时间过滤的参数名 (XIAOE_ORDER_UPDATE_TIME_PARAMS，形如 "起始参数,结束参数")。"""
+        return len([name for name in settings.XIAOE_ORDER_UPDATE_TIME_PARAMS.split(',') if name.strip()]) == 2
+
+    @staticmethod
+    def supports_after_sales_updated_filter() -> bool:
+        """是否配置了售后单列表按更新时间过滤的参数名 (XIAOE_AFTER_SALES_UPDATE_TIME_PARAMS，形如 "起始参数,结束参数")。"""
+        return len([name for name in settings.XIAOE_AFTER_SALES_UPDATE_TIME_PARAMS.split(',') if name.strip()]) == 2
+
+    def get_after_sales(self, page: int = 1, page_size: int = 50, start_time: Optional[str] = None, end_time: Optional[str] = None,
+                        updated_start_time: Optional[str] = None, updated_end_time: Optional[str] = None) -> Dict[str, Any]:
+        """
+        分页获取售后单 (退款等) 列表 (xe.ecommerce.after_sale.list/1.0.0)。
+        start_time / end_time 按售后单创建时间过滤；updated_start_time / updated_end_time 按更新时间过滤，
+        参数名由 settings.XIAOE_AFTER_SALES_UPDATE_TIME_PARAMS 配置，未配置时抛出 ValueError。
+        返回的 data 中 list 的每一项都带有关联的 order_id。
+        """
+        user_params = {
+            'page': page,
+            'page_size': page_size
+        }
+        if start_time: user_params['start_time'] = start_time
+        if end_time: user_params['end_time'] = end_time
+        if updated_start_time or updated_end_time:
+            if not self.supports_after_sales_updated_filter():
+                raise ValueError("XIAOE_AFTER_SALES_UPDATE_TIME_PARAMS is not configured; the after-sales list cannot be filtered by updated time.")
+            start_param, end_param = [name.strip() for name in settings.XIAOE_AFTER_SALES_UPDATE_TIME_PARAMS.split(',')]
+            if updated_start_time: user_params[start_param] = updated_start_time
+            if updated_end_time: user_params[end_param] = updated_end_time
+        logger.info(f"Fetching after-sales records: page={page}, size={page_size}, start={start_time}, end={end_time}, "
+                    f"updated_start={updated_start_time}, updated_end={updated_end_time}")
+        return self._make_request('after_sales_list', method='POST', user_params=user_params)
+
+    def get_order_detail(self, order_id: str) -> Dict[str, Any]:
+        """
+        获取单个订单详情 (xe.ecommerce.order.detail/1.0.0)，结构与订单列表中的单条记录相同。
+        """
+        user_params = {'order_id': order_id}
+        logger.info(f"Fetching order detail for order_id: {order_id}")
+        return self._make_request('order_detail', method='POST', user_params=user_params)
+
+    def _fetch_each(self, fetch: Callable[[str], Optional[Dict[str, Any]]], ids: List[str],
+                    max_workers: Optional[int], thread_name_prefix: str) -> Dict[str, Dict[str, Any]]:
+        """
+        用线程池对每个 id 调用 fetch，返回 id -> 结果 (不含 None)。
+
+        熔断器半开时只放行一个试探请求，其余并发请求抛出 CircuitOpenError：这些 id 在本轮结束后再试一轮
+        (试探成功后熔断器已关闭)，仍被拒绝则记录日志并跳过，不中断整批。
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        pending = ids
+        for round_number in (1, 2):
+            rejected: List[str] = []
+
+            def run(item_id: str) -> Optional[Dict[str, Any]]:
+                try:
+                    return fetch(item_id)
+                except CircuitOpenError as e:
+                    if round_number == 2:
+                        logger.warning(f"Skipping {item_id}: {e}")
+                    rejected.append(item_id)
+                    return None
+
+            with ThreadPoolExecutor(max_workers=max_workers or settings.XIAOE_FETCH_CONCURRENCY,
+                                    thread_name_prefix=thread_name_prefix) as executor:
+                for item_id, data in zip(pending, executor.map(run, pending)):
+                    if data:
+                        results[item_id] = data
+            if not rejected or round_number == 2:
+                break
+            logger.info(f"{len(rejected)} requests were rejected by the circuit breaker; retrying them once.")
+            rejected_ids = set(rejected)
+            pending = [item_id for item_id in pending if item_id in rejected_ids]
+        return results
+
+    def get_order_details(self, order_ids: List[str], max_workers: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        并发获取多个订单的详情 (逐个调用 xe.ecommerce.order.detail，受端点限流器约束)。
+
+        单个订单获取失败只记录日志并跳过。
+
+        Returns:
+            order_id -> 订单原始数据 的字典，仅包含获取成功的订单。
+        """
+        unique_ids = list(dict.fromkeys(oid for oid in order_ids if oid))
+        if not unique_ids:
+            return {}
+
+        def fetch_order(order_id: str) -> Optional[Dict[str, Any]]:
+            try:
+                return self.get_order_detail(order_id) or None
+            except (XiaoeAuthError, XiaoeRequestError) as e:
+                logger.warning(f"Failed to fetch order detail for order_id {order_id}: {e}")
+                return None
+
+        orders = self._fetch_each(fetch_order, unique_ids, max_workers, 'xiaoe-order')
+
+        if len(orders) < len(unique_ids):
+            logger.warning(f"Fetched {len(orders)} of {len(unique_ids)} order details; {len(unique_ids) - len(orders)} failed.")
+        return orders
 
     def get_user_info(self, user_id: str) -> Dict[str, Any]:
         """
@@ -179,9 +779,49 @@ class XiaoeClient:
         logger.info(f"Fetching product info for product_id: {product_id}")
         return self._make_request('products', method='POST', user_params=user_params)
 
-    # 可以添加其他需要的 API 方法，例如获取用户列表、商品列表等
-    # def get_users(self, ...)
-    # def get_products(self, ...)
+    def get_users_info(self, user_ids: List[str], max_workers: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        并发获取多个用户的信息 (逐个调用 xe.user.info.get，受端点限流器约束)。
+
+        单个用户获取失败只记录日志并跳过，不影响同批次的其他用户。
+
+        Args:
+            user_ids: 用户 ID 列表 (会自动去重)。
+            max_workers: 并发线程数 (默认从 settings.XIAOE_FETCH_CONCURRENCY 读取)。
+
+        Returns:
+            user_id -> 用户原始数据 的字典，仅包含获取成功的用户。
+        """
+        unique_ids = list(dict.fromkeys(uid for uid in user_ids if uid))
+        if not unique_ids:
+            return {}
+
+        def fetch_user(user_id: str) -> Optional[Dict[str, Any]]:
+            try:
+                user_data = self.get_user_info(user_id) or {}
+            except (XiaoeAuthError, XiaoeRequestError) as e:
+                logger.warning(f"Failed to fetch user info for user_id {user_id}: {e}")
+                return None
+            user_data.setdefault('user_id', user_id) # 部分响应不回带 user_id
+            return user_data
+
+        users = self._fetch_each(fetch_user, unique_ids, max_workers, 'xiaoe-user')
+
+        if len(users) < len(unique_ids):
+            logger.warning(f"Fetched {len(users)} of {len(unique_ids)} users; {len(unique_ids) - len(users)} failed.")
+        return users
+
+    def get_products(self, page: int = 1, page_size: int = 50) -> Dict[str, Any]:
+        """
+        分页获取商品列表 (xe.goods.list.get/1.0.0)。
+        返回的 data 中包含 list (商品列表) 和 total (总数，可能缺失)。
+        """
+        user_params = {
+            'page': page,
+            'page_size': page_size
+        }
+        logger.info(f"Fetching products: page={page}, size={page_size}")
+        return self._make_request('products_list', method='POST', user_params=user_params)
 
 # --- 使用示例 (可选) ---
 # if __name__ == '__main__':
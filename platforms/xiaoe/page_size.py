@@ -0,0 +1,61 @@
+"""
+订单列表接口的每页数量自适应调整。
+
+根据实测的每条订单耗时和字节数 (指数滑动平均) 选择每页数量，
+使单页响应时间接近 XIAOE_PAGE_TARGET_SECONDS、响应体不超过 XIAOE_PAGE_MAX_BYTES，
+上限为探测到的接口最大每页数量。页数越少，往返次数越少。
+"""
+
+import threading
+from typing import Optional
+
+from config.config import settings
+from utils.logger import logger
+
+class PageSizeTuner:
+    """按实测延迟和响应大小给出下一次查询的每页数量，线程间可共享。"""
+
+    def __init__(self, initial: Optional[int] = None, max_page_size: Optional[int] = None, min_page_size: int = 10,
+                 target_seconds: Optional[float] = None, max_bytes: Optional[int] = None,
+                 smoothing: float = 0.3, step: int = 10):
+        self.initial = initial or settings.XIAOE_PAGE_SIZE
+        self.max_page_size = max_page_size or settings.XIAOE_PAGE_SIZE_MAX or None # None 表示尚未探测
+        self.min_page_size = min_page_size
+        self.target_seconds = target_seconds or settings.XIAOE_PAGE_TARGET_SECONDS
+        self.max_bytes = max_bytes or settings.XIAOE_PAGE_MAX_BYTES
+        self.smoothing = smoothing
+        self.step = step # 建议值取整到 step 的倍数，便于分页时对齐偏移量
+        self._seconds_per_item: Optional[float] = None
+        self._bytes_per_item: Optional[float] = None
+        self._last_suggestion = self.initial
+        self._lock = threading.Lock()
+
+    def observe(self, items: int, elapsed: float, num_bytes: int):
+        """记录一次订单列表响应：返回条数、耗时 (秒，不含限流等待)、响应体字节数。"""
+        if items <= 0:
+            return
+        with self._lock:
+            seconds_per_item, bytes_per_item = elapsed / items, num_bytes / items
+            if self._seconds_per_item is None:
+                self._seconds_per_item, self._bytes_per_item = seconds_per_item, bytes_per_item
+            else:
+                self._seconds_per_item += self.smoothing * (seconds_per_item - self._seconds_per_item)
+                self._bytes_per_item += self.smoothing * (bytes_per_item - self._bytes_per_item)
+
+    def suggest(self) -> int:
+        """返回下一次查询建议的每页数量 (每次最多翻倍，避免单次估计偏差导致过冲)。"""
+        with self._lock:
+            upper = self.max_page_size or self.initial
+            if self._seconds_per_item is None:
+                size = self.initial
+            else:
+                size = self.target_seconds / max(self._seconds_per_item, 1e-6)
+                if self._bytes_per_item:
+                    size = min(size, self.max_bytes / self._bytes_per_item)
+                size = min(size, self._last_suggestion * 2)
+            size = int(size) // self.step * self.step
+            size = max(self.min_page_size, min(upper, size))
+            if size != self._last_suggestion:
+                logger.debug(f"Orders page size tuned from {self._last_suggestion} to {size}.")
+            self._last_suggestion = size
+            return size
@@ -0,0 +1,294 @@
+"""
+小鹅通订单列表的分页拉取策略。
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Iterator, Tuple, Set
+
+from config.config import settings
+from utils.logger import logger
+from platforms.xiaoe.client import XiaoeClient, XiaoePageLimitError
+
+MAX_PAGES = 500 # 单个时间范围允许拉取的最大页数
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S" # 订单列表接口 start_time / end_time 的格式 (精确到秒，两端均包含)
+
+TimeWindow = Tuple[datetime, datetime]
+
+def get_total_count(response_data: Dict[str, Any]) -> Optional[int]:
+    """从订单列表响应中读取总条数 (兼容 total / total_count 两种字段名)，缺失时返回 None。"""
+    for key in ('total', 'total_count'):
+        value = response_data.get(key)
+        if value is not None:
+            try:
+                return int(value)
+            except (ValueError, TypeError):
+                logger.warning(f"Invalid {key} in orders list response: {value}")
+    return None
+
+def dedupe_orders(pages: List[List[Dict[str, Any]]], seen: Optional[Set[str]] = None) -> List[List[Dict[str, Any]]]:
+    """
+    按 order_id 去重 (保留首次出现的订单)，保持页内和页间顺序不变。
+
+    分页期间若有新订单写入，后面的页可能与前面的页重叠，去重后再交给下游转换。
+    传入 seen 时在多次调用之间共享已出现的 order_id (分批产出的结果整体去重)。
+    """
+    seen = set() if seen is None else seen
+    deduped_pages = []
+    duplicates = 0
+    for orders_in_page in pages:
+        kept = []
+        for order_raw in orders_in_page:
+            order_id = (order_raw.get('order_info') or {}).get('order_id')
+            if order_id is not None:
+                if order_id in seen:
+                    duplicates += 1
+                    continue
+                seen.add(order_id)
+            kept.append(order_raw)
+        deduped_pages.append(kept)
+    if duplicates:
+        logger.info(f"Removed {duplicates} duplicate orders across pages.")
+    return deduped_pages
+
+def page_limit_error(start_time: Optional[str], end_time: Optional[str], detail: str) -> XiaoePageLimitError:
+    """构造页数超限错误：该时间范围不能标记为已拉取完毕，由调用方让本次同步失败 (水位不推进)。"""
+    return XiaoePageLimitError(
+        f"Orders from {start_time} to {end_time} {detail}, exceeding the {MAX_PAGES}-page limit; later orders cannot be paged. "
+        f"Use a smaller SYNC_CHECKPOINT_WINDOW_HOURS or --fetch-mode sharded.")
+
+def aligned_page_size(offset: int, desired: int) -> int:
+    """
+    已拉取 offset 条后切换每页数量时，返回不超过 desired、且能整除 offset 的每页数量。
+
+    按页码分页时第 N 页从 (N-1) * page_size 开始，只有 offset 是新每页数量的整数倍，
+    后续页才能与已拉取的部分首尾相接，不重不漏。
+    """
+    size = max(1, desired)
+    while offset % size:
+        size -= 1
+    return size
+
+def fetch_order_pages_by_total(client: XiaoeClient, start_time: Optional[str] = None, end_time: Optional[str] = None,
+                               order_state: Optional[int] = None, page_size: Optional[int] = None,
+                               max_workers: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+    """
+    先拉取第 1 页，根据返回的总条数算出总页数，再用线程池同时拉取剩余页。
+
+    各页结果按页码顺序重新组装并按 order_id 去重。
+    若响应中没有总条数，则退回逐页拉取直到遇到不满一页的结果。
+
+    Args:
+        client: 同步客户端实例 (其连接池被各线程共享)。
+        start_time / end_time / order_state: 透传给 get_orders 的过滤条件。
+        page_size: 每页数量 (默认由 client.get_page_size() 决定，整次拉取中保持不变)。
+        max_workers: 线程池大小 (默认从 settings.XIAOE_FETCH_CONCURRENCY 读取)。
+
+    Returns:
+        按页码排序、已去重的订单列表的列表。
+    """
+    max_workers = max_workers or settings.XIAOE_FETCH_CONCURRENCY
+    page_size = page_size or client.get_page_size()
+
+    def fetch_page(page: int) -> List[Dict[str, Any]]:
+        response_data = client.get_orders(page=page, page_size=page_size, start_time=start_time,
+                                          end_time=end_time, order_state=order_state)
+        return response_data.get('list', []) or []
+
+    first_response = client.get_orders(page=1, page_size=page_size, start_time=start_time,
+                                       end_time=end_time, order_state=order_state)
+    first_page = first_response.get('list', []) or []
+    if not first_page:
+        return []
+
+    total = get_total_count(first_response)
+    if total is None:
+        logger.warning("Orders list response has no total count. Falling back to page-by-page fetch.")
+        pages = [first_page]
+        page = 1
+        while len(pages[-1]) == page_size:
+            if page >= MAX_PAGES:
+                raise page_limit_error(start_time, end_time, f"fill all {MAX_PAGES} pages")
+            page += 1
+            orders_in_page = fetch_page(page)
+            if not orders_in_page:
+                break
+            pages.append(orders_in_page)
+        return dedupe_orders(pages)
+
+    page_count = math.ceil(total / page_size)
+    if page_count > MAX_PAGES:
+        raise page_limit_error(start_time, end_time, f"total {total} ({page_count} pages of {page_size})")
+    logger.info(f"Orders list reports total={total}, fetching {page_count} pages with {max_workers} workers.")
+
+    pages = [first_page]
+    if page_count > 1:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='xiaoe-page') as executor:
+            # executor.map 按提交顺序返回结果，天然保持页码顺序
+            pages.extend(executor.map(fetch_page, range(2, page_count + 1)))
+
+    return dedupe_orders(pages)
+
+def plan_time_windows(start_dt: datetime, end_dt: datetime, chunk_days: Optional[float] = None) -> List[TimeWindow]:
+    """
+    把 [start_dt, end_dt] 按 chunk_days 天切成首尾相接、互不重叠的子窗口 (两端均包含，精度到秒)。
+
+    沿用历史同步脚本按 HISTORY_SYNC_CHUNK_DAYS 分块的做法：块结束时间 = 块开始 + N 天 - 1 秒，下一块从其后 1 秒开始。
+    """
+    chunk = timedelta(days=chunk_days or settings.XIAOE_WINDOW_CHUNK_DAYS)
+    start_dt, end_dt = start_dt.replace(microsecond=0), end_dt.replace(microsecond=0)
+    windows = []
+    current = start_dt
+    while current <= end_dt:
+        window_end = min(current + chunk - timedelta(seconds=1), end_dt)
+        windows.append((current, window_end))
+        current = window_end + timedelta(seconds=1)
+    return windows
+
+def split_time_window(window: TimeWindow) -> Optional[Tuple[TimeWindow, TimeWindow]]:
+    """把窗口对半拆成两个互不重叠的子窗口；窗口只剩 1 秒、无法再拆时返回 None。"""
+    start_dt, end_dt = window
+    if end_dt <= start_dt:
+        return None
+    middle = start_dt + timedelta(seconds=int((end_dt - start_dt).total_seconds()) // 2)
+    return (start_dt, middle), (middle + timedelta(seconds=1), end_dt)
+
+def _fetch_window(client: XiaoeClient, window: TimeWindow, order_state: Optional[int], page_size: Optional[int],
+                  target_pages: int) -> Tuple[Optional[List[List[Dict[str, Any]]]], Optional[Tuple[TimeWindow, TimeWindow]]]:
+    """
+    逐页拉取一个时间窗口内的订单。
+
+    Returns:
+        (pages, None)：窗口已拉取完毕；
+        (None, halves)：窗口页数超过 target_pages (或 MAX_PAGES)，应拆成 halves 两个子窗口重新拉取。
+    """
+    start_time, end_time = window[0].strftime(TIME_FORMAT), window[1].strftime(TIME_FORMAT)
+    page_size = page_size or client.get_page_size() # 每个窗口开始时选定，窗口内保持不变
+
+    def fetch_page(page: int):
+        return client.get_orders(page=page, page_size=page_size, start_time=start_time,
+                                 end_time=end_time, order_state=order_state)
+
+    first_response = fetch_page(1)
+    first_page = first_response.get('list', []) or []
+    if not first_page:
+        return [], None
+
+    total = get_total_count(first_response)
+    if total is not None:
+        page_count = math.ceil(total / page_size)
+        if page_count > target_pages:
+            halves = split_time_window(window)
+            if halves is not None:
+                logger.info(f"Window {start_time} ~ {end_time} has {total} orders ({page_count} pages), splitting in half.")
+                return None, halves
+        if page_count > MAX_PAGES:
+            raise page_limit_error(start_time, end_time, f"cannot be split further and need {page_count} pages")
+    else:
+        page_count = MAX_PAGES # 没有总条数时拉到不满一页为止
+
+    pages = [first_page]
+    page = 1
+    while len(pages[-1]) == page_size and page < page_count:
+        if total is None and page >= target_pages:
+            # 没有总条数时只能在拉到目标页数后才知道窗口过大，拆分后已拉取的页作废
+            halves = split_time_window(window)
+            if halves is not None:
+                logger.info(f"Window {start_time} ~ {end_time} exceeds {target_pages} pages, splitting in half.")
+                return None, halves
+        page += 1
+        orders_in_page = fetch_page(page).get('list', []) or []
+        if not orders_in_page:
+            break
+        pages.append(orders_in_page)
+    if total is None and page >= MAX_PAGES and len(pages[-1]) == page_size:
+        raise page_limit_error(start_time, end_time, f"cannot be split further and fill all {MAX_PAGES} pages")
+    return pages, None
+
+def fetch_order_windows(client: XiaoeClient, windows: List[TimeWindow], order_state: Optional[int] = None,
+                        page_size: Optional[int] = None, max_workers: Optional[int] = None,
+                        target_pages: Optional[int] = None) -> Iterator[Tuple[TimeWindow, List[List[Dict[str, Any]]]]]:
+    """
+    由线程池并行拉取给定的时间窗口，每个窗口拉取完毕后产出 (window, pages)。
+
+    窗口页数超过 target_pages 时对半拆分后重新入队，因此产出的是拆分后的子窗口，
+    全部产出的子窗口恰好覆盖输入的窗口；按完成先后产出，不保证时间顺序。窗口内的订单已按 order_id 去重。
+    调用方提前结束时取消尚未开始的窗口。参数含义见 fetch_order_pages_by_window。
+    """
+    max_workers = max_workers or settings.XIAOE_FETCH_CONCURRENCY
+    target_pages = min(target_pages or settings.XIAOE_WINDOW_TARGET_PAGES, MAX_PAGES)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='xiaoe-window')
+    try:
+        pending = {executor.submit(_fetch_window, client, window, order_state, page_size, target_pages): window
+                   for window in windows}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                window = pending.pop(future)
+                pages, halves = future.result()
+                if halves is not None:
+                    pending.update({executor.submit(_fetch_window, client, half, order_state, page_size, target_pages): half
+                                    for half in halves})
+                    continue
+                yield window, dedupe_orders(pages)
+    finally:
+        # 调用方提前结束或出错时，取消尚未开始的窗口
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def fetch_order_pages_by_window(client: XiaoeClient, start_time: str, end_time: str,
+                                order_state: Optional[int] = None, page_size: Optional[int] = None,
+                                max_workers: Optional[int] = None, chunk_days: Optional[float] = None,
+                                target_pages: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    把 [start_time, end_time] 切分为时间子窗口，由线程池并行拉取，按窗口完成的先后产出每页订单。
+
+    每个窗口先拉第 1 页读取总条数，页数超过 target_pages 时对半拆分后重新入队，
+    直到每个窗口都在目标页数以内，因此单个窗口永远不会触及 MAX_PAGES 上限而丢数据，
+    订单量大的时间段会被拆成更多窗口，由更多 worker 同时拉取。
+    产出的各页已按 order_id 整体去重；窗口之间不保证时间顺序。
+
+    Args:
+        client: 同步客户端实例 (其连接池被各线程共享)。
+        start_time / end_time: 时间范围 (YYYY-MM-DD HH:MM:SS，两端均包含)。
+        order_state: 透传给 get_orders 的订单状态过滤。
+        page_size: 每页数量 (默认每个窗口开始时由 client.get_page_size() 决定)。
+        max_workers: 同时拉取的窗口数 (默认从 settings.XIAOE_FETCH_CONCURRENCY 读取)。
+        chunk_days: 初始切分的窗口长度 (默认从 settings.XIAOE_WINDOW_CHUNK_DAYS 读取)。
+        target_pages: 单个窗口的目标最大页数 (默认从 settings.XIAOE_WINDOW_TARGET_PAGES 读取)。
+    """
+    windows = plan_time_windows(datetime.strptime(start_time, TIME_FORMAT), datetime.strptime(end_time, TIME_FORMAT),
+                                chunk_days)
+    logger.info(f"Planned {len(windows)} time windows from {start_time} to {end_time}, "
+                f"fetching with {max_workers or settings.XIAOE_FETCH_CONCURRENCY} workers.")
+
+    seen: Set[str] = set()
+    windows_fetched = 0
+    for _, pages in fetch_order_windows(client, windows, order_state=order_state, page_size=page_size,
+                                        max_workers=max_workers, target_pages=target_pages):
+        windows_fetched += 1
+        for orders_in_page in dedupe_orders(pages, seen):
+            if orders_in_page:
+                yield orders_in_page
+    logger.info(f"Fetched {len(seen)} orders from {windows_fetched} time windows.")
+
+def plan_refresh_windows(orders: List[Tuple[str, datetime]], max_gap: timedelta) -> List[Tuple[TimeWindow, List[str]]]:
+    """
+    把待刷新的订单按创建时间聚成紧凑的时间窗口：相邻两单间隔不超过 max_gap 的归入同一窗口。
+
+    Args:
+        orders: (order_id, created_at) 列表。
+
+    Returns:
+        [((窗口开始, 窗口结束), [order_id, ...]), ...]，窗口两端为该组订单的最早/最晚创建时间 (精确到秒)。
+    """
+    windows: List[Tuple[TimeWindow, List[str]]] = []
+    for order_id, created_at in sorted(orders, key=lambda item: item[1]):
+        created_at = created_at.replace(microsecond=0)
+        if windows and created_at - windows[-1][0][1] <= max_gap:
+            (window_start, _), order_ids = windows[-1]
+            windows[-1] = ((window_start, created_at), order_ids)
+            order_ids.append(order_id)
+        else:
+            windows.append(((created_at, created_at), [order_id]))
+    return windows
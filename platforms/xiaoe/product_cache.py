@@ -0,0 +1,125 @@
+"""
+小鹅通商品缓存 (进程内 + 磁盘)。
+
+以 product_id 为键，记录商品原始数据的内容哈希和转换后的商品数据：
+- 商品目录同步时，内容哈希未变且未过期的商品不会重复写库；
+- 订单明细补全商品信息时直接读缓存，不调用 API。
+
+每个店铺 (租户) 使用单独的缓存文件 (PRODUCT_CACHE_FILE 的文件名后加上租户名)，
+多店铺并发同步时各店铺的商品数据不会互相混入。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from config.config import settings
+from utils.file_lock import FileLock
+from utils.logger import logger
+
+def tenant_cache_path(path: str, tenant: str) -> str:
+    """在缓存文件名的扩展名前插入租户名，例如 cache/xiaoe_products.json -> cache/xiaoe_products.shop_a.json。"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{tenant}{ext}"
+
+class ProductCache:
+    """带 TTL 的商品缓存，磁盘文件在多进程间通过文件锁保护。"""
+
+    def __init__(self, path: Optional[str] = None, ttl_seconds: Optional[float] = None):
+        self.path = path or tenant_cache_path(settings.PRODUCT_CACHE_FILE, settings.XIAOE_TENANT)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.PRODUCT_CACHE_TTL_HOURS * 3600
+        self.file_lock = FileLock(f"{self.path}.lock")
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.load()
+
+    @staticmethod
+    def content_hash(product_raw: Dict[str, Any]) -> str:
+        """计算商品原始数据的内容哈希 (键排序后序列化，字段顺序不影响结果)。"""
+        serialized = json.dumps(product_raw, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+    def load(self):
+        """从磁盘加载缓存 (文件不存在或损坏时从空缓存开始)。"""
+        try:
+            with self.file_lock:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable product cache {self.path}: {e}")
+            entries = {}
+        with self._lock:
+            self._entries = entries
+            self._dirty = False
+        logger.info(f"Loaded {len(entries)} products from cache {self.path}.")
+
+    def save(self):
+        """把缓存原子地写回磁盘 (先合并磁盘上其他进程写入的较新条目)。"""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.file_lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    on_disk = json.load(f)
+            except (OSError, ValueError):
+                on_disk = {}
+            with self._lock:
+                for product_id, entry in self._entries.items():
+                    existing = on_disk.get(product_id)
+                    if existing is None or existing.get('cached_at', 0) <= entry['cached_at']:
+                        on_disk[product_id] = entry
+                self._entries = on_disk
+                self._dirty = False
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(on_disk, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        logger.info(f"Saved {len(on_disk)} products to cache {self.path}.")
+
+    def _is_expired(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get('cached_at', 0) > self.ttl_seconds
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """返回缓存中未过期的商品数据 (已转换格式)，不存在或已过期时返回 None。"""
+        with self._lock:
+            entry = self._entries.get(product_id)
+        if entry is None or self._is_expired(entry):
+            return None
+        return entry['product']
+
+    def is_unchanged(self, product_id: str, content_hash: str) -> bool:
+        """商品在 TTL 内且内容哈希一致，说明无需重新写库。"""
+        with self._lock:
+            entry = self._entries.get(product_id)
+        return entry is not None and entry['hash'] == content_hash and not self._is_expired(entry)
+
+    def put(self, product_id: str, content_hash: str, product: Dict[str, Any]):
+        """写入/更新一条缓存 (datetime 字段转为 ISO 字符串以便序列化)。"""
+        serializable = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in product.items()}
+        with self._lock:
+            self._entries[product_id] = {'hash': content_hash, 'product': serializable, 'cached_at': time.time()}
+            self._dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+# 进程内共享的缓存实例 (常驻进程中多次同步复用，避免重复读盘)
+_product_cache: Optional[ProductCache] = None
+_product_cache_lock = threading.Lock()
+
+def get_product_cache() -> ProductCache:
+    """获取进程内共享的当前租户商品缓存，首次调用 (或工作进程切换到其他租户后) 时从磁盘加载。"""
+    global _product_cache
+    path = tenant_cache_path(settings.PRODUCT_CACHE_FILE, settings.XIAOE_TENANT)
+    with _product_cache_lock:
+        if _product_cache is None or _product_cache.path != path:
+            _product_cache = ProductCache(path)
+        return _product_cache
@@ -0,0 +1,83 @@
+"""
+小鹅通订单列表接口的类型化响应结构 (基于 msgspec，可选依赖)。
+
+msgspec 在一次解析中完成 JSON 解码与类型校验，直接生成带 __slots__ 的紧凑对象，
+比先解码为通用 dict 再逐层 .get 快得多。只声明转换需要的字段，其余字段在解码时直接跳过。
+
+各结构都提供与 dict 兼容的 get()，因此现有按 dict 访问的调用方无需修改；
+transformers 对这些结构有专门的快速路径。
+"""
+
+from typing import Optional, List
+
+from utils.logger import logger
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+HAS_MSGSPEC = msgspec is not None
+
+if HAS_MSGSPEC:
+    class _Struct(msgspec.Struct, kw_only=True):
+        """结构基类：提供 dict 风格的 get()，兼容现有的 .get 调用方。"""
+
+        def get(self, key, default=None):
+            value = getattr(self, key, default)
+            return default if value is None else value
+
+    class OrderInfo(_Struct, kw_only=True):
+        order_id: Optional[str] = None
+        user_id: Optional[str] = None
+        order_state: Optional[int] = None
+        created_time: Optional[str] = None
+        pay_state_time: Optional[str] = None
+        discount_amount: Optional[float] = None # 分
+        refund_fee: Optional[float] = None # 分
+
+    class PriceInfo(_Struct, kw_only=True):
+        actual_price: Optional[float] = None # 分
+
+    class GoodItem(_Struct, kw_only=True):
+        resource_id: Optional[str] = None
+        spu_id: Optional[str] = None
+        goods_name: Optional[str] = None
+        buy_num: Optional[int] = None
+        unit_price: Optional[float] = None # 分
+
+    class OrderRecord(_Struct, kw_only=True):
+        order_info: Optional[OrderInfo] = None
+        price_info: Optional[PriceInfo] = None
+        good_list: List[GoodItem] = []
+
+    class OrderListData(_Struct, kw_only=True):
+        list: List[OrderRecord] = []
+        total: Optional[int] = None
+        total_count: Optional[int] = None
+
+    class OrderListResponse(_Struct, kw_only=True):
+        code: Optional[int] = None
+        msg: Optional[str] = None
+        data: Optional[OrderListData] = None
+
+    # strict=False：允许 "123" 这类字符串数字转换为声明的数值类型
+    _order_list_decoder = msgspec.json.Decoder(OrderListResponse, strict=False)
+else:
+    OrderRecord = None
+    OrderListResponse = None
+    _order_list_decoder = None
+
+def decode_order_list(content: bytes):
+    """
+    把订单列表接口的原始响应体解码为 OrderListResponse。
+
+    字段类型与声明不符 (例如空字符串金额) 时返回 None，调用方应退回通用 JSON 解析。
+    """
+    if _order_list_decoder is None:
+        return None
+    try:
+        return _order_list_decoder.decode(content)
+    except msgspec.ValidationError as e:
+        logger.warning(f"Typed decoding of orders list failed, falling back to generic JSON: {e}")
+        return None
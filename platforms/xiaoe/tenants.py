@@ -0,0 +1,75 @@
+# platforms/xiaoe/tenants.py
+"""
+小鹅通多店铺 (租户) 注册表。
+
+每个租户对应一组小鹅通应用凭证。XIAOE_TENANTS_FILE 指向一个 JSON 列表，例如：
+
+    [{"name": "shop_a", "app_id": "...", "client_id": "...", "secret_key": "..."},
+     {"name": "shop_b", "app_id": "...", "client_id": "...", "secret_key": "..."}]
+
+未配置该文件时，使用 XIAOE_APP_ID / XIAOE_CLIENT_ID / XIAOE_SECRET_KEY 组成名为 XIAOE_TENANT 的单个租户，
+与单店铺部署的行为一致。
+
+同步任务通过 settings 读取当前租户 (凭证、sync_status 水位、断点、锁都按 settings.XIAOE_TENANT 区分)，
+因此每个租户应在独立的进程中调用 activate_tenant 后运行，见 scripts/sync_xiaoe.py。
+"""
+
+import json
+from typing import List, Optional
+
+from config.config import settings
+from utils.logger import logger
+
+class Tenant:
+    """一个小鹅通店铺的名称与应用凭证。"""
+
+    def __init__(self, name: str, app_id: str, client_id: str, secret_key: str):
+        self.name = name
+        self.app_id = app_id
+        self.client_id = client_id
+        self.secret_key = secret_key
+
+    def __repr__(self):
+        return f"<Tenant(name='{self.name}', app_id='{self.app_id}')>"
+
+def load_tenants(path: Optional[str] = None) -> List[Tenant]:
+    """
+    读取租户列表。
+
+    Args:
+        path: 租户 JSON 文件路径 (默认从 settings.XIAOE_TENANTS_FILE 读取，为空时退回单租户配置)。
+
+    Raises:
+        ValueError: 文件内容不是列表、缺少必填字段或租户名重复。
+    """
+    path = path or settings.XIAOE_TENANTS_FILE
+    if not path:
+        return [Tenant(settings.XIAOE_TENANT, settings.XIAOE_APP_ID, settings.XIAOE_CLIENT_ID, settings.XIAOE_SECRET_KEY)]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"Tenants file {path} must contain a non-empty JSON list.")
+
+    tenants: List[Tenant] = []
+    for entry in entries:
+        missing = [key for key in ('name', 'app_id', 'client_id', 'secret_key') if not entry.get(key)]
+        if missing:
+            raise ValueError(f"Tenant entry {entry.get('name') or entry.get('app_id')!r} in {path} is missing: {', '.join(missing)}")
+        if len(entry['name']) > 64:
+            raise ValueError(f"Tenant name {entry['name']!r} is longer than 64 characters.")
+        tenants.append(Tenant(entry['name'], entry['app_id'], entry['client_id'], entry['secret_key']))
+
+    names = [tenant.name for tenant in tenants]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate tenant names in {path}: {', '.join(duplicates)}")
+    logger.info(f"Loaded {len(tenants)} tenants from {path}.")
+    return tenants
+
+def activate_tenant(tenant: Tenant):
+    """把 tenant 设为当前进程的租户：之后创建的客户端使用其凭证，同步状态按其名称记录。"""
+    settings.XIAOE_TENANT = tenant.name
+    settings.XIAOE_APP_ID = tenant.app_id
+    settings.XIAOE_CLIENT_ID = tenant.client_id
+    settings.XIAOE_SECRET_KEY = tenant.secret_key
@@ -0,0 +1,63 @@
+"""
+小鹅通 access_token 的跨进程持久化缓存。
+
+同一台机器上的多个 cron 任务 / worker 通过同一个缓存文件共享 token：
+刷新时持有文件锁，其他进程会等待并直接读取刷新后的 token，保证同一时间只刷新一次。
+"""
+
+import json
+import os
+import time
+from typing import Dict, Any, Optional
+
+from config.config import settings
+from utils.file_lock import FileLock
+from utils.logger import logger
+
+class TokenStore:
+    """按 app_id 区分的 access_token 文件缓存。"""
+
+    def __init__(self, app_id: Optional[str], cache_dir: Optional[str] = None):
+        cache_dir = cache_dir or settings.XIAOE_TOKEN_CACHE_DIR
+        self.path = os.path.join(cache_dir, f"{app_id}_access_token.json")
+        self.file_lock = FileLock(f"{self.path}.lock")
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        """读取缓存的 token，返回 {'access_token', 'expires_at'}；不存在或损坏时返回 None。"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable token cache {self.path}: {e}")
+            return None
+        if not cached.get('access_token') or not cached.get('expires_at'):
+            return None
+        return cached
+
+    def write(self, access_token: str, expires_at: float):
+        """原子地写入 token (先写临时文件再替换)，文件权限仅限当前用户。"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'access_token': access_token, 'expires_at': expires_at}, f)
+        os.replace(tmp_path, self.path)
+        logger.debug(f"Access token cached to {self.path}.")
+
+    def invalidate(self, access_token: str):
+        """若缓存中仍是被平台拒绝的 token，则删除缓存，避免其他进程继续使用。"""
+        with self.file_lock:
+            cached = self.read()
+            if cached and cached['access_token'] == access_token:
+                try:
+                    os.remove(self.path)
+                    logger.info(f"Invalidated cached access token {self.path}.")
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def is_fresh(cached: Optional[Dict[str, Any]], min_ttl: float) -> bool:
+        """缓存的 token 是否至少还有 min_ttl 秒有效期。"""
+        return bool(cached) and cached['expires_at'] > time.time() + min_ttl
@@ -5,10 +5,17 @@
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional, List
 
+from config.config import settings
+from utils import metrics
 from utils.logger import logger
+from platforms.xiaoe.schemas import OrderRecord
 
 PLATFORM_NAME = "xiaoe"
 
+RECORDS_TRANSFORMED = metrics.counter('sync_records_transformed_total', 'Source records transformed into table rows.', ('record',))
+RECORDS_SKIPPED = metrics.counter('sync_records_skipped_total', 'Source records dropped during transformation, by reason.',
+                                  ('record', 'reason'))
+
 def _parse_datetime(datetime_str: Optional[str]) -> Optional[datetime]:
     """尝试将多种格式的日期时间字符串解析为带时区的 datetime 对象 (UTC)。"""
     if not datetime_str or datetime_str == "0000-00-00 00:00:00": # 处理空或无效时间
@@ -20,6 +27,12 @@ def _parse_datetime(datetime_str: Optional[str]) -> Optional[datetime]:
         "%Y-%m-%dT%H:%M:%S.%f%z", # ISO 8601 with microsecond and timezone
         "%Y/%m/%d %H:%M:%S", # e.g., 2023/10/27 15:30:00
     ]
+    # 快速路径：最常见的 "YYYY-MM-DD HH:MM:SS" 直接拼接 UTC 偏移后用 fromisoformat 解析，比 strptime 快一个数量级
+    if len(datetime_str) == 19 and datetime_str[10] == ' ':
+        try:
+            return datetime.fromisoformat(datetime_str + '+00:00')
+        except ValueError:
+            pass
     for fmt in formats:
         try:
             dt = datetime.strptime(datetime_str, fmt)
@@ -53,15 +66,51 @@ def _safe_int_convert(value: Any, default: int = 0) -> int:
         logger.warning(f"Could not convert value to int: {value}. Using default {default}.")
         return default
 
+def _transform_order_record(record: Any) -> Optional[Dict[str, Any]]:
+    """transform_order 针对 schemas.OrderRecord 的快速路径：字段类型已在解码时校验，直接按属性读取。"""
+    order_info = record.order_info
+    price_info = record.price_info
+    if order_info is None or price_info is None or not order_info.order_id or not order_info.user_id:
+        logger.warning(f"Skipping order transformation due to missing key fields in order_info or price_info: {record}")
+        RECORDS_SKIPPED.inc(record='order', reason='missing_key_fields')
+        return None
+
+    created_at = _parse_datetime(order_info.created_time)
+    if created_at is None:
+        logger.error(f"Order {order_info.order_id} skipped: missing or invalid created_time (created_at) field.")
+        RECORDS_SKIPPED.inc(record='order', reason='invalid_created_time')
+        return None
+
+    transformed = {
+        'platform': PLATFORM_NAME,
+        'tenant': settings.XIAOE_TENANT,
+        'order_id': order_info.order_id,
+        'user_id': order_info.user_id,
+        'price': (price_info.actual_price or 0) / 100,
+        'coupon_price': (order_info.discount_amount or 0) / 100,
+        'refund_money': (order_info.refund_fee or 0) / 100,
+        'order_state': order_info.order_state or 0,
+        'pay_time': _parse_datetime(order_info.pay_state_time),
+        'created_at': created_at,
+    }
+    RECORDS_TRANSFORMED.inc(record='order')
+    return transformed
+
 def transform_order(order_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     转换订单数据格式 (适配 xe.ecommerce.order.list/1.0.0 返回结构).
+
+    order_data 可以是通用 dict，也可以是类型化解码得到的 schemas.OrderRecord。
     """
+    if OrderRecord is not None and isinstance(order_data, OrderRecord):
+        return _transform_order_record(order_data)
+
     order_info = order_data.get('order_info')
     price_info = order_data.get('price_info')
 
     if not order_info or not price_info or not order_info.get('order_id') or not order_info.get('user_id'):
         logger.warning(f"Skipping order transformation due to missing key fields in order_info or price_info: {order_data}")
+        RECORDS_SKIPPED.inc(record='order', reason='missing_key_fields')
         return None
 
     # 小鹅通价格单位是分，需要转为元
@@ -71,6 +120,7 @@ def transform_order(order_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
 
     transformed = {
         'platform': PLATFORM_NAME,
+        'tenant': settings.XIAOE_TENANT,
         'order_id': order_info.get('order_id'),
         'user_id': order_info.get('user_id'),
         'price': price,
@@ -90,23 +140,34 @@ def transform_order(order_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
 
     if transformed['created_at'] is None:
          logger.error(f"Order {transformed['order_id']} skipped: missing or invalid created_time (created_at) field.")
+         RECORDS_SKIPPED.inc(record='order', reason='invalid_created_time')
          return None
 
+    RECORDS_TRANSFORMED.inc(record='order')
     return transformed
 
-def transform_order_items(order_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+def transform_order_items(order_data: Dict[str, Any], product_cache: Optional[Any] = None) -> List[Dict[str, Any]]:
     """
     从订单数据中提取并转换订单商品数据 (适配 xe.ecommerce.order.list/1.0.0 结构).
+
+    Args:
+        order_data: 小鹅通 API 返回的原始订单数据字典，或类型化解码得到的 schemas.OrderRecord。
+        product_cache: 可选的 ProductCache；订单中缺少商品名称时从缓存补全 (不调用 API)。
     """
+    if OrderRecord is not None and isinstance(order_data, OrderRecord):
+        return _transform_order_record_items(order_data, product_cache)
+
     order_info = order_data.get('order_info')
     if not order_info or not order_info.get('order_id'):
         logger.warning("Cannot transform order items without order_id in order_info.")
+        RECORDS_SKIPPED.inc(record='order_item', reason='missing_order_id')
         return []
 
     order_id = order_info['order_id']
     good_list = order_data.get('good_list', []) # 商品信息在 good_list 中
     if not isinstance(good_list, list):
         logger.warning(f"good_list is not a list for order {order_id}. Skipping items.")
+        RECORDS_SKIPPED.inc(record='order_item', reason='invalid_good_list')
         return []
 
     items = []
@@ -115,18 +176,58 @@ def transform_order_items(order_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         product_id = resource.get('resource_id') or resource.get('spu_id')
         if not isinstance(resource, dict) or not product_id:
             logger.warning(f"Skipping invalid resource item in order {order_id}: {resource}")
+            RECORDS_SKIPPED.inc(record='order_item', reason='missing_product_id')
             continue
 
+        product_name = resource.get('goods_name')
+        if not product_name and product_cache is not None:
+            cached_product = product_cache.get(product_id)
+            if cached_product:
+                product_name = cached_product.get('title')
+
         item = {
             'platform': PLATFORM_NAME,
             'order_id': order_id,
             'product_id': product_id,
-            'product_name': resource.get('goods_name'),
+            'product_name': product_name,
             'quantity': _safe_int_convert(resource.get('buy_num'), 1), # 数量是 buy_num
             'price': _safe_float_convert(resource.get('unit_price'), 0) / 100 # 单价是 unit_price (分转元)
         }
         items.append(item)
 
+    RECORDS_TRANSFORMED.inc(len(items), record='order_item')
+    return items
+
+def _transform_order_record_items(record: Any, product_cache: Optional[Any] = None) -> List[Dict[str, Any]]:
+    """transform_order_items 针对 schemas.OrderRecord 的快速路径。"""
+    order_info = record.order_info
+    if order_info is None or not order_info.order_id:
+        logger.warning("Cannot transform order items without order_id in order_info.")
+        RECORDS_SKIPPED.inc(record='order_item', reason='missing_order_id')
+        return []
+
+    order_id = order_info.order_id
+    items = []
+    for resource in record.good_list:
+        product_id = resource.resource_id or resource.spu_id
+        if not product_id:
+            logger.warning(f"Skipping invalid resource item in order {order_id}: {resource}")
+            RECORDS_SKIPPED.inc(record='order_item', reason='missing_product_id')
+            continue
+        product_name = resource.goods_name
+        if not product_name and product_cache is not None:
+            cached_product = product_cache.get(product_id)
+            if cached_product:
+                product_name = cached_product.get('title')
+        items.append({
+            'platform': PLATFORM_NAME,
+            'order_id': order_id,
+            'product_id': product_id,
+            'product_name': product_name,
+            'quantity': resource.buy_num if resource.buy_num is not None else 1,
+            'price': (resource.unit_price or 0) / 100,
+        })
+    RECORDS_TRANSFORMED.inc(len(items), record='order_item')
     return items
 
 def transform_user(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -141,6 +242,7 @@ def transform_user(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     if not user_data or not user_data.get('user_id'):
         logger.warning(f"Skipping user transformation due to missing user_id: {user_data}")
+        RECORDS_SKIPPED.inc(record='user', reason='missing_user_id')
         return None
 
     transformed = {
@@ -157,6 +259,7 @@ def transform_user(user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         'register_time': _parse_datetime(user_data.get('register_time'))
         # updated_at 由数据库自动处理
     }
+    RECORDS_TRANSFORMED.inc(record='user')
     return transformed
 
 def transform_product(product_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -173,6 +276,7 @@ def transform_product(product_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     product_id = product_data.get('goods_id') 
     if not product_data or not product_id:
         logger.warning(f"Skipping product transformation due to missing goods_id: {product_data}")
+        RECORDS_SKIPPED.inc(record='product', reason='missing_goods_id')
         return None
 
     transformed = {
@@ -188,4 +292,5 @@ def transform_product(product_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         'created_at': _parse_datetime(product_data.get('created_at'))
         # updated_at 由数据库自动处理
     }
+    RECORDS_TRANSFORMED.inc(record='product')
     return transformed 
\ No newline at end of file
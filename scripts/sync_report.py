@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+同步运行历史报告
+
+读取 sync_runs 表，按任务 (租户/数据类型/同步模式) 和天 (或小时) 汇总运行次数、失败次数、耗时、
+吞吐量、API 延迟和数据新鲜度，并把最近一段时间与之前的基线比较，标出变慢、吞吐下降、失败增多的任务。
+"""
+
+import argparse
+import os
+import statistics
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from config.config import settings
+from core.db import SessionLocal
+from core.models import SyncRun
+
+JobKey = Tuple[str, str, str] # (tenant, data_type, sync_mode)
+
+def load_runs(db: SessionLocal, since: datetime, tenants: Optional[List[str]] = None,
+              data_type: Optional[str] = None, mode: Optional[str] = None) -> List[SyncRun]:
+    """读取 since (naive UTC) 之后开始的运行记录，按开始时间排序。"""
+    query = db.query(SyncRun).filter(SyncRun.started_at >= since)
+    if tenants:
+        query = query.filter(SyncRun.tenant.in_(tenants))
+    if data_type:
+        query = query.filter(SyncRun.data_type == data_type)
+    if mode:
+        query = query.filter(SyncRun.sync_mode == mode)
+    return query.order_by(SyncRun.started_at).all()
+
+def _median(values: Iterable[Any]) -> Optional[float]:
+    values = [float(v) for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+def _max(values: Iterable[Any]) -> Optional[float]:
+    values = [float(v) for v in values if v is not None]
+    return max(values) if values else None
+
+def summarize(runs: List[SyncRun]) -> Dict[str, Any]:
+    """一组运行的汇总：次数、失败数、耗时中位数/最大值、写入行数、吞吐量中位数、API P99 最大值、新鲜度延迟。"""
+    return {
+        'runs': len(runs),
+        'failed': sum(1 for run in runs if run.status != 'success'),
+        'duration_median': _median(run.duration_seconds for run in runs),
+        'duration_max': _max(run.duration_seconds for run in runs),
+        'rows': sum(run.rows_upserted or 0 for run in runs),
+        'rows_per_second': _median(run.rows_per_second for run in runs if run.rows_upserted),
+        'api_p50_ms': _median(run.api_p50_ms for run in runs),
+        'api_p99_ms': _max(run.api_p99_ms for run in runs),
+        'freshness_median': _median(run.freshness_lag_seconds for run in runs),
+        'freshness_max': _max(run.freshness_lag_seconds for run in runs),
+    }
+
+def _fmt(value: Optional[float], digits: int = 1) -> str:
+    return '-' if value is None else f"{value:.{digits}f}"
+
+def _fmt_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '-'
+    if seconds < 10:
+        return f"{seconds:.1f}s"
+    if seconds < 120:
+        return f"{seconds:.0f}s"
+    if seconds < 7200:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds / 3600:.1f}h"
+
+def print_table(headers: List[str], rows: List[List[str]]):
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    print('  '.join(header.ljust(width) for header, width in zip(headers, widths)))
+    print('  '.join('-' * width for width in widths))
+    for row in rows:
+        print('  '.join(str(cell).ljust(width) for cell, width in zip(row, widths)))
+
+def group_by_job(runs: List[SyncRun]) -> Dict[JobKey, List[SyncRun]]:
+    jobs: Dict[JobKey, List[SyncRun]] = defaultdict(list)
+    for run in runs:
+        jobs[(run.tenant, run.data_type, run.sync_mode)].append(run)
+    return jobs
+
+def print_trend_table(runs: List[SyncRun], by: str):
+    """按任务和时间段 (天/小时) 输出汇总表。"""
+    period_format = '%Y-%m-%d %H:00' if by == 'hour' else '%Y-%m-%d'
+    rows = []
+    for job, job_runs in sorted(group_by_job(runs).items()):
+        periods: Dict[str, List[SyncRun]] = defaultdict(list)
+        for run in job_runs:
+            periods[run.started_at.strftime(period_format)].append(run)
+        for period, period_runs in sorted(periods.items()):
+            stats = summarize(period_runs)
+            rows.append(['/'.join(job), period, stats['runs'], stats['failed'],
+                         _fmt_duration(stats['duration_median']), _fmt_duration(stats['duration_max']),
+                         stats['rows'], _fmt(stats['rows_per_second']),
+                         _fmt(stats['api_p50_ms'], 0), _fmt(stats['api_p99_ms'], 0),
+                         _fmt_duration(stats['freshness_median']), _fmt_duration(stats['freshness_max'])])
+    print_table(['job', 'period (UTC)', 'runs', 'failed', 'dur p50', 'dur max', 'rows', 'rows/s p50',
+                 'api p50 ms', 'api p99 ms', 'lag p50', 'lag max'], rows)
+
+def compare(recent: Dict[str, Any], baseline: Dict[str, Any], ratio: float) -> List[str]:
+    """比较最近一段时间与基线，返回发现的问题描述。"""
+    findings = []
+    def worse(key: str, higher_is_worse: bool = True) -> Optional[float]:
+        new, old = recent[key], baseline[key]
+        if new is None or old is None or old <= 0:
+            return None
+        change = new / old
+        if (higher_is_worse and change >= ratio) or (not higher_is_worse and change <= 1 / ratio):
+            return change
+        return None
+
+    change = worse('duration_median')
+    if change:
+        findings.append(f"duration x{change:.1f} ({_fmt_duration(baseline['duration_median'])} -> {_fmt_duration(recent['duration_median'])})")
+    change = worse('rows_per_second', higher_is_worse=False)
+    if change:
+        findings.append(f"throughput x{change:.2f} ({_fmt(baseline['rows_per_second'])} -> {_fmt(recent['rows_per_second'])} rows/s)")
+    change = worse('api_p99_ms')
+    if change:
+        findings.append(f"API p99 x{change:.1f} ({_fmt(baseline['api_p99_ms'], 0)} -> {_fmt(recent['api_p99_ms'], 0)} ms)")
+    change = worse('freshness_median')
+    if change:
+        findings.append(f"freshness lag x{change:.1f} ({_fmt_duration(baseline['freshness_median'])} -> {_fmt_duration(recent['freshness_median'])})")
+    recent_failure_rate = recent['failed'] / recent['runs']
+    baseline_failure_rate = baseline['failed'] / baseline['runs'] if baseline['runs'] else 0
+    if recent['failed'] and recent_failure_rate > baseline_failure_rate:
+        findings.append(f"failures {recent['failed']}/{recent['runs']} (baseline {baseline_failure_rate:.0%})")
+    return findings
+
+def print_alerts(runs: List[SyncRun], recent_since: datetime, ratio: float, interval_minutes: Optional[int]):
+    """把 recent_since 之后的运行与之前的运行 (基线) 比较，输出每个任务的异常；另外检查耗时是否接近调度间隔。"""
+    any_finding = False
+    for job, job_runs in sorted(group_by_job(runs).items()):
+        recent = [run for run in job_runs if run.started_at >= recent_since]
+        baseline = [run for run in job_runs if run.started_at < recent_since]
+        if not recent:
+            continue
+        recent_stats = summarize(recent)
+        findings = compare(recent_stats, summarize(baseline), ratio) if baseline else []
+        if interval_minutes and job[2] in ('incremental', 'combined') and recent_stats['duration_max'] is not None:
+            # 单次耗时接近调度间隔时，下一次触发会被跳过或重叠，说明已接近容量上限
+            usage = recent_stats['duration_max'] / (interval_minutes * 60)
+            if usage >= 0.5:
+                findings.append(f"longest run uses {usage:.0%} of the {interval_minutes} min schedule interval")
+        if findings:
+            any_finding = True
+            print(f"[!] {'/'.join(job)}: " + '; '.join(findings))
+    if not any_finding:
+        print("No slowdowns, throughput drops or new failures detected.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise sync run history from the sync_runs table.")
+    parser.add_argument("--days", type=int, default=7, help="How many days of history to read (default: 7).")
+    parser.add_argument("--by", type=str, default='day', choices=['day', 'hour'], help="Group the trend table by day or hour (default: day).")
+    parser.add_argument("--tenant", type=str, action='append', default=None, help="Only report this tenant (repeatable).")
+    parser.add_argument("--data-type", type=str, default=None, help="Only report this data type (e.g. order, user, product).")
+    parser.add_argument("--mode", type=str, default=None, help="Only report this sync mode (e.g. incremental, status_update, combined, backfill).")
+    parser.add_argument("--recent-hours", type=float, default=24,
+                        help="Compare runs from the last N hours against the earlier runs in the window (default: 24).")
+    parser.add_argument("--ratio", type=float, default=1.5,
+                        help="Flag a job when a metric is this many times worse than its baseline (default: 1.5).")
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None) # 数据库存储 naive UTC
+    db = SessionLocal()
+    try:
+        runs = load_runs(db, now - timedelta(days=args.days), args.tenant, args.data_type, args.mode)
+    finally:
+        db.close()
+    if not runs:
+        print(f"No sync runs recorded in the last {args.days} days.")
+        return
+
+    print(f"Sync runs from {runs[0].started_at:%Y-%m-%d %H:%M} to {runs[-1].started_at:%Y-%m-%d %H:%M} UTC ({len(runs)} runs)\n")
+    print_trend_table(runs, args.by)
+    print(f"\nLast {args.recent_hours:g}h compared with the earlier runs:")
+    print_alerts(runs, now - timedelta(hours=args.recent_hours), args.ratio, settings.ORDERS_SYNC_INTERVAL_MINUTES)
+
+if __name__ == "__main__":
+    main()
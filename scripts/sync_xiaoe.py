@@ -7,10 +7,16 @@
 """
 
 import argparse
+import asyncio
+import functools
+import math
 import sys
+import time
 import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Iterator, Iterable, Tuple, List, Dict, Any
 
 # 确保项目根目录在 sys.path 中，以便导入模块
 # (这在使用绝对路径的 cron 任务或直接运行时很有用)
@@ -21,13 +27,20 @@ if PROJECT_ROOT not in sys.path:
 
 # 现在可以安全地导入项目模块了
 from config.config import settings
+from utils import metrics
 from utils.logger import logger, setup_logging
 from core.db import get_db, SessionLocal, engine, Base
-from core.models import Order, OrderItem, User, Product, SyncStatus
+from core.models import Order, OrderItem, User, Product, SyncStatus, SyncCheckpoint, SyncRun
+from sqlalchemy import and_, or_, not_, func
 from core.loaders import upsert_data
+from core.locks import SyncLease
+from core.pipeline import run_pipeline
 from platforms.xiaoe.client import XiaoeClient, XiaoeAuthError, XiaoeRequestError
+from platforms.xiaoe.pagination import (fetch_order_pages_by_total, fetch_order_pages_by_window, fetch_order_windows, aligned_page_size, page_limit_error,
+                                        plan_time_windows, plan_refresh_windows, TimeWindow, TIME_FORMAT, MAX_PAGES)
+from platforms.xiaoe.product_cache import ProductCache, get_product_cache
+from platforms.xiaoe.tenants import Tenant, load_tenants, activate_tenant
 from platforms.xiaoe.transformers import transform_order, transform_order_items, transform_user, transform_product
-import time # 导入 time 模块
 
 # --- 同步函数定义 --- 
 
@@ -35,15 +48,16 @@ def update_sync_status(db: SessionLocal, platform: str, data_type: str, mode: st
                        status: str, message: Optional[str] = None, 
                        start_time: Optional[datetime] = None, end_time: Optional[datetime] = None, 
                        last_sync_ts: Optional[datetime] = None):
-    """更新同步状态表。"""
+    """更新当前租户 (settings.XIAOE_TENANT) 的同步状态。"""
     try:
         # 尝试查找现有记录
         sync_record = db.query(SyncStatus).filter_by(
-            platform=platform, data_type=data_type, sync_mode=mode
+            tenant=settings.XIAOE_TENANT, platform=platform, data_type=data_type, sync_mode=mode
         ).first()
 
         if not sync_record:
             sync_record = SyncStatus(
+                tenant=settings.XIAOE_TENANT,
                 platform=platform,
                 data_type=data_type,
                 sync_mode=mode
@@ -64,10 +78,11 @@ def update_sync_status(db: SessionLocal, platform: str, data_type: str, mode: st
         db.rollback()
 
 def get_last_sync_timestamp(db: SessionLocal, platform: str, data_type: str, mode: str) -> Optional[datetime]:
-    """获取上次成功同步的时间戳。"""
+    """获取当前租户上次同步到的时间戳。"""
     try:
+        # 不要求上次任务成功：水位只在数据写入后推进，失败的任务也可能已按断点推进了水位
         sync_record = db.query(SyncStatus).filter_by(
-            platform=platform, data_type=data_type, sync_mode=mode, status='success'
+            tenant=settings.XIAOE_TENANT, platform=platform, data_type=data_type, sync_mode=mode
         ).order_by(SyncStatus.last_sync_timestamp.desc()).first()
         
         if sync_record and sync_record.last_sync_timestamp:
@@ -87,10 +102,267 @@ def get_last_sync_timestamp(db: SessionLocal, platform: str, data_type: str, mod
         logger.error(f"Failed to get last sync timestamp for {platform}/{data_type}/{mode}: {e}", exc_info=True)
         return None
 
-def run_incremental_sync():
-    """执行小鹅通订单的增量同步。"""
+def get_sync_checkpoint(db: SessionLocal, platform: str, data_type: str, mode: str) -> Optional[Tuple[TimeWindow, int]]:
+    """返回上次未完成任务的断点 ((子窗口开始, 子窗口结束), 已写库条数)，时间为带 UTC 时区的 datetime；没有断点时返回 None。"""
+    checkpoint = db.query(SyncCheckpoint).filter_by(tenant=settings.XIAOE_TENANT, platform=platform, data_type=data_type, sync_mode=mode).first()
+    if checkpoint is None:
+        return None
+    window = (checkpoint.window_start.replace(tzinfo=timezone.utc), checkpoint.window_end.replace(tzinfo=timezone.utc))
+    return window, checkpoint.loaded_offset
+
+def get_backfill_position(db: SessionLocal, platform: str, data_type: str, start_dt: datetime) -> Optional[datetime]:
+    """返回起点为 start_dt 的未完成回填已连续写完到的时间 (带 UTC 时区)；没有该起点的断点时返回 None。"""
+    checkpoint = db.query(SyncCheckpoint).filter_by(tenant=settings.XIAOE_TENANT, platform=platform, data_type=data_type, sync_mode="backfill").first()
+    if checkpoint is None or checkpoint.loaded_through is None:
+        return None
+    if checkpoint.window_start.replace(tzinfo=timezone.utc) != start_dt:
+        return None
+    return checkpoint.loaded_through.replace(tzinfo=timezone.utc)
+
+def save_sync_progress(db: SessionLocal, platform: str, data_type: str, mode: str,
+                       window: Optional[TimeWindow], loaded_offset: int = 0, watermark: Optional[datetime] = None,
+                       loaded_through: Optional[datetime] = None):
+    """
+    记录同步进度：断点更新为 window 中已写库 loaded_offset 条 (window 为 None 时删除断点)，
+    loaded_through 不为 None 时一并记录 (回填已连续写完到的时间)；
+    watermark 不为 None 时在同一事务中把 sync_status 的水位推进到该时间。
+    """
+    try:
+        checkpoint = db.query(SyncCheckpoint).filter_by(tenant=settings.XIAOE_TENANT, platform=platform, data_type=data_type, sync_mode=mode).first()
+        if window is None:
+            if checkpoint is not None:
+                db.delete(checkpoint)
+        else:
+            if checkpoint is None:
+                checkpoint = SyncCheckpoint(tenant=settings.XIAOE_TENANT, platform=platform, data_type=data_type, sync_mode=mode)
+                db.add(checkpoint)
+            # 数据库中统一存储 naive UTC 时间
+            checkpoint.window_start = window[0].astimezone(timezone.utc).replace(tzinfo=None)
+            checkpoint.window_end = window[1].astimezone(timezone.utc).replace(tzinfo=None)
+            checkpoint.loaded_offset = loaded_offset
+            if loaded_through is not None:
+                checkpoint.loaded_through = loaded_through.astimezone(timezone.utc).replace(tzinfo=None)
+        if watermark is not None:
+            sync_record = db.query(SyncStatus).filter_by(tenant=settings.XIAOE_TENANT, platform=platform, data_type=data_type, sync_mode=mode).first()
+            if sync_record is None:
+                sync_record = SyncStatus(tenant=settings.XIAOE_TENANT, platform=platform, data_type=data_type, sync_mode=mode, status='running')
+                db.add(sync_record)
+            sync_record.last_sync_timestamp = watermark
+        db.commit()
+    except Exception as e:
+        # 断点写入失败不影响已写入的数据，最坏情况下重跑时多拉取一些页面
+        logger.error(f"Failed to save sync checkpoint for {platform}/{data_type}/{mode}: {e}", exc_info=True)
+        db.rollback()
+
+LIST_ENDPOINTS = ('orders', 'after_sales_list', 'products_list') # 计入 pages_fetched 的分页列表接口
+
+def record_sync_run(db: SessionLocal, platform: str, data_type: str, mode: str, status: str, message: Optional[str],
+                    start_time: datetime, end_time: datetime, metrics_before: metrics.Snapshot):
+    """
+    向 sync_runs 写入一次运行的历史记录。
+
+    拉取、转换、写库的数量和 API 延迟取自本进程指标在 metrics_before (运行开始时的快照) 之后的增量；
+    订单任务另外记录库中当前租户最新订单的创建时间和新鲜度延迟。写入失败只记录日志，不影响同步结果。
+    """
+    try:
+        registry = metrics.REGISTRY
+        run = metrics.delta(registry.snapshot(), metrics_before)
+        tenant = settings.XIAOE_TENANT
+        duration = (end_time - start_time).total_seconds()
+        rows_upserted = int(registry.total(run, 'db_upsert_records_total', tenant=tenant))
+        p50 = registry.quantile(run, 'xiaoe_api_request_duration_seconds', 0.5, tenant=tenant)
+        p99 = registry.quantile(run, 'xiaoe_api_request_duration_seconds', 0.99, tenant=tenant)
+        newest_created_at, freshness_lag = None, None
+        if data_type == "order":
+            newest_created_at = db.query(func.max(Order.created_at)).filter(
+                Order.platform == platform, Order.tenant == tenant).scalar()
+            if newest_created_at is not None:
+                freshness_lag = int((end_time.replace(tzinfo=None) - newest_created_at).total_seconds())
+        db.add(SyncRun(
+            tenant=tenant, platform=platform, data_type=data_type, sync_mode=mode, status=status, message=message,
+            started_at=start_time.astimezone(timezone.utc).replace(tzinfo=None), # 数据库存储 naive UTC
+            finished_at=end_time.astimezone(timezone.utc).replace(tzinfo=None),
+            duration_seconds=round(duration, 3),
+            api_requests=int(registry.total(run, 'xiaoe_api_responses_total', tenant=tenant)),
+            pages_fetched=int(sum(registry.total(run, 'xiaoe_api_responses_total', tenant=tenant, endpoint=endpoint)
+                                  for endpoint in LIST_ENDPOINTS)),
+            orders_fetched=int(registry.total(run, 'sync_records_transformed_total', tenant=tenant, record='order')
+                               + registry.total(run, 'sync_records_skipped_total', tenant=tenant, record='order')),
+            items_fetched=int(registry.total(run, 'sync_records_transformed_total', tenant=tenant, record='order_item')),
+            rows_upserted=rows_upserted,
+            rows_per_second=round(rows_upserted / duration, 2) if duration > 0 else None,
+            api_p50_ms=round(p50 * 1000, 1) if p50 is not None else None,
+            api_p99_ms=round(p99 * 1000, 1) if p99 is not None else None,
+            newest_created_at=newest_created_at,
+            freshness_lag_seconds=freshness_lag,
+        ))
+        db.commit()
+    except Exception as e:
+        logger.error(f"Failed to record sync run for {platform}/{data_type}/{mode}: {e}", exc_info=True)
+        db.rollback()
+
+def with_sync_lock(data_type: str, platform: str = "xiaoe"):
+    """
+    同步任务装饰器：持有 (platform, data_type) 的租约锁时才执行任务。
+
+    锁被其他进程或主机持有时 (例如上一次状态更新还没结束) 跳过本次运行，避免重复消耗 API 配额、
+    两个任务同时 UPSERT 同一批行造成锁竞争。增量、状态更新等订单任务共用 order 锁；
+    回填可能持续数小时，单独使用 order_backfill 锁，运行期间不阻塞计划的增量 / 状态更新任务。
+    任务函数返回本次运行的结果 ("success" / "failed")，跳过时返回 None。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            lease = SyncLease(platform, data_type)
+            if not lease.acquire():
+                logger.warning(f"Skipping {func.__name__}: another sync is holding the {platform}/{data_type} lock.")
+                return None
+            try:
+                return func(*args, **kwargs)
+            finally:
+                lease.release()
+        return wrapper
+    return decorator
+
+PAGE_RESUMABLE_FETCH_MODES = ('serial', 'stream') # 按页码顺序拉取、可以从页内偏移量继续的模式
+
+class _CountingIterator:
+    """包装迭代器并统计已产出的元素个数 (用于流式分页判断是否为最后一页)。"""
+
+    def __init__(self, iterator: Iterator[Dict[str, Any]]):
+        self._iterator = iterator
+        self.count = 0
+
+    def __iter__(self):
+        for item in self._iterator:
+            self.count += 1
+            yield item
+
+    def drain(self):
+        for _ in self:
+            pass
+
+def iter_order_pages(client: XiaoeClient, start_time_str: str, end_time_str: str,
+                     order_state: Optional[int] = None, page_size: Optional[int] = None,
+                     fetch_mode: str = 'serial', concurrency: Optional[int] = None,
+                     start_offset: int = 0) -> Iterator[Tuple[int, Iterable[Dict[str, Any]]]]:
+    """
+    按页码顺序产出 (page, orders_in_page)，屏蔽不同的分页拉取方式。
+
+    orders_in_page 是可迭代对象：除 stream 模式外为列表；stream 模式下为流式迭代器，
+    调用方应在处理下一页之前遍历完当前页。
+
+    page_size 缺省时由 client.get_page_size() 选择 (开启 XIAOE_PAGE_SIZE_AUTOTUNE 时按实测延迟调整)：
+    serial 模式在已拉取条数能对齐的页边界上随时切换，其他模式在每次查询 (sharded 为每个窗口) 开始时选定。
+
+    start_offset: 跳过按页码顺序的前 start_offset 条订单 (从断点继续)，仅 serial / stream 模式支持 (PAGE_RESUMABLE_FETCH_MODES)。
+
+    fetch_mode:
+        serial: 使用同步 client 逐页拉取 (默认)。
+        stream: 逐页拉取，每页边下载边解析 (gzip 传输 + 增量 JSON 解析)，内存占用不随 page_size 增长。
+        async: 使用 AsyncXiaoeClient 并发拉取，最多 concurrency 个请求同时在途。
+        parallel: 先拉第 1 页读取总条数，再用 concurrency 个线程同时拉取剩余页 (按 order_id 去重)。
+        sharded: 把时间范围切分为子窗口，concurrency 个线程并行拉取，页数过多的窗口继续对半拆分，
+                 不受单个范围 500 页上限影响 (页码为产出顺序，窗口之间不保证时间顺序)。
+    """
+    if start_offset and fetch_mode not in PAGE_RESUMABLE_FETCH_MODES:
+        raise ValueError(f"Fetch mode {fetch_mode} cannot resume from an offset.")
+
+    if fetch_mode == 'sharded':
+        pages = fetch_order_pages_by_window(client, start_time=start_time_str, end_time=end_time_str,
+                                            order_state=order_state, page_size=page_size,
+                                            max_workers=concurrency)
+        for page, orders_in_page in enumerate(pages, start=1):
+            yield page, orders_in_page
+        return
+
+    if fetch_mode == 'parallel':
+        pages = fetch_order_pages_by_total(client, start_time=start_time_str, end_time=end_time_str,
+                                           order_state=order_state, page_size=page_size,
+                                           max_workers=concurrency)
+        for page, orders_in_page in enumerate(pages, start=1):
+            if orders_in_page:
+                yield page, orders_in_page
+        return
+
+    autotune = page_size is None and client.page_size_tuner is not None
+    page_size = page_size or client.get_page_size()
+    # 从页边界继续：断点偏移量向下取整到本次每页数量的整数倍 (重复拉取的订单由 UPSERT 幂等处理)，
+    # 不按偏移量反推每页数量，避免偏移量不是整页时每页数量退化到个位数
+    start_offset = start_offset // page_size * page_size
+
+    if fetch_mode == 'async':
+        # 延迟导入，串行模式下不依赖 aiohttp
+        from platforms.xiaoe.async_client import AsyncXiaoeClient, fetch_order_pages
+
+        async def _fetch_all_pages():
+            async with AsyncXiaoeClient(concurrency=concurrency) as async_client:
+                return await fetch_order_pages(async_client, start_time=start_time_str, end_time=end_time_str,
+                                               order_state=order_state, page_size=page_size)
+
+        for page, orders_in_page in enumerate(asyncio.run(_fetch_all_pages()), start=1):
+            yield page, orders_in_page
+        return
+
+    if fetch_mode == 'stream':
+        page = start_offset // page_size + 1
+        while True:
+            counted_orders = _CountingIterator(client.iter_orders(page=page, page_size=page_size, start_time=start_time_str,
+                                                                  end_time=end_time_str, order_state=order_state))
+            yield page, counted_orders
+            counted_orders.drain() # 调用方未遍历完时补齐，保证计数准确
+            if counted_orders.count < page_size:
+                logger.info("Fetched less orders than page size, assuming last page.")
+                break
+            if page >= MAX_PAGES:
+                raise page_limit_error(start_time_str, end_time_str, f"fill all {MAX_PAGES} pages")
+            page += 1
+        return
+
+    page = 1
+    offset = start_offset # 已拉取的订单条数
+    while True:
+        api_page = offset // page_size + 1 # 每页数量可能已调整，按偏移量换算接口页码
+        logger.info(f"Fetching page {api_page} of orders (state={order_state}, size={page_size}) from {start_time_str} to {end_time_str}")
+        response_data = client.get_orders(page=api_page, page_size=page_size, start_time=start_time_str, end_time=end_time_str, order_state=order_state)
+        orders_in_page = response_data.get('list', [])
+        # API可能不返回total_count，或者不准确，依赖 list 是否为空
+        if not orders_in_page:
+            logger.info("No more orders found in this page/range.")
+            break
+
+        yield page, orders_in_page
+
+        # 判断是否需要继续获取下一页 (小鹅通常规分页逻辑)
+        # 如果返回的列表数量小于请求的page_size，说明是最后一页了
+        if len(orders_in_page) < page_size:
+            logger.info("Fetched less orders than page size, assuming last page.")
+            break
+
+        offset += len(orders_in_page)
+        page += 1
+        if autotune:
+            desired = client.get_page_size()
+            aligned = aligned_page_size(offset, desired)
+            if aligned * 2 >= desired: # 找不到接近目标的整除值时保持当前每页数量 (offset 总是其整数倍)
+                page_size = aligned
+        if offset // page_size + 1 > MAX_PAGES: # 上限按接口实际页码计算
+            raise page_limit_error(start_time_str, end_time_str, f"fill all {MAX_PAGES} pages of {page_size}")
+
+@with_sync_lock('order')
+def run_incremental_sync(client: Optional[XiaoeClient] = None, fetch_mode: str = 'serial',
+                         concurrency: Optional[int] = None):
+    """
+    执行小鹅通订单的增量同步。
+
+    Args:
+        client: 可选的共享 XiaoeClient；未提供时在本次同步内部创建并在结束时关闭。
+        fetch_mode: 分页拉取方式，见 iter_order_pages。
+        concurrency: 并发拉取时同时在途的请求数。
+    """
     logger.info("Starting Xiaoe incremental order sync...")
     start_run_time = datetime.now(timezone.utc)
+    metrics_before = metrics.REGISTRY.snapshot()
     platform = "xiaoe"
     data_type = "order"
     mode = "incremental"
@@ -99,10 +371,14 @@ def run_incremental_sync():
     error_message = None
     last_sync_ts = None # 初始化
     new_last_sync_ts = start_run_time # 默认将本次开始时间作为下次同步起点
+    owns_client = client is None
 
     try:
-        # 1. 获取上次同步时间戳
+        # 1. 获取上次同步时间戳和上次未完成任务的断点
         last_sync_ts = get_last_sync_timestamp(db, platform, data_type, mode)
+        checkpoint = get_sync_checkpoint(db, platform, data_type, mode)
+        if checkpoint is not None and last_sync_ts is not None and checkpoint[0][1] <= last_sync_ts:
+            checkpoint = None # 断点所在子窗口已被水位覆盖
         if last_sync_ts is None:
             # TODO: 从配置或固定值读取初始同步时间
             # 暂定为1天前
@@ -115,98 +391,109 @@ def run_incremental_sync():
         # 结束时间用运行开始时间，避免遗漏运行期间产生的数据
         end_sync_dt = start_run_time
 
-        # 转换为 API 需要的字符串格式 (YYYY-MM-DD HH:MM:SS)
-        # 加一点点缓冲，避免精度问题导致重复获取边界数据
-        start_time_str = (start_sync_dt + timedelta(seconds=1)).strftime("%Y-%m-%d %H:%M:%S")
-        end_time_str = end_sync_dt.strftime("%Y-%m-%d %H:%M:%S")
+        # 按 SYNC_CHECKPOINT_WINDOW_HOURS 切分为子窗口按时间顺序拉取，每个子窗口写完后推进水位；
+        # 有断点时从断点所在子窗口继续 (起点加 1 秒，避免重复获取上次的边界数据)
+        window_days = settings.SYNC_CHECKPOINT_WINDOW_HOURS / 24
+        resume_offset = 0
+        if checkpoint is not None:
+            resume_window, loaded_offset = checkpoint
+            if fetch_mode in PAGE_RESUMABLE_FETCH_MODES:
+                resume_offset = loaded_offset # 在 fetch_pages 中按实际每页数量回退并对齐页边界
+            logger.info(f"Resuming incremental sync from checkpoint: window {resume_window[0].strftime(TIME_FORMAT)} - "
+                        f"{resume_window[1].strftime(TIME_FORMAT)}, {loaded_offset} orders already loaded.")
+            windows = [resume_window] + plan_time_windows(resume_window[1] + timedelta(seconds=1), end_sync_dt, chunk_days=window_days)
+        else:
+            windows = plan_time_windows(start_sync_dt + timedelta(seconds=1), end_sync_dt, chunk_days=window_days)
         
-        # 2. 初始化 API Client
-        client = XiaoeClient()
+        # 2. 初始化 API Client (未传入共享 client 时自行创建)
+        if owns_client:
+            client = XiaoeClient()
         
-        # 3. 分页获取订单数据
-        page = 1
-        page_size = 50 # 每次请求获取的数量
-        all_orders = []
-        all_order_items = []
-        total_orders_fetched = 0
+        # 商品缓存：订单明细缺少商品名称时从缓存补全，不额外调用 API
+        product_cache = get_product_cache()
+
+        # 3. 分页获取订单数据，经流水线转换并分批写库 (写库与后续页面的 API 请求并行，内存占用不随时间范围增长)
+        page_size = None # 每次请求获取的数量，由 client 按 XIAOE_PAGE_SIZE / 自动调整选择
+        progress = {'page': 0, 'orders_fetched': 0, 'orders_loaded': 0, 'items_loaded': 0}
         latest_order_created_at = None # 记录本次同步到的最新订单时间
-        
-        while True:
-            # logger.info(f"Fetching page {page} of orders (state=2, size={page_size}) from {start_time_str} to {end_time_str}")
-            try:
+
+        def fetch_pages():
+            for index, window in enumerate(windows):
+                offset, window_page_size = 0, page_size
+                if index == 0 and resume_offset:
+                    # 按本次实际使用的每页数量多回退一页并对齐页边界，容忍断点之后订单状态变化导致的结果集位移
+                    # (重复的订单由 UPSERT 幂等处理)；该子窗口固定这一每页数量，保证断点偏移量与接口页码一致
+                    window_page_size = page_size or client.get_page_size()
+                    offset = max(0, resume_offset - window_page_size) // window_page_size * window_page_size
+                    logger.info(f"Resuming at offset {offset} (page size {window_page_size}).")
+                start_time_str, end_time_str = window[0].strftime(TIME_FORMAT), window[1].strftime(TIME_FORMAT)
                 # 恢复使用 order_state=2 获取支付成功的订单 (根据文档 1.0.2)
-                logger.info(f"Fetching page {page} of PAID orders (state=2, size={page_size}) from {start_time_str} to {end_time_str}")
-                response_data = client.get_orders(page=page, page_size=page_size, start_time=start_time_str, end_time=end_time_str, order_state=2)
-                # 移除之前的临时代码
-                # logger.info(f"Temporarily fetching ALL order states for page {page} to bypass API error 40004.")
-                # response_data = client.get_orders(page=page, page_size=page_size, start_time=start_time_str, end_time=end_time_str)
-
-                orders_in_page = response_data.get('list', [])
-                # API可能不返回total_count，或者不准确，依赖 list 是否为空
-                # total_count = response_data.get('total_count', 0)
-                
-                if not orders_in_page:
-                    logger.info("No more orders found in this page/range.")
-                    break
-                    
-                total_orders_fetched += len(orders_in_page)
-                logger.info(f"Fetched {len(orders_in_page)} orders on page {page}. Total fetched so far: {total_orders_fetched}")
-                
-                # 4. 转换数据
-                for order_raw in orders_in_page:
-                    order_transformed = transform_order(order_raw)
-                    if order_transformed:
-                        all_orders.append(order_transformed)
-                        # 同时提取订单项
-                        items_transformed = transform_order_items(order_raw)
-                        if items_transformed:
-                            all_order_items.extend(items_transformed)
-                        # 更新本次同步到的最新订单创建时间
-                        if order_transformed.get('created_at'):
-                            current_order_dt = order_transformed['created_at']
-                            if latest_order_created_at is None or current_order_dt > latest_order_created_at:
-                                latest_order_created_at = current_order_dt
-                
-                # 判断是否需要继续获取下一页 (小鹅通常规分页逻辑)
-                # 如果返回的列表数量小于请求的page_size，说明是最后一页了
-                if len(orders_in_page) < page_size:
-                    logger.info("Fetched less orders than page size, assuming last page.")
-                    break
-                
-                page += 1
-                if page > 500: # Max page limit
-                    logger.warning("Reached maximum page limit (500). Stopping fetch.")
-                    break
-                time.sleep(0.5) # API rate limit
-                
-            except (XiaoeAuthError, XiaoeRequestError) as api_error:
-                error_message = f"API error fetching page {page}: {api_error}"
-                logger.error(error_message, exc_info=True)
-                raise # 重新抛出，让外层 try 处理状态更新
-            except Exception as fetch_error:
-                error_message = f"Unexpected error fetching page {page}: {fetch_error}"
-                logger.error(error_message, exc_info=True)
-                raise
-                
-        # 5. 加载数据到数据库
-        if all_orders:
-            logger.info(f"Upserting {len(all_orders)} transformed orders...")
-            upsert_data(db, Order, all_orders)
+                logger.info(f"Fetching PAID orders (state=2, size={window_page_size or 'auto'}, mode={fetch_mode}) from {start_time_str} to {end_time_str}")
+                for page, orders_in_page in iter_order_pages(client, start_time_str, end_time_str, order_state=2,
+                                                             page_size=window_page_size, fetch_mode=fetch_mode,
+                                                             concurrency=concurrency, start_offset=offset):
+                    # stream 模式的页面是流式迭代器，在抓取线程中读完后再交给转换阶段
+                    orders_in_page = list(orders_in_page)
+                    offset += len(orders_in_page)
+                    yield page, orders_in_page, (window, offset, False)
+                yield None, [], (window, offset, True) # 子窗口已全部拉取
+
+        def transform_page(unit):
+            # 4. 转换数据 (在转换线程中执行)
+            nonlocal latest_order_created_at
+            page, orders_in_page, position = unit
+            orders, order_items = [], []
+            for order_raw in orders_in_page:
+                order_transformed = transform_order(order_raw)
+                if order_transformed:
+                    orders.append(order_transformed)
+                    # 同时提取订单项
+                    items_transformed = transform_order_items(order_raw, product_cache)
+                    if items_transformed:
+                        order_items.extend(items_transformed)
+                    # 更新本次同步到的最新订单创建时间
+                    if order_transformed.get('created_at'):
+                        current_order_dt = order_transformed['created_at']
+                        if latest_order_created_at is None or current_order_dt > latest_order_created_at:
+                            latest_order_created_at = current_order_dt
+            if page is not None:
+                progress['page'] = page
+                progress['orders_fetched'] += len(orders_in_page)
+                logger.info(f"Fetched {len(orders_in_page)} orders on page {page}. Total fetched so far: {progress['orders_fetched']}")
+            # 订单在前：订单明细外键依赖订单；positions 记录批次中各页之后的断点位置
+            return {'orders': orders, 'order_items': order_items, 'positions': [position]}
+
+        def load_batch(batch):
+            # 5. 加载数据到数据库 (在当前线程中执行，使用本次同步的 session)
+            if batch['orders']:
+                logger.info(f"Upserting {len(batch['orders'])} transformed orders...")
+                upsert_data(db, Order, batch['orders'])
+                progress['orders_loaded'] += len(batch['orders'])
+            if batch['order_items']:
+                logger.info(f"Upserting {len(batch['order_items'])} transformed order items...")
+                upsert_data(db, OrderItem, batch['order_items'])
+                progress['items_loaded'] += len(batch['order_items'])
+            # 批次写入后记录断点；批次中已全部写完的子窗口推进水位
+            window, offset, window_done = batch['positions'][-1]
+            completed = [position[0][1] for position in batch['positions'] if position[2]]
+            save_sync_progress(db, platform, data_type, mode, None if window_done else window, offset,
+                               watermark=completed[-1] if completed else None)
+
+        try:
+            run_pipeline(fetch_pages(), transform_page, load_batch)
+        except (XiaoeAuthError, XiaoeRequestError) as api_error:
+            error_message = f"API error fetching page {progress['page'] + 1}: {api_error}"
+            logger.error(error_message, exc_info=True)
+            raise # 重新抛出，让外层 try 处理状态更新
+
+        if progress['orders_loaded']:
+            logger.info(f"Upserted {progress['orders_loaded']} orders and {progress['items_loaded']} order items.")
         else:
             logger.info("No new valid orders to upsert.")
-            
-        if all_order_items:
-            logger.info(f"Upserting {len(all_order_items)} transformed order items...")
-            # 假设 upsert_data 可以处理 OrderItem (基于唯一键 uk_order_product)
-            # 如果 loaders.py 中的 upsert 未针对此唯一键优化，这里可能效率不高或行为不符合预期
-            # 需要确认 loaders.py 的实现是否处理了这种情况
-            # 临时策略：MVP阶段，我们相信增量只带来新数据，直接UPSERT
-            upsert_data(db, OrderItem, all_order_items)
-        else:
-            logger.info("No new valid order items to upsert.")
 
-        # 6. 如果成功，设置状态为 success
+        # 6. 如果成功，设置状态为 success 并清除断点
         sync_status = "success"
+        save_sync_progress(db, platform, data_type, mode, None)
         # 更新时间戳：用本次运行开始时间作为下次起点，确保不会遗漏
         new_last_sync_ts = end_sync_dt
         # 或者，用本次获取到的最新订单时间作为下次起点 (需要API保证顺序)
@@ -219,8 +506,8 @@ def run_incremental_sync():
         if not error_message: # 如果错误发生在 upsert 阶段
             error_message = f"Error during data processing or upsert: {e}"
         logger.error(f"Xiaoe incremental order sync failed: {error_message}", exc_info=True)
-        # 失败时不更新 new_last_sync_ts，保留上一次成功的时间戳
-        new_last_sync_ts = last_sync_ts
+        # 失败时不覆盖水位：保留上次成功的时间戳，或本次已按子窗口推进的位置 (断点保留，下次从断点继续)
+        new_last_sync_ts = None
 
     finally:
         # 7. 更新同步状态表
@@ -229,89 +516,275 @@ def run_incremental_sync():
                            sync_status, error_message, 
                            start_run_time, end_run_time, 
                            new_last_sync_ts)
+        record_sync_run(db, platform, data_type, mode, sync_status, error_message,
+                        start_run_time, end_run_time, metrics_before)
         db.close() # 关闭 session
         logger.info("Database session closed for incremental sync.")
+        if owns_client and client is not None:
+            client.close()
+    return sync_status
+
+def _order_id_of(record: Dict[str, Any]) -> Optional[str]:
+    """从订单或售后单记录中取出 order_id (顶层或 order_info 中)。"""
+    return record.get('order_id') or (record.get('order_info') or {}).get('order_id')
 
-def run_status_update_sync():
-    """执行小鹅通近期订单的状态更新。"""
+def iter_changed_orders(client: XiaoeClient, start_time_str: str, end_time_str: str,
+                        concurrency: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    产出 [start_time_str, end_time_str] 内发生变化的订单原始数据 (按 order_id 去重)。
+
+    变化来源：
+        1. 订单列表按更新时间过滤 (配置了 XIAOE_ORDER_UPDATE_TIME_PARAMS 时)，直接得到完整订单；
+        2. 售后单列表 (XIAOE_AFTER_SALES_FEED)，收集其关联的 order_id，再并发获取其余订单的详情。
+           配置了 XIAOE_AFTER_SALES_UPDATE_TIME_PARAMS 时按售后单更新时间查询；否则接口只能按售后单创建时间过滤，
+           起点提前 XIAOE_AFTER_SALES_LOOKBACK_HOURS 小时，以发现之前发起、在本时间范围内才完成的退款。
+    API 调用次数只与变化的订单数有关。
+    """
+    use_updated_filter = client.supports_updated_time_filter()
+    if not use_updated_filter and not settings.XIAOE_AFTER_SALES_FEED:
+        raise ValueError("No change source configured: set XIAOE_ORDER_UPDATE_TIME_PARAMS or enable XIAOE_AFTER_SALES_FEED.")
+    seen = set()
+
+    if use_updated_filter:
+        page_size = client.get_page_size()
+        page = 1
+        while True:
+            response_data = client.get_orders(page=page, page_size=page_size,
+                                              updated_start_time=start_time_str, updated_end_time=end_time_str)
+            orders_in_page = response_data.get('list', []) or []
+            for order_raw in orders_in_page:
+                order_id = _order_id_of(order_raw)
+                if order_id in seen:
+                    continue
+                seen.add(order_id)
+                yield order_raw
+            if len(orders_in_page) < page_size:
+                break
+            page += 1
+            if page > 500: # Max page limit
+                logger.warning("Reached maximum page limit (500) for updated orders. Stopping fetch.")
+                break
+        logger.info(f"Found {len(seen)} orders updated from {start_time_str} to {end_time_str}.")
+
+    if settings.XIAOE_AFTER_SALES_FEED:
+        page_size = settings.XIAOE_PAGE_SIZE
+        if client.supports_after_sales_updated_filter():
+            time_filter = {'updated_start_time': start_time_str, 'updated_end_time': end_time_str}
+        else:
+            lookback_start = datetime.strptime(start_time_str, TIME_FORMAT) - timedelta(hours=settings.XIAOE_AFTER_SALES_LOOKBACK_HOURS)
+            time_filter = {'start_time': lookback_start.strftime(TIME_FORMAT), 'end_time': end_time_str}
+        changed_order_ids = []
+        page = 1
+        while True:
+            response_data = client.get_after_sales(page=page, page_size=page_size, **time_filter)
+            records = response_data.get('list', []) or []
+            for record in records:
+                order_id = _order_id_of(record)
+                if order_id and order_id not in seen:
+                    seen.add(order_id)
+                    changed_order_ids.append(order_id)
+            if len(records) < page_size:
+                break
+            page += 1
+            if page > 500: # Max page limit
+                logger.warning("Reached maximum page limit (500) for after-sales records. Stopping fetch.")
+                break
+        logger.info(f"Found {len(changed_order_ids)} more orders with after-sales activity from {start_time_str} to {end_time_str}.")
+        if changed_order_ids:
+            yield from client.get_order_details(changed_order_ids, max_workers=concurrency).values()
+
+def find_pending_orders(db: SessionLocal, platform: str, since: datetime) -> List[Any]:
+    """
+    找出 since 之后创建、状态仍可能变化的订单：order_state 不在 XIAOE_FINAL_ORDER_STATES 中，
+    且未全额退款 (refund_money >= price 视为终态)。
+
+    Returns:
+        (order_id, created_at, order_state, refund_money) 行的列表。
+    """
+    final_states = [int(state) for state in settings.XIAOE_FINAL_ORDER_STATES.split(',') if state.strip().isdigit()]
+    fully_refunded = and_(Order.price > 0, Order.refund_money >= Order.price)
+    query = db.query(Order.order_id, Order.created_at, Order.order_state, Order.refund_money).filter(
+        Order.platform == platform,
+        Order.tenant == settings.XIAOE_TENANT,
+        Order.created_at >= since.replace(tzinfo=None), # 数据库存储 naive UTC
+        not_(fully_refunded),
+    )
+    if final_states:
+        query = query.filter(or_(Order.order_state.is_(None), Order.order_state.notin_(final_states)))
+    return query.all()
+
+def refresh_pending_orders(db: SessionLocal, client: XiaoeClient, platform: str, since: datetime,
+                           concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    重新获取非终态订单的最新数据，返回状态或退款金额确实发生变化的已转换订单。
+
+    待刷新订单按创建时间聚成紧凑窗口 (间隔不超过 STATUS_REFRESH_MAX_GAP_MINUTES)。
+    对每个窗口比较两种方式的请求数：按窗口拉取订单列表 (页数按库中该窗口的订单数估算)，
+    或逐单调用订单详情接口，取较少者。列表中未出现的待刷新订单再逐单获取详情。
+    """
+    pending = find_pending_orders(db, platform, since)
+    logger.info(f"Found {len(pending)} non-final orders created since {since.strftime(TIME_FORMAT)} to refresh.")
+    if not pending:
+        return []
+    stored = {row.order_id: row for row in pending}
+    windows = plan_refresh_windows([(row.order_id, row.created_at) for row in pending],
+                                   timedelta(minutes=settings.STATUS_REFRESH_MAX_GAP_MINUTES))
+
+    refreshed: Dict[str, Any] = {}
+    detail_ids: List[str] = []
+    page_size = client.get_page_size()
+    list_windows = 0
+    for (window_start, window_end), order_ids in windows:
+        if len(order_ids) > 1:
+            orders_in_window = db.query(func.count()).select_from(Order).filter(
+                Order.platform == platform, Order.tenant == settings.XIAOE_TENANT,
+                Order.created_at >= window_start, Order.created_at <= window_end).scalar()
+            if math.ceil(orders_in_window / page_size) < len(order_ids):
+                list_windows += 1
+                wanted = set(order_ids)
+                for orders_in_page in fetch_order_pages_by_window(client, window_start.strftime(TIME_FORMAT),
+                                                                  window_end.strftime(TIME_FORMAT),
+                                                                  page_size=page_size, max_workers=concurrency):
+                    for order_raw in orders_in_page:
+                        order_id = _order_id_of(order_raw)
+                        if order_id in wanted:
+                            refreshed[order_id] = order_raw
+                detail_ids.extend(order_id for order_id in order_ids if order_id not in refreshed)
+                continue
+        detail_ids.extend(order_ids)
+    logger.info(f"Refreshing {len(pending)} orders: {list_windows} windows via the orders list, {len(detail_ids)} via order detail.")
+    refreshed.update(client.get_order_details(detail_ids, max_workers=concurrency))
+
+    changed_orders = []
+    for order_id, order_raw in refreshed.items():
+        order_transformed = transform_order(order_raw)
+        if not order_transformed:
+            continue
+        row = stored[order_id]
+        stored_refund = float(row.refund_money) if row.refund_money is not None else 0.0
+        if order_transformed.get('order_state') != row.order_state or \
+                abs((order_transformed.get('refund_money') or 0) - stored_refund) >= 0.005:
+            changed_orders.append(order_transformed)
+    logger.info(f"{len(changed_orders)} of {len(refreshed)} refreshed orders changed state or refund amount.")
+    return changed_orders
+
+@with_sync_lock('order')
+def run_status_update_sync(client: Optional[XiaoeClient] = None, fetch_mode: str = 'serial',
+                           concurrency: Optional[int] = None, status_mode: Optional[str] = None):
+    """
+    执行小鹅通近期订单的状态更新。
+
+    Args:
+        client: 可选的共享 XiaoeClient；未提供时在本次同步内部创建并在结束时关闭。
+        fetch_mode: 分页拉取方式，见 iter_order_pages (仅 rescan 模式使用)。
+        concurrency: 并发拉取时同时在途的请求数。
+        status_mode: 'rescan' 重新拉取最近 STATUS_UPDATE_DAYS 天创建的全部订单；
+                     'changes' 只拉取上次成功运行 (SyncStatus 水位) 之后发生变化的订单，
+                     没有水位时先执行一次 rescan；
+                     'pending' 只刷新库中最近 STATUS_UPDATE_DAYS 天内非终态的订单，只写入确有变化的订单
+                     (默认从 settings.STATUS_UPDATE_MODE 读取)。
+    """
     logger.info("Starting Xiaoe order status update sync...")
     start_run_time = datetime.now(timezone.utc)
+    metrics_before = metrics.REGISTRY.snapshot()
     platform = "xiaoe"
     data_type = "order"
     mode = "status_update"
+    status_mode = status_mode or settings.STATUS_UPDATE_MODE
     db = SessionLocal()
     sync_status = "failed"
     error_message = None
+    new_watermark = None # 成功时更新为本次运行开始时间
+    owns_client = client is None
     
     try:
         # 1. 确定要检查的时间范围
-        update_days = settings.STATUS_UPDATE_DAYS
-        start_scan_dt = start_run_time - timedelta(days=update_days)
+        watermark = get_last_sync_timestamp(db, platform, data_type, mode) if status_mode == 'changes' else None
+        if watermark is not None:
+            # 回退一小段时间，容忍时钟偏差和平台延迟写入 (重复的订单由 UPSERT 幂等处理)
+            start_scan_dt = watermark - timedelta(minutes=settings.STATUS_CHANGE_OVERLAP_MINUTES)
+        else:
+            if status_mode == 'changes':
+                logger.warning(f"No status update watermark found. Rescanning the last {settings.STATUS_UPDATE_DAYS} days once.")
+            start_scan_dt = start_run_time - timedelta(days=settings.STATUS_UPDATE_DAYS)
         end_scan_dt = start_run_time # 扫描到当前
 
         start_time_str = start_scan_dt.strftime("%Y-%m-%d %H:%M:%S")
         end_time_str = end_scan_dt.strftime("%Y-%m-%d %H:%M:%S")
-        logger.info(f"Checking order status updates created from {start_time_str} to {end_time_str}")
 
-        # 2. 初始化 API Client
-        client = XiaoeClient()
+        # 2. 初始化 API Client (未传入共享 client 时自行创建)
+        if owns_client:
+            client = XiaoeClient()
 
-        # 3. 分页获取近期创建的订单
-        page = 1
-        page_size = 50
+        # 3. 获取需要更新的订单
+        page = 0
+        page_size = None # 由 client 按 XIAOE_PAGE_SIZE / 自动调整选择
         all_orders_to_update = []
         total_orders_fetched = 0
+        total_orders_loaded = 0 # rescan 模式在流水线中分批写入
         
-        while True:
-            logger.info(f"Fetching page {page} of recent orders (size={page_size}) for status update...")
-            try:
-                # 获取该时间段内创建的所有状态的订单
-                response_data = client.get_orders(page=page, page_size=page_size, start_time=start_time_str, end_time=end_time_str)
-                
-                orders_in_page = response_data.get('list', [])
-                # total_count = response_data.get('total_count', 0)
-                
-                if not orders_in_page:
-                    logger.info("No more recent orders found.")
-                    break
-                    
-                total_orders_fetched += len(orders_in_page)
-                logger.info(f"Fetched {len(orders_in_page)} recent orders on page {page}. Total fetched: {total_orders_fetched}")
-                
-                # 4. 转换数据
-                for order_raw in orders_in_page:
+        try:
+            if status_mode == 'pending':
+                all_orders_to_update = refresh_pending_orders(db, client, platform, start_scan_dt, concurrency=concurrency)
+                total_orders_fetched = len(all_orders_to_update)
+            elif watermark is not None:
+                logger.info(f"Fetching orders changed from {start_time_str} to {end_time_str}")
+                for order_raw in iter_changed_orders(client, start_time_str, end_time_str, concurrency=concurrency):
+                    total_orders_fetched += 1
                     order_transformed = transform_order(order_raw)
                     if order_transformed:
                         all_orders_to_update.append(order_transformed)
+                logger.info(f"Fetched {total_orders_fetched} changed orders.")
+            else:
+                logger.info(f"Checking order status updates created from {start_time_str} to {end_time_str}")
+                # 获取该时间段内创建的所有状态的订单，经流水线转换并分批写库
+                logger.info(f"Fetching recent orders (size={page_size or 'auto'}, mode={fetch_mode}) for status update...")
+
+                def fetch_pages():
+                    for page, orders_in_page in iter_order_pages(client, start_time_str, end_time_str,
+                                                                 page_size=page_size, fetch_mode=fetch_mode,
+                                                                 concurrency=concurrency):
+                        yield page, list(orders_in_page) # 流式页面在抓取线程中读完
+
+                def transform_page(unit):
+                    # 4. 转换数据
+                    nonlocal page, total_orders_fetched
+                    page, orders_in_page = unit
+                    orders = [o for o in (transform_order(order_raw) for order_raw in orders_in_page) if o]
+                    total_orders_fetched += len(orders_in_page)
+                    logger.info(f"Fetched {len(orders_in_page)} recent orders on page {page}. Total fetched: {total_orders_fetched}")
+                    return {'orders': orders}
+
+                def load_batch(batch):
+                    nonlocal total_orders_loaded
+                    if batch['orders']:
+                        logger.info(f"Upserting {len(batch['orders'])} orders for status update...")
+                        upsert_data(db, Order, batch['orders'])
+                        total_orders_loaded += len(batch['orders'])
+
+                run_pipeline(fetch_pages(), transform_page, load_batch)
                 
-                if len(orders_in_page) < page_size:
-                    logger.info("Fetched less orders than page size, assuming last page for status update.")
-                    break
-                
-                page += 1
-                if page > 500: # Max page limit
-                    logger.warning("Reached maximum page limit (500) for status update scan.")
-                    break
-                time.sleep(0.5)
-                
-            except (XiaoeAuthError, XiaoeRequestError) as api_error:
-                error_message = f"API error during status update fetch page {page}: {api_error}"
-                logger.error(error_message, exc_info=True)
-                raise
-            except Exception as fetch_error:
-                error_message = f"Unexpected error during status update fetch page {page}: {fetch_error}"
-                logger.error(error_message, exc_info=True)
-                raise
+        except (XiaoeAuthError, XiaoeRequestError) as api_error:
+            error_message = f"API error during status update fetch page {page + 1}: {api_error}"
+            logger.error(error_message, exc_info=True)
+            raise
+        except Exception as fetch_error:
+            error_message = f"Unexpected error during status update fetch page {page + 1}: {fetch_error}"
+            logger.error(error_message, exc_info=True)
+            raise
                 
         # 5. 加载数据到数据库 (UPSERT 会自动更新已有订单)
         if all_orders_to_update:
             logger.info(f"Upserting {len(all_orders_to_update)} orders for status update...")
             upsert_data(db, Order, all_orders_to_update)
+        elif total_orders_loaded:
+            logger.info(f"Upserted {total_orders_loaded} orders for status update.")
         else:
             logger.info("No recent orders found or processed for status update.")
 
-        # 6. 成功
+        # 6. 成功：本次运行开始时间作为下次 changes 模式的起点
         sync_status = "success"
+        new_watermark = start_run_time
         logger.info("Xiaoe order status update sync completed successfully.")
 
     except Exception as e:
@@ -321,14 +794,542 @@ def run_status_update_sync():
         logger.error(f"Xiaoe order status update sync failed: {error_message}", exc_info=True)
     
     finally:
-        # 7. 更新同步状态表 (状态更新任务不更新 last_sync_timestamp)
+        # 7. 更新同步状态表 (仅成功时推进水位)
         end_run_time = datetime.now(timezone.utc)
         update_sync_status(db, platform, data_type, mode, 
                            sync_status, error_message, 
                            start_run_time, end_run_time, 
-                           None) # 不更新 last_sync_timestamp
+                           new_watermark)
+        record_sync_run(db, platform, data_type, mode, sync_status, error_message,
+                        start_run_time, end_run_time, metrics_before)
         db.close()
         logger.info("Database session closed for status update sync.")
+        if owns_client and client is not None:
+            client.close()
+    return sync_status
+
+PAID_ORDER_STATE = 2 # 增量同步只拉取的订单状态 (支付成功)
+
+@with_sync_lock('order')
+def run_combined_order_sync(client: Optional[XiaoeClient] = None, fetch_mode: str = 'serial',
+                            concurrency: Optional[int] = None):
+    """
+    一次拉取同时完成增量同步和 rescan 状态更新 (--sync-type all)。
+
+    增量窗口 (上次水位之后) 通常落在状态更新的 STATUS_UPDATE_DAYS 天窗口之内，分别运行时这部分订单会被拉取两次。
+    这里对两个窗口的并集只拉取一遍所有状态的订单，每页同时交给两个消费方：
+    增量窗口内的支付成功订单写入订单和订单明细 (与 run_incremental_sync 相同)，
+    状态更新窗口内的全部订单写入订单 (与 rescan 相同)。增量窗口按 SYNC_CHECKPOINT_WINDOW_HOURS 切分，
+    每个子窗口写完后推进增量水位；成功后两个任务的 sync_status 都会更新。
+    """
+    logger.info("Starting Xiaoe combined incremental + status update sync (shared fetch)...")
+    start_run_time = datetime.now(timezone.utc)
+    metrics_before = metrics.REGISTRY.snapshot()
+    platform = "xiaoe"
+    data_type = "order"
+    db = SessionLocal()
+    sync_status = "failed"
+    error_message = None
+    owns_client = client is None
+
+    try:
+        # 1. 两个窗口：增量 (上次水位之后，没有水位时为 1 天前) 与状态更新 (最近 STATUS_UPDATE_DAYS 天)
+        last_sync_ts = get_last_sync_timestamp(db, platform, data_type, "incremental")
+        if last_sync_ts is None:
+            incremental_start = start_run_time - timedelta(days=1)
+            logger.warning(f"No last sync timestamp found. Starting incremental part from {incremental_start.isoformat()}")
+        else:
+            incremental_start = last_sync_ts + timedelta(seconds=1)
+        incremental_start = incremental_start.replace(microsecond=0)
+        status_start = (start_run_time - timedelta(days=settings.STATUS_UPDATE_DAYS)).replace(microsecond=0)
+        end_sync_dt = start_run_time
+
+        # 状态更新窗口中早于增量窗口的部分作为一个整体查询，增量部分按子窗口推进水位
+        windows = plan_time_windows(incremental_start, end_sync_dt, chunk_days=settings.SYNC_CHECKPOINT_WINDOW_HOURS / 24)
+        if status_start < incremental_start:
+            windows.insert(0, (status_start, incremental_start - timedelta(seconds=1)))
+        logger.info(f"Shared fetch of all order states from {windows[0][0].strftime(TIME_FORMAT) if windows else '-'} "
+                    f"to {end_sync_dt.strftime(TIME_FORMAT)} in {len(windows)} windows "
+                    f"(incremental from {incremental_start.strftime(TIME_FORMAT)}, status from {status_start.strftime(TIME_FORMAT)}).")
+
+        if owns_client:
+            client = XiaoeClient()
+        product_cache = get_product_cache()
+
+        # 2. 每页只拉取一次，按窗口分发给两个消费方，经流水线分批写库
+        page_size = None
+        progress = {'page': 0, 'orders_fetched': 0, 'orders_loaded': 0, 'items_loaded': 0}
+
+        def fetch_pages():
+            for window in windows:
+                start_time_str, end_time_str = window[0].strftime(TIME_FORMAT), window[1].strftime(TIME_FORMAT)
+                logger.info(f"Fetching orders (all states, size={page_size or 'auto'}, mode={fetch_mode}) from {start_time_str} to {end_time_str}")
+                for page, orders_in_page in iter_order_pages(client, start_time_str, end_time_str, page_size=page_size,
+                                                             fetch_mode=fetch_mode, concurrency=concurrency):
+                    yield page, list(orders_in_page), window, False
+                yield None, [], window, True # 窗口已全部拉取
+
+        def transform_page(unit):
+            page, orders_in_page, window, window_done = unit
+            for_incremental = window[0] >= incremental_start # 增量消费方：支付成功订单 + 明细
+            for_status = window[1] >= status_start # 状态更新消费方：全部订单
+            orders, order_items = [], []
+            for order_raw in orders_in_page:
+                order_transformed = transform_order(order_raw)
+                if not order_transformed:
+                    continue
+                paid = order_transformed.get('order_state') == PAID_ORDER_STATE
+                if for_status or (for_incremental and paid):
+                    orders.append(order_transformed)
+                if for_incremental and paid:
+                    items_transformed = transform_order_items(order_raw, product_cache)
+                    if items_transformed:
+                        order_items.extend(items_transformed)
+            if page is not None:
+                progress['page'] = page
+                progress['orders_fetched'] += len(orders_in_page)
+                logger.info(f"Fetched {len(orders_in_page)} orders on page {page}. Total fetched so far: {progress['orders_fetched']}")
+            completed = [window[1]] if window_done and for_incremental else []
+            return {'orders': orders, 'order_items': order_items, 'completed': completed}
+
+        def load_batch(batch):
+            if batch['orders']:
+                upsert_data(db, Order, batch['orders'])
+                progress['orders_loaded'] += len(batch['orders'])
+            if batch['order_items']:
+                upsert_data(db, OrderItem, batch['order_items'])
+                progress['items_loaded'] += len(batch['order_items'])
+            if batch['completed']:
+                # 增量子窗口按时间顺序完成，直接推进增量水位
+                save_sync_progress(db, platform, data_type, "incremental", None, watermark=batch['completed'][-1])
+
+        try:
+            run_pipeline(fetch_pages(), transform_page, load_batch)
+        except (XiaoeAuthError, XiaoeRequestError) as api_error:
+            error_message = f"API error fetching page {progress['page'] + 1}: {api_error}"
+            logger.error(error_message, exc_info=True)
+            raise
+
+        sync_status = "success"
+        save_sync_progress(db, platform, data_type, "incremental", None) # 清除单独运行增量同步时遗留的断点
+        logger.info(f"Xiaoe combined order sync completed successfully: {progress['orders_fetched']} orders fetched once, "
+                    f"{progress['orders_loaded']} orders and {progress['items_loaded']} order items upserted.")
+
+    except Exception as e:
+        sync_status = "failed"
+        if not error_message:
+            error_message = f"Error during data processing or upsert: {e}"
+        logger.error(f"Xiaoe combined order sync failed: {error_message}", exc_info=True)
+
+    finally:
+        # 两个任务各自的状态记录；失败时不覆盖水位 (增量水位已按子窗口推进)
+        end_run_time = datetime.now(timezone.utc)
+        succeeded = sync_status == "success"
+        update_sync_status(db, platform, data_type, "incremental", sync_status, error_message,
+                           start_run_time, end_run_time, end_sync_dt if succeeded else None)
+        update_sync_status(db, platform, data_type, "status_update", sync_status, error_message,
+                           start_run_time, end_run_time, start_run_time if succeeded else None)
+        record_sync_run(db, platform, data_type, "combined", sync_status, error_message,
+                        start_run_time, end_run_time, metrics_before)
+        db.close()
+        logger.info("Database session closed for combined order sync.")
+        if owns_client and client is not None:
+            client.close()
+    return sync_status
+
+def parse_date_arg(value: str, end_of_day: bool = False) -> datetime:
+    """解析命令行日期 (YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS，UTC)；只给日期时 end_of_day 表示当天最后一秒。"""
+    try:
+        dt = datetime.strptime(value, TIME_FORMAT)
+    except ValueError:
+        dt = datetime.strptime(value, "%Y-%m-%d")
+        if end_of_day:
+            dt += timedelta(days=1, seconds=-1)
+    return dt.replace(tzinfo=timezone.utc)
+
+@with_sync_lock('order_backfill')
+def run_backfill_sync(start_dt: datetime, end_dt: datetime, client: Optional[XiaoeClient] = None,
+                      concurrency: Optional[int] = None):
+    """
+    回填 [start_dt, end_dt] 内的历史订单 (所有状态)。
+
+    时间范围按 XIAOE_WINDOW_CHUNK_DAYS 切分为子窗口，由 concurrency 个线程并行拉取 (订单多的窗口继续对半拆分)，
+    经流水线分批写库。从 start_dt 起已连续写完到的时间记入断点 (loaded_through)，并同步为 backfill 模式的水位；
+    同一起点的回填中断后重新运行时只从断点继续 (水位可能来自起点不同的其他回填，不作为续传依据)；
+    每写完一个窗口输出进度和预计剩余时间。
+
+    持有 order_backfill 锁 (同一时间只运行一个回填)，不占用 order 锁：断点和水位记在 backfill 模式下，
+    与增量同步互不影响，两者重叠写入的订单由 UPSERT 幂等处理。
+    """
+    platform = "xiaoe"
+    data_type = "order"
+    mode = "backfill"
+    start_dt, end_dt = start_dt.replace(microsecond=0), end_dt.replace(microsecond=0)
+    if end_dt < start_dt:
+        raise ValueError(f"Backfill end {end_dt.strftime(TIME_FORMAT)} is before start {start_dt.strftime(TIME_FORMAT)}.")
+    logger.info(f"Starting Xiaoe order backfill from {start_dt.strftime(TIME_FORMAT)} to {end_dt.strftime(TIME_FORMAT)}...")
+    start_run_time = datetime.now(timezone.utc)
+    metrics_before = metrics.REGISTRY.snapshot()
+    db = SessionLocal()
+    sync_status = "failed"
+    error_message = None
+    new_watermark = None # 成功时为 end_dt；失败时保留已推进的位置
+    owns_client = client is None
+
+    try:
+        # 1. 同一起点的未完成回填：从断点中已连续写完的位置继续；否则从 start_dt 开始并重置断点和水位
+        resume_dt = start_dt
+        loaded_position = get_backfill_position(db, platform, data_type, start_dt)
+        if loaded_position is not None and start_dt <= loaded_position:
+            resume_dt = loaded_position + timedelta(seconds=1)
+            logger.info(f"Resuming backfill: orders up to {loaded_position.strftime(TIME_FORMAT)} are already loaded.")
+        if resume_dt > end_dt:
+            logger.info("Backfill range is already fully loaded.")
+            windows = []
+        else:
+            windows = plan_time_windows(resume_dt, end_dt)
+        save_sync_progress(db, platform, data_type, mode, (start_dt, end_dt),
+                           watermark=resume_dt - timedelta(seconds=1), loaded_through=resume_dt - timedelta(seconds=1))
+
+        if owns_client:
+            client = XiaoeClient()
+        product_cache = get_product_cache()
+
+        # 2. 并行拉取各窗口，经流水线分批写库
+        total_seconds = max((end_dt - resume_dt).total_seconds() + 1, 1)
+        progress = {'covered_seconds': 0.0, 'windows': 0, 'orders_loaded': 0, 'items_loaded': 0}
+        loaded_windows: Dict[datetime, datetime] = {} # 已写完、但与水位尚未连续的窗口：开始 -> 结束
+        loaded_through = resume_dt - timedelta(seconds=1) # 从 start_dt 起已连续写完到的时间
+        started = time.perf_counter()
+
+        def fetch_pages():
+            for window, pages in fetch_order_windows(client, windows, max_workers=concurrency):
+                for orders_in_page in pages:
+                    if orders_in_page:
+                        yield orders_in_page, None
+                yield [], window # 窗口已全部拉取
+
+        def transform_page(unit):
+            orders_in_page, completed_window = unit
+            orders, order_items = [], []
+            for order_raw in orders_in_page:
+                order_transformed = transform_order(order_raw)
+                if order_transformed:
+                    orders.append(order_transformed)
+                    items_transformed = transform_order_items(order_raw, product_cache)
+                    if items_transformed:
+                        order_items.extend(items_transformed)
+            return {'orders': orders, 'order_items': order_items,
+                    'windows': [completed_window] if completed_window else []}
+
+        def load_batch(batch):
+            nonlocal loaded_through
+            if batch['orders']:
+                upsert_data(db, Order, batch['orders'])
+                progress['orders_loaded'] += len(batch['orders'])
+            if batch['order_items']:
+                upsert_data(db, OrderItem, batch['order_items'])
+                progress['items_loaded'] += len(batch['order_items'])
+            if not batch['windows']:
+                return
+            for window_start, window_end in batch['windows']:
+                loaded_windows[window_start] = window_end
+                progress['covered_seconds'] += (window_end - window_start).total_seconds() + 1
+                progress['windows'] += 1
+            # 窗口完成顺序不定，只把与水位首尾相接的部分计入水位
+            previous = loaded_through
+            while loaded_through + timedelta(seconds=1) in loaded_windows:
+                loaded_through = loaded_windows.pop(loaded_through + timedelta(seconds=1))
+            if loaded_through != previous:
+                save_sync_progress(db, platform, data_type, mode, (start_dt, end_dt),
+                                   watermark=loaded_through, loaded_through=loaded_through)
+            fraction = min(progress['covered_seconds'] / total_seconds, 1.0)
+            elapsed = time.perf_counter() - started
+            eta = elapsed / fraction * (1 - fraction) if fraction > 0 else 0
+            logger.info(f"Backfill progress: {fraction:.1%} of the range, {progress['windows']} windows, "
+                        f"{progress['orders_loaded']} orders loaded, contiguous through {loaded_through.strftime(TIME_FORMAT)}, "
+                        f"elapsed {elapsed:.0f}s, ETA {eta:.0f}s")
+
+        try:
+            run_pipeline(fetch_pages(), transform_page, load_batch)
+        except (XiaoeAuthError, XiaoeRequestError) as api_error:
+            error_message = f"API error during backfill: {api_error}"
+            logger.error(error_message, exc_info=True)
+            raise
+
+        # 3. 成功：水位推进到回填结束时间并清除断点
+        sync_status = "success"
+        new_watermark = end_dt
+        save_sync_progress(db, platform, data_type, mode, None)
+        logger.info(f"Xiaoe order backfill completed successfully: {progress['orders_loaded']} orders and "
+                    f"{progress['items_loaded']} order items upserted in {time.perf_counter() - started:.0f}s.")
+
+    except Exception as e:
+        sync_status = "failed"
+        if not error_message:
+            error_message = f"Error during backfill processing or upsert: {e}"
+        logger.error(f"Xiaoe order backfill failed: {error_message}", exc_info=True)
+
+    finally:
+        end_run_time = datetime.now(timezone.utc)
+        update_sync_status(db, platform, data_type, mode,
+                           sync_status, error_message,
+                           start_run_time, end_run_time,
+                           new_watermark)
+        record_sync_run(db, platform, data_type, mode, sync_status, error_message,
+                        start_run_time, end_run_time, metrics_before)
+        db.close()
+        logger.info("Database session closed for backfill.")
+        if owns_client and client is not None:
+            client.close()
+    return sync_status
+
+def find_users_to_sync(db: SessionLocal, platform: str, lookback_days: int, stale_days: int) -> List[str]:
+    """
+    找出需要同步的用户 ID：近 lookback_days 天内写入/更新过的订单中，
+    在 users 表里不存在、或超过 stale_days 天未更新的去重 user_id。
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None) # 数据库存储 naive UTC
+    since = now - timedelta(days=lookback_days)
+    stale_before = now - timedelta(days=stale_days)
+    rows = (
+        db.query(Order.user_id)
+        .outerjoin(User, and_(User.platform == Order.platform, User.user_id == Order.user_id))
+        .filter(Order.platform == platform,
+                Order.tenant == settings.XIAOE_TENANT,
+                Order.updated_at >= since,
+                or_(User.user_id.is_(None), User.updated_at < stale_before))
+        .distinct()
+        .all()
+    )
+    return [row.user_id for row in rows]
+
+@with_sync_lock('user')
+def run_user_sync(client: Optional[XiaoeClient] = None):
+    """
+    执行小鹅通用户维度同步。
+
+    从近期订单中收集缺失或过期的用户，按批次并发获取用户信息 (受限流器约束)，
+    转换后批量 UPSERT 到 users 表。
+
+    Args:
+        client: 可选的共享 XiaoeClient；未提供时在本次同步内部创建并在结束时关闭。
+    """
+    logger.info("Starting Xiaoe user sync...")
+    start_run_time = datetime.now(timezone.utc)
+    metrics_before = metrics.REGISTRY.snapshot()
+    platform = "xiaoe"
+    data_type = "user"
+    mode = "incremental"
+    db = SessionLocal()
+    sync_status = "failed"
+    error_message = None
+    owns_client = client is None
+
+    try:
+        # 1. 找出需要同步的用户
+        user_ids = find_users_to_sync(db, platform, settings.USER_SYNC_LOOKBACK_DAYS, settings.USER_STALE_DAYS)
+        logger.info(f"Found {len(user_ids)} missing or stale users from orders of the last {settings.USER_SYNC_LOOKBACK_DAYS} days.")
+
+        if owns_client:
+            client = XiaoeClient()
+
+        # 2. 按批次并发获取、转换并写入
+        batch_size = settings.USER_SYNC_BATCH_SIZE
+        total_upserted = 0
+        total_failed = 0
+        for batch_start in range(0, len(user_ids), batch_size):
+            batch_ids = user_ids[batch_start:batch_start + batch_size]
+            users_raw = client.get_users_info(batch_ids)
+            total_failed += len(batch_ids) - len(users_raw)
+
+            # 显式写入 updated_at：资料未变化时 MySQL 不会触发 ON UPDATE，用户会一直被视为过期
+            synced_at = datetime.now(timezone.utc).replace(tzinfo=None)
+            users_transformed = []
+            for user_raw in users_raw.values():
+                user_transformed = transform_user(user_raw)
+                if user_transformed:
+                    user_transformed['updated_at'] = synced_at
+                    users_transformed.append(user_transformed)
+
+            if users_transformed:
+                upsert_data(db, User, users_transformed)
+                total_upserted += len(users_transformed)
+            logger.info(f"User batch {batch_start // batch_size + 1}: fetched {len(users_raw)}/{len(batch_ids)}, upserted {len(users_transformed)}.")
+
+        sync_status = "success"
+        if total_failed:
+            error_message = f"{total_failed} users could not be fetched and will be retried next run."
+        logger.info(f"Xiaoe user sync completed successfully. Upserted {total_upserted} users, {total_failed} failed.")
+
+    except Exception as e:
+        sync_status = "failed"
+        error_message = f"Error during user sync: {e}"
+        logger.error(f"Xiaoe user sync failed: {error_message}", exc_info=True)
+
+    finally:
+        end_run_time = datetime.now(timezone.utc)
+        update_sync_status(db, platform, data_type, mode,
+                           sync_status, error_message,
+                           start_run_time, end_run_time,
+                           start_run_time if sync_status == "success" else None)
+        record_sync_run(db, platform, data_type, mode, sync_status, error_message,
+                        start_run_time, end_run_time, metrics_before)
+        db.close()
+        logger.info("Database session closed for user sync.")
+        if owns_client and client is not None:
+            client.close()
+    return sync_status
+
+@with_sync_lock('product')
+def run_product_sync(client: Optional[XiaoeClient] = None):
+    """
+    执行小鹅通商品目录同步。
+
+    分页遍历商品列表接口，按 product_id + 内容哈希对比商品缓存：
+    缓存有效期内内容未变的商品直接跳过，只转换并 UPSERT 新增或变化的商品，
+    同时刷新缓存供订单明细补全商品信息。
+
+    Args:
+        client: 可选的共享 XiaoeClient；未提供时在本次同步内部创建并在结束时关闭。
+    """
+    logger.info("Starting Xiaoe product catalog sync...")
+    start_run_time = datetime.now(timezone.utc)
+    metrics_before = metrics.REGISTRY.snapshot()
+    platform = "xiaoe"
+    data_type = "product"
+    mode = "full"
+    db = SessionLocal()
+    sync_status = "failed"
+    error_message = None
+    owns_client = client is None
+    product_cache = get_product_cache()
+
+    try:
+        if owns_client:
+            client = XiaoeClient()
+
+        page = 1
+        page_size = 50
+        total_fetched = 0
+        total_changed = 0
+        while True:
+            response_data = client.get_products(page=page, page_size=page_size)
+            products_in_page = response_data.get('list', []) or []
+            if not products_in_page:
+                break
+            total_fetched += len(products_in_page)
+
+            changed_products = []
+            changed_hashes = []
+            for product_raw in products_in_page:
+                product_id = product_raw.get('goods_id')
+                if not product_id:
+                    logger.warning(f"Skipping product without goods_id: {product_raw}")
+                    continue
+                content_hash = ProductCache.content_hash(product_raw)
+                if product_cache.is_unchanged(product_id, content_hash):
+                    continue
+                product_transformed = transform_product(product_raw)
+                if product_transformed:
+                    changed_products.append(product_transformed)
+                    changed_hashes.append(content_hash)
+
+            if changed_products:
+                upsert_data(db, Product, changed_products)
+                total_changed += len(changed_products)
+                # 写库成功后再更新缓存，避免写库失败的商品被当作"未变化"跳过
+                for product_transformed, content_hash in zip(changed_products, changed_hashes):
+                    product_cache.put(product_transformed['product_id'], content_hash, product_transformed)
+            logger.info(f"Product page {page}: {len(products_in_page)} fetched, {len(changed_products)} new or changed.")
+
+            if len(products_in_page) < page_size:
+                break
+            page += 1
+            if page > 500: # Max page limit
+                logger.warning("Reached maximum page limit (500) for product sync.")
+                break
+
+        sync_status = "success"
+        logger.info(f"Xiaoe product sync completed successfully. {total_fetched} products scanned, {total_changed} upserted, {total_fetched - total_changed} unchanged.")
+
+    except Exception as e:
+        sync_status = "failed"
+        error_message = f"Error during product sync: {e}"
+        logger.error(f"Xiaoe product sync failed: {error_message}", exc_info=True)
+
+    finally:
+        # 只有已成功写库的商品才会进入缓存，失败时也保存已完成的部分
+        try:
+            product_cache.save()
+        except Exception as cache_error:
+            logger.warning(f"Failed to save product cache: {cache_error}")
+        end_run_time = datetime.now(timezone.utc)
+        update_sync_status(db, platform, data_type, mode,
+                           sync_status, error_message,
+                           start_run_time, end_run_time,
+                           start_run_time if sync_status == "success" else None)
+        record_sync_run(db, platform, data_type, mode, sync_status, error_message,
+                        start_run_time, end_run_time, metrics_before)
+        db.close()
+        logger.info("Database session closed for product sync.")
+        if owns_client and client is not None:
+            client.close()
+    return sync_status
+
+def run_daemon(fetch_mode: str = 'serial', concurrency: Optional[int] = None, status_mode: Optional[str] = None):
+    """
+    常驻进程模式：用 APScheduler 按 ORDERS_SYNC_INTERVAL_MINUTES / STATUS_UPDATE_INTERVAL_HOURS 定时执行增量同步和状态更新，
+    代替每次由 cron 重新启动脚本。进程内的数据库连接池、HTTP 连接池和 access_token 在各次任务之间复用。
+
+    所有任务在同一个工作线程中依次执行：同一任务不会重叠 (max_instances=1)，两个任务也不会同时写 orders 表；
+    积压的多次触发合并为一次 (coalesce)，超过 SCHEDULER_MISFIRE_GRACE_SECONDS 仍未开始的触发被跳过，等待下一次。
+    收到 SIGTERM / SIGINT 时等待当前任务结束后退出。
+    """
+    # 延迟导入，单次运行的同步任务不依赖 APScheduler
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from apscheduler.executors.pool import ThreadPoolExecutor as JobExecutor
+    from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+
+    client = XiaoeClient()
+    scheduler = BlockingScheduler(
+        executors={'default': JobExecutor(max_workers=1)},
+        job_defaults={'max_instances': 1, 'coalesce': True,
+                      'misfire_grace_time': settings.SCHEDULER_MISFIRE_GRACE_SECONDS},
+        timezone=timezone.utc,
+    )
+    fetch_options = {'client': client, 'fetch_mode': fetch_mode, 'concurrency': concurrency}
+    first_run = datetime.now(timezone.utc) # 启动后立即各执行一次
+    scheduler.add_job(run_incremental_sync, 'interval', minutes=settings.ORDERS_SYNC_INTERVAL_MINUTES,
+                      kwargs=fetch_options, id='incremental', name='xiaoe incremental sync', next_run_time=first_run)
+    scheduler.add_job(run_status_update_sync, 'interval', hours=settings.STATUS_UPDATE_INTERVAL_HOURS,
+                      kwargs={**fetch_options, 'status_mode': status_mode}, id='status_update',
+                      name='xiaoe status update sync', next_run_time=first_run)
+
+    def on_job_skipped(event):
+        if event.code == EVENT_JOB_MISSED:
+            logger.warning(f"Scheduled run of {event.job_id} at {event.scheduled_run_time} started too late "
+                           f"(misfire grace {settings.SCHEDULER_MISFIRE_GRACE_SECONDS}s) and was skipped.")
+        else:
+            logger.warning(f"Job {event.job_id} is still running or queued; skipped the overlapping run at {event.scheduled_run_times[-1]}.")
+
+    scheduler.add_listener(on_job_skipped, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+    scheduler.add_listener(lambda event: export_metrics(), EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+    def stop(signum, frame):
+        logger.info(f"Received signal {signum}, waiting for the running job to finish before exiting...")
+        scheduler.shutdown(wait=True)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"Scheduler started: incremental every {settings.ORDERS_SYNC_INTERVAL_MINUTES} min, "
+                f"status update every {settings.STATUS_UPDATE_INTERVAL_HOURS} h.")
+    try:
+        scheduler.start()
+    finally:
+        client.close()
+        logger.info("Scheduler stopped.")
 
 # --- 主程序入口 ---
 
@@ -341,34 +1342,214 @@ def main():
         "--sync-type", 
         type=str, 
         required=True, 
-        choices=['incremental', 'status_update', 'all', 'users', 'products'], # 添加更多类型
-        help="Type of synchronization to perform: 'incremental' for new orders, 'status_update' for recent order statuses, 'all' for both order tasks, 'users', 'products'."
+        choices=['incremental', 'status_update', 'all', 'users', 'products', 'backfill', 'daemon'], # 添加更多类型
+        help="Type of synchronization to perform: 'incremental' for new orders, 'status_update' for recent order statuses, 'all' for both order tasks, 'users', 'products', 'backfill' for historical orders between --start-date and --end-date, 'daemon' to keep running and schedule incremental and status updates from the interval settings."
+    )
+    parser.add_argument(
+        "--fetch-mode",
+        type=str,
+        default='serial',
+        choices=['serial', 'stream', 'async', 'parallel', 'sharded'],
+        help="How order pages are fetched: 'serial' one page at a time, 'stream' one page at a time parsed incrementally, 'async' with several requests in flight, 'parallel' fan-out on a thread pool using the list total, 'sharded' split the time range into sub-windows fetched in parallel (no 500-page cap)."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help=f"Max in-flight page requests for concurrent fetch modes (default: {settings.XIAOE_FETCH_CONCURRENCY})."
+    )
+    parser.add_argument(
+        "--status-mode",
+        type=str,
+        default=None,
+        choices=['rescan', 'changes', 'pending'],
+        help=f"How status_update finds orders to refresh: 'rescan' the last STATUS_UPDATE_DAYS days, only 'changes' since the last successful run, or only 'pending' (non-final) orders already in the database (default: {settings.STATUS_UPDATE_MODE}). "
+             "Without XIAOE_AFTER_SALES_UPDATE_TIME_PARAMS, 'changes' finds after-sales by creation time and looks back XIAOE_AFTER_SALES_LOOKBACK_HOURS extra hours; "
+             "refunds completed later than that after the after-sales record was opened are only caught by 'rescan' or 'pending'."
+    )
+    parser.add_argument(
+        "--cassette-mode",
+        type=str,
+        default=None,
+        choices=['record', 'replay'],
+        help="Record Xiaoe API traffic to a cassette file, or replay it offline instead of calling the API (overrides XIAOE_CASSETTE_MODE)."
+    )
+    parser.add_argument(
+        "--cassette",
+        type=str,
+        default=None,
+        help=f"Cassette file path (default: {settings.XIAOE_CASSETTE_FILE})."
+    )
+    parser.add_argument(
+        "--replay-latency-scale",
+        type=float,
+        default=None,
+        help="Replay each response after its recorded latency times this factor; 0 replays without delay (overrides XIAOE_CASSETTE_LATENCY_SCALE)."
+    )
+    parser.add_argument(
+        "--start-date",
+        type=str,
+        default=None,
+        help="Backfill start, 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' in UTC (required for --sync-type backfill)."
+    )
+    parser.add_argument(
+        "--end-date",
+        type=str,
+        default=None,
+        help="Backfill end (inclusive), 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' in UTC (default: now)."
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        default=None,
+        help="Write stage timings and counters in Prometheus text format to this file when the run ends (overrides METRICS_FILE)."
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve metrics at http://METRICS_HTTP_HOST:<port>/metrics while running (overrides METRICS_HTTP_PORT)."
+    )
+    parser.add_argument(
+        "--tenant",
+        type=str,
+        action='append',
+        default=None,
+        help="Only sync this tenant from XIAOE_TENANTS_FILE (repeatable; default: all tenants)."
     )
-    # 可以添加其他参数，例如 --start-date, --end-date 用于手动指定范围
 
     args = parser.parse_args()
+    if args.sync_type == 'backfill' and not args.start_date:
+        parser.error("--start-date is required for --sync-type backfill")
+
+    try:
+        tenants = load_tenants()
+    except (OSError, ValueError) as e:
+        parser.error(f"Cannot load tenants: {e}")
+    if args.tenant:
+        unknown = sorted(set(args.tenant) - {tenant.name for tenant in tenants})
+        if unknown:
+            parser.error(f"Unknown tenant(s): {', '.join(unknown)}")
+        tenants = [tenant for tenant in tenants if tenant.name in args.tenant]
+    if len(tenants) > 1 and args.sync_type == 'daemon':
+        parser.error("--sync-type daemon runs a single tenant; start one daemon per tenant with --tenant <name>")
+    if len(tenants) > 1 and (args.cassette_mode or settings.XIAOE_CASSETTE_MODE):
+        parser.error("Cassette record/replay supports a single tenant; select one with --tenant <name>")
+
+    apply_cli_overrides(args)
+    if settings.METRICS_HTTP_PORT:
+        metrics.start_http_server(settings.METRICS_HTTP_PORT, settings.METRICS_HTTP_HOST)
 
     logger.info(f"Starting sync process with type: {args.sync_type}")
+    started = time.perf_counter()
+
+    failed: List[str] = []
+    if len(tenants) == 1:
+        activate_tenant(tenants[0])
+        try:
+            if not run_sync(args):
+                failed.append(tenants[0].name)
+        finally:
+            export_metrics()
+    else:
+        # 每个店铺一个进程：settings 中的当前租户、数据库连接池、HTTP 连接池和 token 都是进程内的，互不干扰
+        max_workers = min(len(tenants), settings.XIAOE_TENANT_CONCURRENCY)
+        logger.info(f"Syncing {len(tenants)} tenants with {max_workers} worker processes: {', '.join(t.name for t in tenants)}")
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(run_tenant_sync, tenant, args): tenant for tenant in tenants}
+            for future in as_completed(futures):
+                tenant = futures[future]
+                try:
+                    ok, tenant_metrics = future.result()
+                    metrics.REGISTRY.merge(tenant_metrics)
+                except Exception as e: # 工作进程异常退出
+                    logger.error(f"Tenant {tenant.name} worker process failed: {e}", exc_info=True)
+                    ok = False
+                if not ok:
+                    failed.append(tenant.name)
+        export_metrics()
+
+    logger.info(f"Sync process finished for type: {args.sync_type} in {time.perf_counter() - started:.2f}s")
+    if failed:
+        logger.error(f"Sync failed for tenants: {', '.join(sorted(failed))}")
+        sys.exit(1)
+
+def apply_cli_overrides(args: argparse.Namespace):
+    """命令行参数覆盖录制/回放配置，本进程内创建的所有 XiaoeClient 都会使用。"""
+    if args.cassette_mode:
+        settings.XIAOE_CASSETTE_MODE = args.cassette_mode
+    if args.cassette:
+        settings.XIAOE_CASSETTE_FILE = args.cassette
+    if args.replay_latency_scale is not None:
+        settings.XIAOE_CASSETTE_LATENCY_SCALE = args.replay_latency_scale
+    if settings.XIAOE_CASSETTE_MODE and args.fetch_mode == 'async':
+        logger.warning("Cassette record/replay does not cover --fetch-mode async; the async client calls the live API.")
+    if args.metrics_file:
+        settings.METRICS_FILE = args.metrics_file
+    if args.metrics_port is not None:
+        settings.METRICS_HTTP_PORT = args.metrics_port
+
+def export_metrics():
+    """把本进程的指标写入 METRICS_FILE (未配置时跳过)；写入失败只记录日志，不影响同步结果。"""
+    if not settings.METRICS_FILE:
+        return
+    try:
+        metrics.write_textfile(settings.METRICS_FILE)
+    except OSError as e:
+        logger.error(f"Failed to write metrics to {settings.METRICS_FILE}: {e}")
+
+def run_sync(args: argparse.Namespace) -> bool:
+    """按命令行参数为当前租户执行同步任务；任一任务记录为 failed 时返回 False (被锁跳过的任务不算失败)。"""
+    fetch_options = {'fetch_mode': args.fetch_mode, 'concurrency': args.concurrency}
+    results: List[Optional[str]] = []
 
     if args.sync_type == 'incremental':
-        run_incremental_sync()
+        results.append(run_incremental_sync(**fetch_options))
     elif args.sync_type == 'status_update':
-        run_status_update_sync()
+        results.append(run_status_update_sync(**fetch_options, status_mode=args.status_mode))
     elif args.sync_type == 'all':
         logger.info("Running both incremental and status update sync...")
-        run_incremental_sync() # 先增量
-        run_status_update_sync() # 再状态更新
+        # 两个任务共享同一个 client，复用连接池和 access token
+        with XiaoeClient() as client:
+            if (args.status_mode or settings.STATUS_UPDATE_MODE) == 'rescan':
+                # 增量窗口落在 rescan 窗口之内：一次拉取同时交给两个任务
+                results.append(run_combined_order_sync(client, **fetch_options))
+            else:
+                results.append(run_incremental_sync(client, **fetch_options)) # 先增量
+                results.append(run_status_update_sync(client, **fetch_options, status_mode=args.status_mode)) # 再状态更新
     elif args.sync_type == 'users':
-        logger.warning("User sync not implemented yet.")
-        # run_user_sync()
+        results.append(run_user_sync())
     elif args.sync_type == 'products':
-        logger.warning("Product sync not implemented yet.")
-        # run_product_sync()
+        results.append(run_product_sync())
+    elif args.sync_type == 'daemon':
+        run_daemon(**fetch_options, status_mode=args.status_mode)
+    elif args.sync_type == 'backfill':
+        end_dt = parse_date_arg(args.end_date, end_of_day=True) if args.end_date else datetime.now(timezone.utc)
+        results.append(run_backfill_sync(parse_date_arg(args.start_date), end_dt, concurrency=args.concurrency))
     else:
         logger.error(f"Unknown sync type: {args.sync_type}")
         sys.exit(1)
+    return "failed" not in results
+
+def run_tenant_sync(tenant: Tenant, args: argparse.Namespace) -> Tuple[bool, metrics.Snapshot]:
+    """
+    多店铺模式下在工作进程中为一个租户执行同步，返回 (是否正常结束, 本租户的指标快照)，指标由父进程汇总导出。
 
-    logger.info(f"Sync process finished for type: {args.sync_type}")
+    工作进程可能以 spawn 方式启动 (Windows)，不会继承父进程中修改过的 settings 和日志配置，因此在这里重新设置。
+    """
+    setup_logging(tenant.name)
+    apply_cli_overrides(args)
+    activate_tenant(tenant)
+    metrics.REGISTRY.reset() # 工作进程会被复用于下一个租户，也可能 fork 自父进程，只返回本租户的数据
+    started = time.perf_counter()
+    try:
+        ok = run_sync(args)
+    except Exception as e:
+        logger.error(f"Sync for tenant {tenant.name} failed: {e}", exc_info=True)
+        return False, metrics.REGISTRY.snapshot()
+    logger.info(f"Tenant {tenant.name} finished in {time.perf_counter() - started:.2f}s")
+    return ok, metrics.REGISTRY.snapshot()
 
 if __name__ == "__main__":
     # 可以在这里添加表创建逻辑 (可选, 最好独立)
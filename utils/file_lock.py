@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+
+from utils.logger import logger
+
+try:
+    import fcntl # POSIX
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+class FileLock:
+    """
+    基于操作系统文件锁的跨进程互斥锁 (POSIX 使用 flock，Windows 使用 msvcrt.locking)。
+
+    持锁进程退出 (包括被 kill) 时操作系统会自动释放锁，不会留下死锁文件。
+    同一实例内部另有一把线程锁，因此也可在同一进程的多个线程间共享。
+    可以作为上下文管理器使用，也可以显式调用 acquire()/release()。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+        self._thread_lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到获得锁。"""
+        self._thread_lock.acquire()
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        except Exception:
+            self._thread_lock.release()
+            raise
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError: # LK_LOCK 重试约 10 秒后仍失败会抛出异常，继续等待
+                        time.sleep(0.1)
+        except Exception:
+            os.close(fd)
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+        logger.debug(f"Acquired file lock {self.path}.")
+
+    def release(self):
+        """释放锁。"""
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+            self._thread_lock.release()
+            logger.debug(f"Released file lock {self.path}.")
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
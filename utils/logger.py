@@ -1,6 +1,7 @@
 import logging
 import sys
 import os
+from typing import Optional
 from logging.handlers import RotatingFileHandler
 
 # 只获取 logger 实例，配置将在 setup_logging 中完成
@@ -11,11 +12,21 @@ log_formatter = logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-def setup_logging():
-    """配置日志记录器。"""
+def setup_logging(tenant: Optional[str] = None):
+    """
+    配置日志记录器。
+
+    Args:
+        tenant: 多店铺并发同步时的租户名，给出时加在每条日志前，便于区分各店铺进程交错写入的日志；
+            文件日志写入该租户单独的文件 (app.<tenant>.log)，避免多个进程同时轮转同一个文件造成日志丢失或错乱。
+    """
     # 在函数内部导入 settings，避免循环导入
     from config.config import settings
 
+    formatter = log_formatter
+    if tenant:
+        formatter = logging.Formatter(f'%(asctime)s - [{tenant}] - %(name)s - %(levelname)s - %(message)s')
+
     # 清理已存在的 handlers，防止重复添加 (尤其是在交互式环境或多次调用时)
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
@@ -25,24 +36,28 @@ def setup_logging():
 
     # --- 控制台 Handler ---
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(log_formatter)
+    console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
 
     # --- 文件 Handler (Rotating) ---
     # 确保日志目录存在
+    log_file = settings.LOG_FILE_APP
+    if tenant:
+        root, ext = os.path.splitext(log_file)
+        log_file = f"{root}.{tenant}{ext}"
     try:
         os.makedirs(settings.LOG_DIR, exist_ok=True)
         file_handler = RotatingFileHandler(
-            settings.LOG_FILE_APP,
+            log_file,
             maxBytes=5*1024*1024, # 5 MB
             backupCount=5,
             encoding='utf-8'
         )
-        file_handler.setFormatter(log_formatter)
+        file_handler.setFormatter(formatter)
         logger.addHandler(file_handler)
-        log_file_path = settings.LOG_FILE_APP
+        log_file_path = log_file
     except Exception as e:
-        logger.error(f"Failed to create or add file handler for {settings.LOG_FILE_APP}: {e}", exc_info=True)
+        logger.error(f"Failed to create or add file handler for {log_file}: {e}", exc_info=True)
         log_file_path = "None"
 
 
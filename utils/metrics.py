@@ -0,0 +1,305 @@
+# utils/metrics.py
+"""
+进程内的计数器和直方图，导出为 Prometheus 文本格式 (text exposition format 0.0.4)。
+
+各模块在导入时用 counter() / histogram() 声明指标，运行中调用 inc() / observe() 记录。
+所有指标自动带 tenant 标签 (当前租户 settings.XIAOE_TENANT)，多店铺工作进程的快照可以直接合并到父进程。
+导出方式：write_textfile() 写入文件 (可配合 node_exporter 的 textfile collector)，
+或 start_http_server() 在本地端口提供 /metrics。
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config.config import settings
+from utils.logger import logger
+
+# 覆盖从几毫秒的数据库批次到几十秒的慢接口
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, ...]
+Snapshot = Dict[str, Dict[LabelKey, Any]] # 指标名 -> {标签值: 计数器的值 或 直方图的 (各桶计数, 总和, 次数)}
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = ('tenant',) + tuple(labelnames)
+        self._values: Dict[LabelKey, Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelKey:
+        return (settings.XIAOE_TENANT or '',) + tuple(str(labels[name]) for name in self.labelnames[1:])
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self) -> Dict[LabelKey, Any]:
+        raise NotImplementedError
+
+    def merge(self, values: Dict[LabelKey, Any]):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """只增不减的计数器。"""
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def snapshot(self) -> Dict[LabelKey, Any]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values: Dict[LabelKey, Any]):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self.snapshot().items())]
+
+class Histogram(_Metric):
+    """按固定桶统计观测值的分布 (如耗时)，同时记录总和与次数。"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            counts, total, count = self._values.get(key) or ((0,) * (len(self.buckets) + 1), 0.0, 0)
+            counts = counts[:index] + (counts[index] + 1,) + counts[index + 1:]
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """统计 with 块的耗时 (秒)，块内抛出异常时同样记录。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict[LabelKey, Any]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values: Dict[LabelKey, Any]):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                old_counts, old_total, old_count = self._values.get(key) or ((0,) * len(counts), 0.0, 0)
+                self._values[key] = (tuple(a + b for a, b in zip(old_counts, counts)), old_total + total, old_count + count)
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    """指标注册表：同名指标只创建一次，各模块重复声明时拿到同一个对象。"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls) or metric.labelnames[1:] != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels.")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self) -> Snapshot:
+        """当前所有指标的值 (可 pickle，用于从工作进程传回父进程)。"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def reset(self):
+        """清空所有指标的值 (指标声明保留)。"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def merge(self, snapshot: Snapshot):
+        """把另一个进程的快照累加到本注册表 (只合并本进程也声明过的指标)。"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        for name, values in snapshot.items():
+            metric = metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式输出所有指标。"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _matching(self, snapshot: Snapshot, name: str, labels: Dict[str, Any]) -> Iterator[Tuple[_Metric, Any]]:
+        metric = self._metrics.get(name)
+        if metric is None:
+            return
+        positions = {metric.labelnames.index(label): str(value) for label, value in labels.items()}
+        for key, value in (snapshot.get(name) or {}).items():
+            if all(key[i] == wanted for i, wanted in positions.items()):
+                yield metric, value
+
+    def total(self, snapshot: Snapshot, name: str, **labels) -> float:
+        """快照中 name 指标在匹配 labels 的所有序列上的合计 (直方图为观测次数)。"""
+        total = 0
+        for metric, value in self._matching(snapshot, name, labels):
+            total += value[2] if isinstance(metric, Histogram) else value
+        return total
+
+    def quantile(self, snapshot: Snapshot, name: str, q: float, **labels) -> Optional[float]:
+        """
+        按桶估算快照中直方图 name 的 q 分位数 (与 PromQL histogram_quantile 相同，在桶内线性插值)。
+        没有观测值时返回 None；落在最后一个桶 (+Inf) 时返回最大的有限桶边界。
+        """
+        merged: Optional[List[int]] = None
+        buckets: Tuple[float, ...] = ()
+        for metric, (counts, _, _) in self._matching(snapshot, name, labels):
+            buckets = metric.buckets
+            merged = list(counts) if merged is None else [a + b for a, b in zip(merged, counts)]
+        if not merged or not sum(merged):
+            return None
+        rank = q * sum(merged)
+        cumulative = 0
+        for i, count in enumerate(merged):
+            if cumulative + count >= rank and count:
+                if i == len(buckets):
+                    return buckets[-1]
+                lower = buckets[i - 1] if i > 0 else 0.0
+                return lower + (buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return buckets[-1]
+
+def delta(after: Snapshot, before: Snapshot) -> Snapshot:
+    """两个快照之差 (after - before)，用于统计一次运行期间的增量。"""
+    result: Snapshot = {}
+    for name, values in after.items():
+        old_values = before.get(name) or {}
+        changed = {}
+        for key, value in values.items():
+            old = old_values.get(key)
+            if old is None:
+                changed[key] = value
+            elif isinstance(value, tuple):
+                changed[key] = (tuple(a - b for a, b in zip(value[0], old[0])), value[1] - old[1], value[2] - old[2])
+            else:
+                changed[key] = value - old
+        result[name] = changed
+    return result
+
+REGISTRY = MetricsRegistry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    """在全局注册表中声明 (或获取) 一个计数器。"""
+    return REGISTRY.counter(name, documentation, labelnames)
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """在全局注册表中声明 (或获取) 一个直方图。"""
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
+
+def write_textfile(path: str, registry: Optional[MetricsRegistry] = None):
+    """把指标原子地写入 path (先写临时文件再替换)，读取方不会看到写了一半的文件。"""
+    registry = registry or REGISTRY
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+    logger.info(f"Metrics written to {path}.")
+
+def start_http_server(port: int, host: str = '127.0.0.1', registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """在后台线程中启动 HTTP 服务，GET /metrics 返回当前指标。返回的 server 可调用 shutdown() 停止。"""
+    registry = registry or REGISTRY
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"Metrics request from {self.address_string()}: {format % args}")
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from utils import metrics
+from utils.logger import logger
+
+THROTTLE_EVENTS = metrics.counter('rate_limiter_throttle_events_total',
+                                  'Times a rate limiter backed off after throttling, 5xx or network errors.', ('limiter',))
+
+class AdaptiveRateLimiter:
+    """
+    自适应令牌桶限流器 (AIMD)。
+
+    - 令牌按 rate (次/秒) 匀速生成，桶容量为 burst。
+    - 请求成功时缓慢加速：每次成功 rate += increase_step / rate，即稳定状态下每秒约提高 increase_step。
+    - 遇到限流或服务端错误时乘性降速：rate *= decrease_factor。
+
+    内部只用一把 threading.Lock 做记账，等待发生在锁外，
+    因此同一个实例可以同时被多个线程 (acquire) 和协程 (acquire_async) 共享。
+    """
+
+    def __init__(self, name: str, rate: float, max_rate: Optional[float] = None, min_rate: float = 0.5,
+                 burst: Optional[float] = None, increase_step: float = 0.5, decrease_factor: float = 0.5):
+        self.name = name
+        self.rate = float(rate)
+        self.max_rate = float(max_rate) if max_rate else self.rate
+        self.min_rate = min(float(min_rate), self.rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预定一个令牌，返回调用方需要等待的秒数 (令牌不足时允许透支，后来者排队等待更久)。"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """阻塞当前线程直到获得令牌。"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """在协程中等待令牌，等待期间让出事件循环。"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        """请求成功：加性提高速率，不超过 max_rate。"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.increase_step / self.rate)
+
+    def on_throttle(self):
+        """被限流或服务端出错：乘性降低速率，并清空已积累的突发令牌。"""
+        with self._lock:
+            old_rate = self.rate
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self._tokens = min(self._tokens, 0.0)
+        THROTTLE_EVENTS.inc(limiter=self.name)
+        logger.warning(f"Rate limiter '{self.name}' backing off: {old_rate:.2f} -> {self.rate:.2f} req/s.")
+
+# 进程内共享的限流器注册表，同一个 key 的所有客户端、线程和协程共用一个令牌桶
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(key: str, rate: float, **kwargs) -> AdaptiveRateLimiter:
+    """获取 (或首次创建) 指定 key 的共享限流器。"""
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(key, rate, **kwargs)
+            _limiters[key] = limiter
+            logger.debug(f"Rate limiter '{key}' created at {rate} req/s.")
+        return limiter
+
+def parse_rate_limits(spec: Optional[str]) -> Dict[str, float]:
+    """解析 'orders=10,users=20' 形式的按端点限流配置。"""
+    limits = {}
+    if not spec:
+        return limits
+    for part in spec.split(','):
+        if '=' not in part:
+            continue
+        name, value = part.split('=', 1)
+        try:
+            limits[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid rate limit entry: {part}")
+    return limits
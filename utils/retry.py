@@ -1,11 +1,137 @@
+import asyncio
+import random
+import threading
 import time
 import functools
+from typing import Optional
 
 # 导入配置和我们配置好的 logger
 from config.config import settings
+from utils import metrics
 from utils.logger import logger
 
-def retry(max_tries=None, delay=None, backoff=2, exceptions=(Exception,)):
+RETRIES = metrics.counter('retries_total', 'Retries scheduled by the retry decorators.', ('function',))
+RETRY_GIVEUPS = metrics.counter('retry_giveups_total', 'Calls that failed without another retry (max_tries or budget).',
+                                ('function', 'reason'))
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝 (不访问下游)。"""
+    pass
+
+class RetryBudget:
+    """
+    重试预算：限制重试请求占全部请求的比例，避免下游故障时重试流量放大。
+
+    每次首次调用存入 ratio 个令牌，每次重试取出 1 个；另外按 min_per_second 匀速补充，
+    保证低流量时也能重试。余额上限为 max_balance。线程与协程间可共享。
+    """
+
+    def __init__(self, ratio: Optional[float] = None, min_per_second: Optional[float] = None, max_balance: float = 10.0):
+        self.ratio = settings.API_RETRY_BUDGET_RATIO if ratio is None else ratio
+        self.min_per_second = settings.API_RETRY_BUDGET_MIN_PER_SECOND if min_per_second is None else min_per_second
+        self.max_balance = max_balance
+        self._balance = max_balance
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._balance = min(self.max_balance, self._balance + (now - self._updated_at) * self.min_per_second)
+        self._updated_at = now
+
+    def deposit(self):
+        """记录一次首次调用。"""
+        with self._lock:
+            self._refill()
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """申请一次重试，预算不足时返回 False。"""
+        with self._lock:
+            self._refill()
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后打开，reset_timeout 秒内的调用直接抛出 CircuitOpenError；
+    超时后进入半开状态，只放行一个探测调用 (其他并发调用方仍抛出 CircuitOpenError)，探测成功则关闭，失败则重新打开。
+    探测调用以重试之外的异常结束时由 release_probe 交还名额；超过 reset_timeout 仍未结束的探测视为丢失，允许新的探测。
+    线程与协程间可共享。
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = settings.API_CIRCUIT_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self.reset_timeout = settings.API_CIRCUIT_RESET_SECONDS if reset_timeout is None else reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """调用前检查，熔断器打开、或半开状态下已有探测调用在进行时抛出 CircuitOpenError。"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - now
+                if remaining > 0:
+                    raise CircuitOpenError(f"Circuit {self.name} is open, failing fast (retry in {remaining:.0f}s).")
+                self.state = self.HALF_OPEN
+                logger.info(f"Circuit {self.name} half-open, letting one trial request through.")
+            elif self._probe_in_flight and now - self._probe_started_at < self.reset_timeout:
+                raise CircuitOpenError(f"Circuit {self.name} is half-open and a trial request is in flight, failing fast.")
+            self._probe_in_flight = True
+            self._probe_started_at = now
+
+    def release_probe(self):
+        """调用以熔断器不计入的异常结束 (如鉴权错误、取消) 时调用：交还半开状态下的探测名额。"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed after a successful request.")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                logger.error(f"Circuit {self.name} opened after {self._failures} consecutive failures; "
+                             f"failing fast for {self.reset_timeout}s.")
+
+def _resolve(target, args):
+    """budget/breaker 可以是对象，也可以是被装饰方法所属实例 (args[0]) 上的属性名。"""
+    if isinstance(target, str):
+        return getattr(args[0], target, None) if args else None
+    return target
+
+def _backoff_delay(delay, backoff, attempt, max_delay, jitter):
+    """第 attempt 次重试前的等待秒数：指数退避，封顶 max_delay；jitter 时在 [d/2, d] 内随机，错开并发调用方的重试时刻。"""
+    base = delay * (backoff ** (attempt - 1))
+    if max_delay is not None:
+        base = min(base, max_delay)
+    if jitter:
+        return base / 2 + random.uniform(0, base / 2)
+    return base
+
+def retry(max_tries=None, delay=None, backoff=2, exceptions=(Exception,), max_delay=None, jitter=True,
+          budget=None, breaker=None):
     """
     重试装饰器，从配置文件获取默认值。
 
@@ -14,6 +140,10 @@ def retry(max_tries=None, delay=None, backoff=2, exceptions=(Exception,)):
         delay: 初始延迟时间（秒）(默认从 settings 读取)。
         backoff: 延迟倍数。
         exceptions: 需要重试的异常类型元组。
+        max_delay: 单次等待上限（秒）(默认从 settings 读取)。
+        jitter: 是否对等待时间加随机抖动。
+        budget: RetryBudget，或实例上的属性名 (如 'retry_budget')；预算不足时不再重试。
+        breaker: CircuitBreaker，或实例上的属性名；每次失败计入熔断器，熔断打开时直接抛出 CircuitOpenError。
 
     Returns:
         装饰器函数
@@ -23,36 +153,109 @@ def retry(max_tries=None, delay=None, backoff=2, exceptions=(Exception,)):
         max_tries = settings.API_RETRY_TIMES
     if delay is None:
         delay = settings.API_RETRY_DELAY_SECONDS
+    if max_delay is None:
+        max_delay = settings.API_RETRY_MAX_DELAY_SECONDS
 
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            mtries, mdelay = max_tries, delay
-            while mtries > 0:
+            retry_budget, circuit = _resolve(budget, args), _resolve(breaker, args)
+            if retry_budget is not None:
+                retry_budget.deposit()
+            attempt = 0
+            while True:
+                if circuit is not None:
+                    circuit.before_call()
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
                 except exceptions as e:
-                    mtries -= 1
-                    if mtries == 0:
+                    if circuit is not None:
+                        circuit.record_failure()
+                    attempt += 1
+                    if attempt >= max_tries:
+                        RETRY_GIVEUPS.inc(function=func.__name__, reason='max_tries')
                         logger.error(
                             f"Function {func.__name__} reached max retries ({max_tries}) with error: {e}",
                             exc_info=True # 记录堆栈信息
                         )
                         raise
-
+                    if retry_budget is not None and not retry_budget.try_withdraw():
+                        RETRY_GIVEUPS.inc(function=func.__name__, reason='budget')
+                        logger.error(f"Function {func.__name__} failed with {type(e).__name__} and the retry budget is exhausted, not retrying. Error: {e}")
+                        raise
+                    wait = _backoff_delay(delay, backoff, attempt, max_delay, jitter)
+                    RETRIES.inc(function=func.__name__)
                     logger.warning(
-                        f"Function {func.__name__} failed with {type(e).__name__}, retrying in {mdelay}s... ({mtries} retries left). Error: {e}"
+                        f"Function {func.__name__} failed with {type(e).__name__}, retrying in {wait:.1f}s... ({max_tries - attempt} retries left). Error: {e}"
                     )
-                    time.sleep(mdelay)
-                    mdelay *= backoff
-            # 根据 Pylint 的建议，如果循环结束还没返回或抛出异常，这里理论上不应到达，但为了明确，可以抛出异常。
-            # 或者，如果原始函数在循环外也可能执行，保持原样 (虽然逻辑上应该在循环内返回或 raise)
-            # return func(*args, **kwargs) # 保留原逻辑，以防万一
-            # 更安全的做法是明确抛出错误，表示重试用尽
-            logger.critical(f"Function {func.__name__} failed after exhausting all retries.")
-            raise RuntimeError(f"Function {func.__name__} failed after exhausting all retries.")
+                    time.sleep(wait)
+                    continue
+                except BaseException:
+                    if circuit is not None:
+                        circuit.release_probe()
+                    raise
+                if circuit is not None:
+                    circuit.record_success()
+                return result
 
         return wrapper
     return decorator
 
-# 移除旧的 __main__ 示例 
\ No newline at end of file
+def async_retry(max_tries=None, delay=None, backoff=2, exceptions=(Exception,), max_delay=None, jitter=True,
+                budget=None, breaker=None):
+    """
+    协程版本的重试装饰器，等待期间通过 asyncio.sleep 让出事件循环。
+
+    参数含义与 retry 相同。
+    """
+    if max_tries is None:
+        max_tries = settings.API_RETRY_TIMES
+    if delay is None:
+        delay = settings.API_RETRY_DELAY_SECONDS
+    if max_delay is None:
+        max_delay = settings.API_RETRY_MAX_DELAY_SECONDS
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            retry_budget, circuit = _resolve(budget, args), _resolve(breaker, args)
+            if retry_budget is not None:
+                retry_budget.deposit()
+            attempt = 0
+            while True:
+                if circuit is not None:
+                    circuit.before_call()
+                try:
+                    result = await func(*args, **kwargs)
+                except exceptions as e:
+                    if circuit is not None:
+                        circuit.record_failure()
+                    attempt += 1
+                    if attempt >= max_tries:
+                        RETRY_GIVEUPS.inc(function=func.__name__, reason='max_tries')
+                        logger.error(
+                            f"Coroutine {func.__name__} reached max retries ({max_tries}) with error: {e}",
+                            exc_info=True
+                        )
+                        raise
+                    if retry_budget is not None and not retry_budget.try_withdraw():
+                        RETRY_GIVEUPS.inc(function=func.__name__, reason='budget')
+                        logger.error(f"Coroutine {func.__name__} failed with {type(e).__name__} and the retry budget is exhausted, not retrying. Error: {e}")
+                        raise
+                    wait = _backoff_delay(delay, backoff, attempt, max_delay, jitter)
+                    RETRIES.inc(function=func.__name__)
+                    logger.warning(
+                        f"Coroutine {func.__name__} failed with {type(e).__name__}, retrying in {wait:.1f}s... ({max_tries - attempt} retries left). Error: {e}"
+                    )
+                    await asyncio.sleep(wait)
+                    continue
+                except BaseException:
+                    if circuit is not None:
+                        circuit.release_probe()
+                    raise
+                if circuit is not None:
+                    circuit.record_success()
+                return result
+
+        return wrapper
+    return decorator